@@ -0,0 +1,166 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Back-translate a binarized monolingual corpus with a trained model and write
+the hypotheses directly into binarized (mmap) parallel shards.
+"""
+
+import datetime
+import os
+
+import torch
+
+from fairseq import checkpoint_utils, options, progress_bar, tasks, utils
+from fairseq.data import data_utils, indexed_dataset
+from fairseq.meters import StopwatchMeter, TimeMeter
+
+
+def shard_dest_prefix(args, lang):
+    # shard k > 0 is written as <split>k, which matches the naming that
+    # ``load_langpair_dataset(..., combine=True)`` expects
+    split = args.bt_split + (str(args.shard_id) if args.shard_id > 0 else '')
+    return os.path.join(
+        args.bt_destdir,
+        '{}.{}-{}.{}'.format(split, args.source_lang, args.target_lang, lang),
+    )
+
+
+def main(args):
+    assert args.path is not None, '--path required for back-translation!'
+    assert args.bt_input is not None, '--bt-input required for back-translation!'
+    assert not args.sampling or args.nbest == args.beam, \
+        '--sampling requires --nbest to be equal to --beam'
+
+    utils.import_user_module(args)
+
+    if args.max_tokens is None and args.max_sentences is None:
+        args.max_tokens = 12000
+    print(args)
+
+    use_cuda = torch.cuda.is_available() and not args.cpu
+    torch.manual_seed(args.seed + args.shard_id)
+
+    # Setup task and load the monolingual data to translate
+    task = tasks.setup_task(args)
+    src_dict = task.source_dictionary
+    tgt_dict = task.target_dictionary
+
+    src_dataset = data_utils.load_indexed_dataset(args.bt_input, src_dict, args.dataset_impl)
+    if src_dataset is None:
+        raise FileNotFoundError('Dataset not found: {}'.format(args.bt_input))
+    print('| {} {} examples'.format(args.bt_input, len(src_dataset)))
+
+    # Load ensemble
+    print('| loading model(s) from {}'.format(args.path))
+    models, _model_args = checkpoint_utils.load_model_ensemble(
+        args.path.split(':'),
+        arg_overrides=eval(args.model_overrides),
+        task=task,
+    )
+
+    # Optimize ensemble for generation
+    for model in models:
+        model.make_generation_fast_(
+            beamable_mm_beam_size=None if args.no_beamable_mm else args.beam,
+        )
+        if args.fp16:
+            model.half()
+        if use_cuda:
+            model.cuda()
+
+    itr = task.get_batch_iterator(
+        dataset=task.build_dataset_for_inference(src_dataset, src_dataset.sizes),
+        max_tokens=args.max_tokens,
+        max_sentences=args.max_sentences,
+        max_positions=utils.resolve_max_positions(
+            task.max_positions(),
+            *[model.max_positions() for model in models]
+        ),
+        ignore_invalid_inputs=args.skip_invalid_size_inputs_valid_test,
+        required_batch_size_multiple=args.required_batch_size_multiple,
+        num_shards=args.num_shards,
+        shard_id=args.shard_id,
+        num_workers=args.num_workers,
+    ).next_epoch_itr(shuffle=False)
+
+    generator = task.build_generator(args)
+
+    # Hypotheses and their (copied) sources are written in the same order, so
+    # the two datasets of a shard are aligned line by line.
+    os.makedirs(args.bt_destdir, exist_ok=True)
+    hypo_prefix = shard_dest_prefix(args, args.target_lang)
+    src_prefix = shard_dest_prefix(args, args.source_lang)
+    hypo_ds = indexed_dataset.make_builder(
+        indexed_dataset.data_file_path(hypo_prefix), impl='mmap', vocab_size=len(tgt_dict),
+    )
+    src_ds = indexed_dataset.make_builder(
+        indexed_dataset.data_file_path(src_prefix), impl='mmap', vocab_size=len(src_dict),
+    )
+
+    gen_timer = StopwatchMeter()
+    num_sentences = 0
+    num_batches = len(itr)
+    with progress_bar.build_progress_bar(args, itr) as t:
+        wps_meter = TimeMeter()
+        for i, sample in enumerate(t):
+            sample = utils.move_to_cuda(sample) if use_cuda else sample
+            if 'net_input' not in sample:
+                continue
+
+            gen_timer.start()
+            hypos = task.inference_step(generator, models, sample)
+            num_generated_tokens = sum(len(h[0]['tokens']) for h in hypos)
+            gen_timer.stop(num_generated_tokens)
+
+            for j, sample_id in enumerate(sample['id'].tolist()):
+                for hypo in hypos[j][:args.nbest]:
+                    hypo_ds.add_item(hypo['tokens'].int().cpu())
+                    src_ds.add_item(src_dataset[sample_id])
+
+            num_sentences += sample['nsentences']
+            wps_meter.update(num_generated_tokens)
+            eta = wps_meter.elapsed_time * (num_batches - i - 1) / (i + 1)
+            t.log({
+                'wps': round(wps_meter.avg),
+                'sps': round(num_sentences / wps_meter.elapsed_time),
+                'eta': str(datetime.timedelta(seconds=int(eta))),
+            })
+
+    hypo_ds.finalize(indexed_dataset.index_file_path(hypo_prefix))
+    src_ds.finalize(indexed_dataset.index_file_path(src_prefix))
+
+    # a shard may have no batches (e.g., with more shards than batches)
+    gen_time = max(gen_timer.sum, 1e-8)
+    print('| Back-translated {} sentences ({} tokens) in {:.1f}s ({:.2f} sentences/s, {:.2f} tokens/s)'.format(
+        num_sentences, gen_timer.n, gen_timer.sum, num_sentences / gen_time, gen_timer.n / gen_time))
+    print('| Wrote shard {} of {} to {}'.format(args.shard_id, args.num_shards, args.bt_destdir))
+
+
+def worker_main(i, args):
+    # worker i of this host takes shard (shard_id * bt_workers + i) out of
+    # (num_shards * bt_workers), so that several hosts can still be combined
+    args.shard_id = args.shard_id * args.bt_workers + i
+    args.num_shards = args.num_shards * args.bt_workers
+    if torch.cuda.is_available() and not args.cpu:
+        torch.cuda.set_device(i % torch.cuda.device_count())
+    main(args)
+
+
+def cli_main():
+    parser = options.get_backtranslation_parser()
+    args = options.parse_args_and_arch(parser)
+    if args.bt_workers > 1:
+        torch.multiprocessing.spawn(
+            fn=worker_main,
+            args=(args, ),
+            nprocs=args.bt_workers,
+        )
+    else:
+        main(args)
+
+
+if __name__ == '__main__':
+    cli_main()
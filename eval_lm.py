@@ -8,11 +8,13 @@
 Evaluate the perplexity of a trained language model.
 """
 
+import math
+
 import numpy as np
 import torch
 
 from fairseq import checkpoint_utils, options, progress_bar, tasks, utils
-from fairseq.data import LMContextWindowDataset
+from fairseq.data import iterators, LMContextWindowDataset
 from fairseq.meters import StopwatchMeter, TimeMeter
 from fairseq.sequence_scorer import SequenceScorer
 
@@ -43,8 +45,21 @@ class WordStat(object):
                                                self.next_word_prob, self.count - self.missing_next_words)
 
 
+def stream_batches(num_blocks, num_streams, offset=0):
+    """Split the blocks ``offset .. offset + num_blocks - 1`` into
+    *num_streams* contiguous streams. Row i of every batch continues stream i,
+    and streams that run out of blocks are dropped from the end of the batch."""
+    stream_len = int(math.ceil(num_blocks / num_streams))
+    return [
+        [offset + i * stream_len + t for i in range(num_streams) if i * stream_len + t < num_blocks]
+        for t in range(stream_len)
+    ]
+
+
 def main(parsed_args):
     assert parsed_args.path is not None, '--path required for evaluation!'
+    assert not parsed_args.quantize or (parsed_args.cpu and not parsed_args.fp16), \
+        '--quantize requires --cpu and is not compatible with --fp16'
 
     utils.import_user_module(parsed_args)
 
@@ -76,7 +91,7 @@ def main(parsed_args):
     # Load dataset splits
     task.load_dataset(args.gen_subset)
     dataset = task.dataset(args.gen_subset)
-    if args.context_window > 0:
+    if args.context_window > 0 and not args.stateful_eval:
         dataset = LMContextWindowDataset(
             dataset=dataset,
             tokens_per_sample=args.tokens_per_sample,
@@ -86,8 +101,12 @@ def main(parsed_args):
     print('| {} {} {} examples'.format(args.data, args.gen_subset, len(dataset)))
 
     # Optimize ensemble for generation and set the source and dest dicts on the model (required by scorer)
-    for model in models:
-        model.make_generation_fast_()
+    for model, path in zip(models, parsed_args.path.split(':')):
+        model.make_generation_fast_(
+            char_embed_cache=path + '.char_embed' if args.cache_char_embeddings else None,
+        )
+        if args.quantize:
+            model.quantize_()
         if args.fp16:
             model.half()
         if use_cuda:
@@ -97,24 +116,42 @@ def main(parsed_args):
 
     print('num. model params: {}'.format(sum(p.numel() for p in models[0].parameters())))
 
-    itr = task.get_batch_iterator(
-        dataset=dataset,
-        max_tokens=args.max_tokens or 36000,
-        max_sentences=args.max_sentences,
-        max_positions=utils.resolve_max_positions(*[
-            model.max_positions() for model in models
-        ]),
-        ignore_invalid_inputs=True,
-        num_shards=args.num_shards,
-        shard_id=args.shard_id,
-        num_workers=args.num_workers,
-    ).next_epoch_itr(shuffle=False)
+    if args.stateful_eval:
+        assert all(hasattr(model.decoder, 'forward_stream') for model in models), \
+            '--stateful-eval requires models whose decoder implements forward_stream (e.g., transformer_lm)'
+        # each shard gets a contiguous range of blocks, which is split into
+        # as many streams as fit in a batch
+        num_streams = args.max_sentences or max(1, (args.max_tokens or 36000) // args.tokens_per_sample)
+        start = len(dataset) * args.shard_id // args.num_shards
+        end = len(dataset) * (args.shard_id + 1) // args.num_shards
+        itr = iterators.EpochBatchIterator(
+            dataset=dataset,
+            collate_fn=dataset.collater,
+            batch_sampler=stream_batches(end - start, num_streams, offset=start),
+            num_workers=args.num_workers,
+        ).next_epoch_itr(shuffle=False)
+        incremental_states = {model: {} for model in models}
+    else:
+        itr = task.get_batch_iterator(
+            dataset=dataset,
+            max_tokens=args.max_tokens or 36000,
+            max_sentences=args.max_sentences,
+            max_positions=utils.resolve_max_positions(*[
+                model.max_positions() for model in models
+            ]),
+            ignore_invalid_inputs=True,
+            num_shards=args.num_shards,
+            shard_id=args.shard_id,
+            num_workers=args.num_workers,
+        ).next_epoch_itr(shuffle=False)
+        incremental_states = None
 
     gen_timer = StopwatchMeter()
     scorer = SequenceScorer(task.target_dictionary, args.softmax_batch)
 
     score_sum = 0.
     count = 0
+    input_tokens = 0
 
     if args.remove_bpe is not None:
         if args.remove_bpe == 'sentencepiece':
@@ -143,8 +180,11 @@ def main(parsed_args):
             sample = utils.move_to_cuda(sample) if use_cuda else sample
 
             gen_timer.start()
-            hypos = scorer.generate(models, sample)
+            hypos = scorer.generate(
+                models, sample, incremental_states=incremental_states, max_context=args.context_window,
+            )
             gen_timer.stop(sample['ntokens'])
+            input_tokens += sample['net_input']['src_tokens'].ne(task.source_dictionary.pad()).sum().item()
 
             for i, hypos_i in enumerate(hypos):
                 hypo = hypos_i[0]
@@ -210,6 +250,8 @@ def main(parsed_args):
 
     avg_nll_loss = -score_sum / count
     print('| Evaluated {} tokens in {:.1f}s ({:.2f} tokens/s)'.format(gen_timer.n, gen_timer.sum, 1. / gen_timer.avg))
+    print('| Encoded {} input tokens ({:.2f} per evaluated token, {} mode)'.format(
+        input_tokens, input_tokens / max(gen_timer.n, 1), 'stateful' if args.stateful_eval else 'context window'))
     print('| Loss: {:.4f}, Perplexity: {:.2f}'.format(avg_nll_loss, np.exp(avg_nll_loss)))
 
     if args.output_word_stats:
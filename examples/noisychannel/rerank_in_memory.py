@@ -0,0 +1,364 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Noisy channel reranking without intermediate files: the n-best list is
+generated, scored with the channel model(s) and the language model, and
+reranked in memory. Accepts the same arguments as rerank.py.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+import rerank_tune
+import rerank_utils
+from examples.noisychannel import rerank_options
+from fairseq import bleu, checkpoint_utils, options, tasks, utils
+from fairseq.data import (
+    Dictionary,
+    encoders,
+    LanguagePairDataset,
+    MonolingualDataset,
+    TokenBlockDataset,
+)
+from fairseq.sequence_scorer import SequenceScorer
+from fairseq.tasks.language_modeling import LanguageModelingTask
+from fairseq.tasks.translation import TranslationTask
+
+
+class NbestList(object):
+    """An n-best list and the scores of its hypotheses.
+
+    Sentences with fewer than *nbest* hypotheses are padded; scores are kept
+    as ``(num_sents, nbest)`` arrays and padded entries are masked out.
+    """
+
+    def __init__(self, ids, sources, targets, hypos, gen_scores, nbest):
+        self.ids = ids
+        self.sources = sources  # source sentences with bpe
+        self.targets = targets  # references without bpe
+        self.hypos = hypos  # lists of hypotheses with bpe
+        self.nbest = nbest
+
+        num_sents = len(ids)
+        self.mask = np.zeros((num_sents, nbest), dtype=bool)
+        for i, hypos_i in enumerate(hypos):
+            self.mask[i, :len(hypos_i)] = True
+
+        self.src_len = np.array([len(s.split()) for s in sources], dtype=np.float64)[:, None]
+        self.tgt_len = self.to_array([len(h.split()) for hypos_i in hypos for h in hypos_i], fill=1)
+        self.gen_scores = self.to_array(gen_scores)
+        self.bitext1 = None
+        self.bitext2 = None
+        self.lm = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def to_array(self, flat, fill=0.):
+        """Scatter one value per hypothesis into a ``(num_sents, nbest)`` array."""
+        res = np.full(self.mask.shape, fill, dtype=np.float64)
+        res[self.mask] = flat
+        return res
+
+    def pairs(self):
+        """Yields ``(source, hypo)`` for every hypothesis, in the flat order used by :func:`to_array`."""
+        for source, hypos_i in zip(self.sources, self.hypos):
+            for hypo in hypos_i:
+                yield source, hypo
+
+    def no_bpe_hypos(self, bpe_symbol):
+        return [[rerank_utils.remove_bpe(h, bpe_symbol).rstrip('\n') for h in hypos_i] for hypos_i in self.hypos]
+
+    def features(self, normalize=False, bitext1_backwards=False, bitext2_backwards=False):
+        """Scores of model 1, model 2 and the LM as a ``(num_sents, nbest, 3)``
+        array, normalized as in :func:`rerank_utils.get_score`."""
+        bitext1 = self.bitext1
+        bitext2 = self.bitext2 if self.bitext2 is not None else np.zeros(self.mask.shape)
+        lm = self.lm if self.lm is not None else np.zeros(self.mask.shape)
+        if normalize:
+            bitext1 = bitext1 / (self.src_len if bitext1_backwards else self.tgt_len)
+            if self.bitext2 is not None:
+                bitext2 = bitext2 / (self.src_len if bitext2_backwards else self.tgt_len)
+            lm = lm / self.src_len
+        return np.stack([bitext1, bitext2, lm], axis=2)
+
+    def combined_scores(self, a, b, c, lenpen, target_len, normalize=False,
+                        bitext1_backwards=False, bitext2_backwards=False):
+        """Vectorized version of :func:`rerank_utils.get_score` over the whole n-best list."""
+        score = np.dot(self.features(normalize, bitext1_backwards, bitext2_backwards), [a, b, c])
+        if lenpen is not None:
+            score = score / target_len ** float(lenpen)
+        return np.where(self.mask, score, -np.inf)
+
+
+def generation_args(args):
+    """Arguments for generating the n-best list, as rerank_generate.py would pass them to generate.py."""
+    params = [
+        args.data,
+        '--path', args.gen_model,
+        '--shard-id', str(args.shard_id),
+        '--num-shards', str(args.num_shards),
+        '--nbest', str(args.num_rescore),
+        '--beam', str(args.num_rescore),
+        '--max-sentences', str(args.batch_size),
+        '--gen-subset', args.gen_subset,
+        '--source-lang', args.source_lang,
+        '--target-lang', args.target_lang,
+    ]
+    if args.sampling:
+        params += ['--sampling']
+    if args.cpu:
+        params += ['--cpu']
+    if args.fp16:
+        params += ['--fp16']
+    return options.parse_args_and_arch(options.get_generation_parser(), params)
+
+
+def prepare_models(models, args, use_cuda):
+    for model in models:
+        model.make_generation_fast_()
+        if args.fp16:
+            model.half()
+        if use_cuda:
+            model.cuda()
+    return models
+
+
+def generate_nbest(args, use_cuda):
+    gen_args = generation_args(args)
+    task = tasks.setup_task(gen_args)
+    task.load_dataset(gen_args.gen_subset)
+    src_dict, tgt_dict = task.source_dictionary, task.target_dictionary
+
+    models, _model_args = checkpoint_utils.load_model_ensemble(gen_args.path.split(':'), task=task)
+    prepare_models(models, gen_args, use_cuda)
+
+    itr = task.get_batch_iterator(
+        dataset=task.dataset(gen_args.gen_subset),
+        max_sentences=gen_args.max_sentences,
+        max_positions=utils.resolve_max_positions(
+            task.max_positions(),
+            *[model.max_positions() for model in models]
+        ),
+        ignore_invalid_inputs=gen_args.skip_invalid_size_inputs_valid_test,
+        num_shards=gen_args.num_shards,
+        shard_id=gen_args.shard_id,
+        num_workers=gen_args.num_workers,
+    ).next_epoch_itr(shuffle=False)
+    generator = task.build_generator(gen_args)
+
+    results = {}
+    for sample in itr:
+        sample = utils.move_to_cuda(sample) if use_cuda else sample
+        if 'net_input' not in sample:
+            continue
+        hypos = task.inference_step(generator, models, sample)
+        for i, sample_id in enumerate(sample['id'].tolist()):
+            src_tokens = utils.strip_pad(sample['net_input']['src_tokens'][i, :], tgt_dict.pad())
+            target_tokens = utils.strip_pad(sample['target'][i, :], tgt_dict.pad())
+            results[sample_id] = (
+                src_dict.string(src_tokens),
+                tgt_dict.string(target_tokens, args.remove_bpe, escape_unk=True),
+                [tgt_dict.string(hypo['tokens'].int().cpu()) for hypo in hypos[i][:args.num_rescore]],
+                [hypo['positional_scores'].sum().item() for hypo in hypos[i][:args.num_rescore]],
+            )
+
+    ids = sorted(results.keys())
+    sources, targets, hypos, scores = zip(*[results[sample_id] for sample_id in ids])
+    return NbestList(
+        ids, list(sources), list(targets), list(hypos),
+        [s for scores_i in scores for s in scores_i], args.num_rescore,
+    )
+
+
+def score_dataset(task, models, dataset, args, use_cuda, skip_first=False):
+    """Sum of the target log-probabilities of every item in *dataset*."""
+    scorer = SequenceScorer(task.target_dictionary)
+    itr = task.get_batch_iterator(
+        dataset=dataset,
+        max_tokens=getattr(args, 'max_tokens', None),
+        max_sentences=args.batch_size,
+        max_positions=utils.resolve_max_positions(*[model.max_positions() for model in models]),
+    ).next_epoch_itr(shuffle=False)
+
+    scores = np.zeros(len(dataset), dtype=np.float64)
+    for sample in itr:
+        sample = utils.move_to_cuda(sample) if use_cuda else sample
+        hypos = scorer.generate(models, sample)
+        for i, sample_id in enumerate(sample['id'].tolist()):
+            pos_scores = hypos[i][0]['positional_scores']
+            if skip_first:
+                pos_scores = pos_scores[1:]
+            scores[sample_id] = pos_scores.sum().item()
+    return scores
+
+
+def score_bitext(args, nbest, path, backwards, right_to_left, rescore_bpe, use_cuda):
+    """Scores the n-best list with a translation model (ensemble), in
+    the direction given by *backwards*."""
+    dict_dir = args.score_dict_dir
+    if backwards and args.backwards_score_dict_dir is not None:
+        dict_dir = args.backwards_score_dict_dir
+    src_lang, tgt_lang = (args.target_lang, args.source_lang) if backwards else (args.source_lang, args.target_lang)
+    src_dict = TranslationTask.load_dictionary('{}/dict.{}.txt'.format(dict_dir, src_lang))
+    tgt_dict = TranslationTask.load_dictionary('{}/dict.{}.txt'.format(dict_dir, tgt_lang))
+    task = TranslationTask(args, src_dict, tgt_dict)
+
+    models, _model_args = checkpoint_utils.load_model_ensemble(path.split(':'), task=task)
+    prepare_models(models, args, use_cuda)
+
+    def prepare(text):
+        if rescore_bpe is not None:
+            text = rescore_bpe.encode(rerank_utils.remove_bpe(text, args.remove_bpe).rstrip('\n'))
+        if right_to_left:
+            text = rerank_utils.make_right_to_left(text)
+        return text
+
+    srcs, tgts = [], []
+    for source, hypo in nbest.pairs():
+        if backwards:
+            source, hypo = hypo, source
+        srcs.append(src_dict.encode_line(prepare(source), add_if_not_exist=False).long())
+        tgts.append(tgt_dict.encode_line(prepare(hypo), add_if_not_exist=False).long())
+
+    dataset = LanguagePairDataset(
+        srcs, np.array([len(s) for s in srcs]), src_dict,
+        tgts, np.array([len(t) for t in tgts]), tgt_dict,
+        left_pad_source=options.eval_bool(args.left_pad_source),
+        left_pad_target=options.eval_bool(args.left_pad_target),
+        shuffle=False,
+    )
+    return nbest.to_array(score_dataset(task, models, dataset, args, use_cuda))
+
+
+def score_lm(args, nbest, use_cuda):
+    """Scores the n-best list with the target language model (P(T))."""
+    lm_dict = Dictionary.load(args.lm_dict)
+    task = LanguageModelingTask(args, lm_dict)
+    models, lm_args = checkpoint_utils.load_model_ensemble(args.language_model.split(':'), task=task)
+    prepare_models(models, args, use_cuda)
+
+    lm_bpe = None
+    if args.lm_bpe_code is not None and args.lm_bpe_code != 'shared':
+        lm_bpe = encoders.build_bpe(
+            argparse.Namespace(bpe='subword_nmt', bpe_codes=args.lm_bpe_code, bpe_separator='@@'),
+        )
+
+    tokens = []
+    for _source, hypo in nbest.pairs():
+        if args.lm_bpe_code != 'shared':
+            hypo = rerank_utils.remove_bpe(hypo, args.remove_bpe).rstrip('\n')
+            if lm_bpe is not None:
+                hypo = lm_bpe.encode(hypo)
+        tokens.append(lm_dict.encode_line(hypo, add_if_not_exist=False).long())
+    sizes = np.array([len(t) for t in tokens])
+
+    add_bos_token = getattr(lm_args, 'add_bos_token', False)
+    dataset = MonolingualDataset(
+        TokenBlockDataset(
+            tokens, sizes, block_size=None, pad=lm_dict.pad(), eos=lm_dict.eos(),
+            break_mode='eos', include_targets=True,
+        ),
+        sizes, lm_dict, lm_dict, add_eos_for_other_targets=False, shuffle=False,
+        targets=['future'], add_bos_token=add_bos_token,
+    )
+    return nbest.to_array(score_dataset(task, models, dataset, args, use_cuda, skip_first=add_bos_token))
+
+
+def corpus_bleu(targets, hypos):
+    dictionary = Dictionary()
+    scorer = bleu.Scorer(dictionary.pad(), dictionary.eos(), dictionary.unk())
+    for ref, hypo in zip(targets, hypos):
+        scorer.add(dictionary.encode_line(ref), dictionary.encode_line(hypo))
+    return scorer
+
+
+def rerank(args):
+    """Same interface as :func:`rerank.rerank`, but without intermediate files."""
+    for name in ['lenpen', 'weight1', 'weight2', 'weight3']:
+        if type(getattr(args, name)) is not list:
+            setattr(args, name, [getattr(args, name)])
+    if args.score_dict_dir is None:
+        args.score_dict_dir = args.data
+    assert args.nbest_list is None, 'use rerank.py to rerank a predefined n-best list'
+    assert args.prefix_len is None and args.target_prefix_frac is None and args.source_prefix_frac is None, \
+        'use rerank.py for prefix rescoring'
+    assert args.lm_bpe_code is None or args.lm_bpe_code == 'shared' or args.remove_bpe is not None
+    assert not (args.right_to_left1 and args.backwards1), 'backwards right to left not supported'
+    assert not (args.right_to_left2 and args.backwards2), 'backwards right to left not supported'
+
+    use_cuda = torch.cuda.is_available() and not args.cpu
+
+    start_time = time.time()
+    nbest = generate_nbest(args, use_cuda)
+    print('| generated {} hypotheses for {} sentences in {:.1f}s'.format(
+        int(nbest.mask.sum()), len(nbest), time.time() - start_time))
+
+    rescore_bpe = None
+    if args.diff_bpe:
+        rescore_bpe = encoders.build_bpe(
+            argparse.Namespace(bpe='subword_nmt', bpe_codes=args.rescore_bpe_code, bpe_separator='@@'),
+        )
+
+    stage_time = time.time()
+    if args.gen_model == args.score_model1 and not args.backwards1 and not args.right_to_left1 and not args.diff_bpe:
+        nbest.bitext1 = nbest.gen_scores
+    else:
+        nbest.bitext1 = score_bitext(
+            args, nbest, args.score_model1, args.backwards1, args.right_to_left1, rescore_bpe, use_cuda,
+        )
+    if args.score_model2 is not None:
+        if args.gen_model == args.score_model2 and not args.backwards2 and not args.right_to_left2 \
+                and not args.diff_bpe:
+            nbest.bitext2 = nbest.gen_scores
+        else:
+            nbest.bitext2 = score_bitext(
+                args, nbest, args.score_model2, args.backwards2, args.right_to_left2, rescore_bpe, use_cuda,
+            )
+    elif args.diff_bpe:
+        nbest.bitext2 = nbest.gen_scores
+    print('| scored with the translation models in {:.1f}s'.format(time.time() - stage_time))
+
+    if args.language_model is not None:
+        stage_time = time.time()
+        nbest.lm = score_lm(args, nbest, use_cuda)
+        print('| scored with the language model in {:.1f}s'.format(time.time() - stage_time))
+
+    stage_time = time.time()
+    no_bpe_hypos = nbest.no_bpe_hypos(args.remove_bpe)
+    features = rerank_tune.NbestFeatures.from_nbest_list(
+        nbest, no_bpe_hypos, normalize=args.normalize,
+        bitext1_backwards=args.backwards1, bitext2_backwards=args.backwards2,
+    )
+    best_lenpen, best_weight1, best_weight2, best_weight3, best_score = rerank_tune.vectorized_search(args, features)
+    print('| reranked with {} weight setting(s) in {:.1f}s'.format(len(args.lenpen), time.time() - stage_time))
+
+    best = features.best(np.array([[best_lenpen, best_weight1, best_weight2, best_weight3]]))[0]
+    best_hypos = [hypos_i[j] for hypos_i, j in zip(no_bpe_hypos, best)]
+    print(corpus_bleu(nbest.targets, best_hypos).result_string(4))
+    if args.write_hypos is not None:
+        with open(args.write_hypos + '_targets' + args.gen_subset, 'w') as t, \
+                open(args.write_hypos + '_hypos' + args.gen_subset, 'w') as h:
+            for target, hypo in zip(nbest.targets, best_hypos):
+                t.write(target + '\n')
+                h.write(hypo + '\n')
+
+    print('| reranked {} sentences in {:.1f}s'.format(len(nbest), time.time() - start_time))
+    return best_lenpen, best_weight1, best_weight2, best_weight3, best_score
+
+
+def cli_main():
+    parser = rerank_options.get_reranking_parser()
+    args = options.parse_args_and_arch(parser)
+    rerank(args)
+
+
+if __name__ == '__main__':
+    cli_main()
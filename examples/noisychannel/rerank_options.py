@@ -123,4 +123,6 @@ def add_tuning_args(parser):
                        help='number of trials to do for random search')
     group.add_argument('--share-weights', action='store_true',
                        help='share weight2 and weight 3')
+    group.add_argument('--tune-workers', default=None, type=int,
+                       help='number of processes scoring the weight settings (default: all CPU cores)')
     return group
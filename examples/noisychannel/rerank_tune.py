@@ -1,9 +1,178 @@
 import rerank
+import rerank_generate
+import rerank_score_bw
+import rerank_score_lm
+import rerank_utils
 import argparse
 import numpy as np
+import os
 import random
+from multiprocessing import Pool
 from examples.noisychannel import rerank_options
-from fairseq import options
+from fairseq import bleu, options
+from fairseq.data import dictionary
+
+# max number of (weights, hypothesis) scores computed at once by a worker
+SCORE_CHUNK_SIZE = 2 ** 24
+
+
+class NbestFeatures(object):
+    """All n-best scores of the tuning set, loaded once into dense arrays.
+
+    *features* has shape ``(num_sents, nbest, 3)`` and holds the (possibly
+    normalized) scores of model 1, model 2 and the LM; *stats* holds the
+    BLEU statistics of every hypothesis, so that corpus BLEU for a choice of
+    hypotheses is a sum over sentences.
+    """
+
+    def __init__(self, features, target_len, mask, stats):
+        self.features = features
+        self.target_len = target_len
+        self.mask = mask
+        self.stats = stats
+
+    @classmethod
+    def from_score_files(cls, args):
+        gen_output_lst, bitext1_lst, bitext2_lst, lm_res_lst = rerank.load_score_files(args)
+        dict = dictionary.Dictionary()
+
+        sents = []
+        for gen_output, bitext1, bitext2, lm_res in zip(gen_output_lst, bitext1_lst, bitext2_lst, lm_res_lst):
+            # group the hypotheses by source sentence, as rerank.score_target_hypo does
+            groups, group = [], []
+            for i in range(len(bitext1.rescore_source.keys())):
+                group.append(i)
+                if len(group) == gen_output.num_hypos[i] or len(group) == args.num_rescore:
+                    groups.append(group)
+                    group = []
+            gen_keys = list(sorted(gen_output.no_bpe_target.keys()))
+            assert len(groups) == len(gen_keys)
+
+            for key, group in zip(gen_keys, groups):
+                ref_tok = dict.encode_line(gen_output.no_bpe_target[key])
+                sent = []
+                for i in group:
+                    src_len = bitext1.source_lengths[i]
+                    tgt_len = bitext1.target_lengths[i]
+                    scores = [
+                        bitext1.rescore_score[i],
+                        bitext2.rescore_score[i] if bitext2 is not None else 0.,
+                        lm_res.score[i] if lm_res is not None else 0.,
+                    ]
+                    if args.normalize:
+                        scores[0] /= src_len if bitext1.backwards else tgt_len
+                        if bitext2 is not None:
+                            scores[1] /= src_len if bitext2.backwards else tgt_len
+                        scores[2] /= src_len
+
+                    hypo = bitext1.rescore_hypo[i]
+                    if args.prefix_len is not None:
+                        hypo = rerank_utils.get_full_from_prefix(hypo, gen_output.no_bpe_hypo[key])
+                    stats = bleu.sentence_stats(
+                        ref_tok, dict.encode_line(hypo), dict.pad(), dict.eos(), dict.unk())
+
+                    # length is measured in terms of words, not bpe tokens
+                    sent.append((scores, len(bitext1.rescore_hypo[i].split()), stats))
+                sents.append(sent)
+
+        nbest = max(len(sent) for sent in sents)
+        features = np.zeros((len(sents), nbest, 3))
+        target_len = np.ones((len(sents), nbest))
+        mask = np.zeros((len(sents), nbest), dtype=bool)
+        stats = np.zeros((len(sents), nbest, bleu.NUM_STATS))
+        for i, sent in enumerate(sents):
+            for j, (scores_j, target_len_j, stats_j) in enumerate(sent):
+                features[i, j] = scores_j
+                target_len[i, j] = target_len_j
+                mask[i, j] = True
+                stats[i, j] = stats_j
+        return cls(features, target_len, mask, stats)
+
+    @classmethod
+    def from_nbest_list(cls, nbest, hypos, normalize=False, bitext1_backwards=False, bitext2_backwards=False):
+        """Builds the features of an in-memory n-best list (see
+        :class:`rerank_in_memory.NbestList`) from its score arrays; *hypos*
+        are its hypotheses without bpe."""
+        dict = dictionary.Dictionary()
+        stats = np.zeros(nbest.mask.shape + (bleu.NUM_STATS, ))
+        for i, (target, hypos_i) in enumerate(zip(nbest.targets, hypos)):
+            ref_tok = dict.encode_line(target)
+            for j, hypo in enumerate(hypos_i):
+                stats[i, j] = bleu.sentence_stats(
+                    ref_tok, dict.encode_line(hypo), dict.pad(), dict.eos(), dict.unk())
+
+        # length is measured in terms of words, not bpe tokens
+        target_len = nbest.to_array([len(h.split()) for hypos_i in hypos for h in hypos_i], fill=1)
+        features = nbest.features(normalize, bitext1_backwards, bitext2_backwards)
+        return cls(features, target_len, nbest.mask, stats)
+
+    def best(self, params):
+        """Index of the best hypothesis of every sentence for each row of
+        *params* (lenpen, weight1, weight2, weight3), of shape
+        ``(len(params), num_sents)``."""
+        scores = np.einsum('kf,snf->ksn', params[:, 1:], self.features)
+        with np.errstate(divide='ignore'):
+            scores /= self.target_len[None, :, :] ** params[:, 0, None, None]
+        scores[:, ~self.mask] = -np.inf
+        return scores.argmax(axis=2)
+
+    def corpus_stats(self, params):
+        """Picks the best hypothesis of every sentence for each row of
+        *params* and returns the summed BLEU statistics, of shape
+        ``(len(params), num_stats)``."""
+        best = self.best(params)
+        return self.stats[np.arange(self.stats.shape[0])[None, :], best].sum(axis=1)
+
+
+_worker_nbest = None
+
+
+def _init_worker(nbest):
+    global _worker_nbest
+    _worker_nbest = nbest
+
+
+def _score_params(params):
+    return bleu.bleu_from_stats(_worker_nbest.corpus_stats(params))
+
+
+def vectorized_search(args, nbest=None):
+    """Scores every weight setting in args.lenpen/weight1/weight2/weight3 on
+    the n-best scores loaded once (from the score files of :mod:`rerank`
+    unless the :class:`NbestFeatures` *nbest* are given), in batches spread
+    over a process pool. Returns the same tuple as :func:`rerank.rerank`."""
+    if nbest is None:
+        for shard_id in (range(args.num_shards) if args.all_shards else [args.shard_id]):
+            # make sure the score files exist
+            shard_args = argparse.Namespace(**vars(args))
+            shard_args.shard_id = shard_id
+            rerank_generate.gen_and_reprocess_nbest(shard_args)
+            rerank_score_bw.score_bw(shard_args)
+            rerank_score_lm.score_lm(shard_args)
+
+        nbest = NbestFeatures.from_score_files(args)
+    params = np.array([args.lenpen, args.weight1, args.weight2, args.weight3], dtype=np.float64).T
+
+    chunk_size = max(1, SCORE_CHUNK_SIZE // nbest.mask.size)
+    chunks = [params[i:i + chunk_size] for i in range(0, len(params), chunk_size)]
+    num_workers = min(getattr(args, 'tune_workers', None) or os.cpu_count() or 1, len(chunks))
+    if num_workers > 1:
+        print("launching pool")
+        with Pool(num_workers, initializer=_init_worker, initargs=(nbest, )) as p:
+            rerank_scores = np.concatenate(p.map(_score_params, chunks))
+    else:
+        _init_worker(nbest)
+        rerank_scores = np.concatenate([_score_params(chunk) for chunk in chunks])
+
+    best_index = int(np.argmax(rerank_scores))
+    best_score = rerank_scores[best_index]
+    print("best score", best_score)
+    print("best lenpen", args.lenpen[best_index])
+    print("best weight1", args.weight1[best_index])
+    print("best weight2", args.weight2[best_index])
+    print("best weight3", args.weight3[best_index])
+    return args.lenpen[best_index], args.weight1[best_index], \
+        args.weight2[best_index], args.weight3[best_index], best_score
 
 
 def random_search(args):
@@ -51,7 +220,7 @@ def random_search(args):
         rerank_args['weight3'] = list(random_params[:, k])
 
     rerank_args = argparse.Namespace(**rerank_args)
-    best_lenpen, best_weight1, best_weight2, best_weight3, best_score = rerank.rerank(rerank_args)
+    best_lenpen, best_weight1, best_weight2, best_weight3, best_score = vectorized_search(rerank_args)
     rerank_args = vars(args).copy()
     rerank_args['lenpen'] = [best_lenpen]
     rerank_args['weight1'] = [best_weight1]
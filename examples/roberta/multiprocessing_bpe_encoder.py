@@ -12,7 +12,7 @@ import sys
 from collections import Counter
 from multiprocessing import Pool
 
-from fairseq.data.encoders.gpt2_bpe import get_encoder
+from fairseq.data.encoders.gpt2_bpe import DEFAULT_CACHE_SIZE, get_encoder
 
 
 def main():
@@ -50,6 +50,12 @@ def main():
         action="store_true",
         help="keep empty lines",
     )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="max number of words in the per-worker BPE cache (<= 0 for unbounded)",
+    )
     parser.add_argument("--workers", type=int, default=20)
     args = parser.parse_args()
 
@@ -93,7 +99,9 @@ class MultiprocessingEncoder(object):
 
     def initializer(self):
         global bpe
-        bpe = get_encoder(self.args.encoder_json, self.args.vocab_bpe)
+        bpe = get_encoder(
+            self.args.encoder_json, self.args.vocab_bpe, cache_size=self.args.cache_size,
+        )
 
     def encode(self, line):
         global bpe
@@ -104,17 +112,18 @@ class MultiprocessingEncoder(object):
         global bpe
         return bpe.decode(tokens)
 
+    def encode_many(self, lines):
+        global bpe
+        return [list(map(str, ids)) for ids in bpe.encode_many(lines)]
+
     def encode_lines(self, lines):
         """
         Encode a set of lines. All lines will be encoded together.
         """
-        enc_lines = []
-        for line in lines:
-            line = line.strip()
-            if len(line) == 0 and not self.args.keep_empty:
-                return ["EMPTY", None]
-            tokens = self.encode(line)
-            enc_lines.append(" ".join(tokens))
+        lines = [line.strip() for line in lines]
+        if not self.args.keep_empty and any(len(line) == 0 for line in lines):
+            return ["EMPTY", None]
+        enc_lines = [" ".join(tokens) for tokens in self.encode_many(lines)]
         return ["PASS", enc_lines]
 
     def decode_lines(self, lines):
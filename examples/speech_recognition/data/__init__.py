@@ -3,8 +3,9 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-from .asr_dataset import AsrDataset
+from .asr_dataset import AsrDataset, MMapAsrDataset
 
 __all__ = [
     'AsrDataset',
+    'MMapAsrDataset',
 ]
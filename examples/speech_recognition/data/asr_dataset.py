@@ -5,7 +5,9 @@
 
 import os
 import numpy as np
+import torch
 from fairseq.data import FairseqDataset
+from fairseq.data.indexed_dataset import MMapIndexedDataset
 
 from . import data_utils
 from .collaters import Seq2SeqCollater
@@ -56,21 +58,26 @@ class AsrDataset(FairseqDataset):
         self.frame_length = frame_length
         self.frame_shift = frame_shift
 
-    def __getitem__(self, index):
+    def fbank(self, index):
+        """Compute the (unnormalized) fbank features of an utterance."""
         import torchaudio
         import torchaudio.compliance.kaldi as kaldi
-        tgt_item = self.tgt[index] if self.tgt is not None else None
 
         path = self.aud_paths[index]
         if not os.path.exists(path):
             raise FileNotFoundError("Audio file not found: {}".format(path))
         sound, sample_rate = torchaudio.load_wav(path)
-        output = kaldi.fbank(
+        return kaldi.fbank(
             sound,
             num_mel_bins=self.num_mel_bins,
             frame_length=self.frame_length,
             frame_shift=self.frame_shift
         )
+
+    def __getitem__(self, index):
+        tgt_item = self.tgt[index] if self.tgt is not None else None
+
+        output = self.fbank(index)
         output_cmvn = data_utils.apply_mv_norm(output)
         self.s2s_collater = Seq2SeqCollater(
             0, 1, pad_index=self.tgt_dict.pad(),
@@ -108,3 +115,67 @@ class AsrDataset(FairseqDataset):
         """Return an ordered list of indices. Batches will be constructed based
         on this order."""
         return np.arange(len(self))
+
+
+def fbank_stats_file_path(prefix_path):
+    return prefix_path + ".npz"
+
+
+class MMapAsrDataset(AsrDataset):
+    """
+    A dataset of speech and transcriptions whose fbank features were computed
+    (and mean-variance normalized) once by ``datasets/asr_prep_fbank.py`` and
+    stored as float16 matrices in a memory-mapped indexed dataset, along with
+    the per-utterance normalization statistics. Items are views of the mapped
+    memory, and collation is a single padded copy into a float tensor.
+
+    Args:
+        prefix_path (str): prefix of the feature store (e.g.
+            ``<data>/train.fbank``)
+        tgt (List[torch.LongTensor]): A list of LongTensors containing the indices
+            of target transcriptions.
+        tgt_dict (~fairseq.data.Dictionary): target vocabulary.
+        ids (List[str]): A list of utterance IDs, in the order of the store.
+        speakers (List[str]): A list of speakers corresponding to utterances.
+    """
+
+    def __init__(self, prefix_path, tgt, tgt_dict, ids, speakers):
+        self.features = MMapIndexedDataset(prefix_path)
+        stats = np.load(fbank_stats_file_path(prefix_path))
+        self.num_mel_bins = int(stats["num_mel_bins"])
+        self.frame_length = float(stats["frame_length"])
+        self.frame_shift = float(stats["frame_shift"])
+        self.mean = stats["mean"]
+        self.invstddev = stats["invstddev"]
+        assert stats["ids"].tolist() == list(ids), \
+            "{} does not match the utterances of the manifest".format(prefix_path)
+        self.frame_sizes = self.features.sizes // self.num_mel_bins
+
+        assert len(ids) > 0
+        assert len(ids) == len(tgt)
+        assert len(ids) == len(speakers)
+        self.aud_paths = None
+        self.tgt_dict = tgt_dict
+        self.tgt = tgt
+        self.ids = ids
+        self.speakers = speakers
+        self.s2s_collater = Seq2SeqCollater(
+            0, 1, pad_index=self.tgt_dict.pad(),
+            eos_index=self.tgt_dict.eos(), move_eos_to_beginning=True,
+            feature_dtype=torch.float,
+        )
+
+    def __getitem__(self, index):
+        tgt_item = self.tgt[index] if self.tgt is not None else None
+        features = self.features[index].view(-1, self.num_mel_bins)
+        return {"id": index, "data": [features, tgt_item]}
+
+    def __len__(self):
+        return len(self.features)
+
+    @staticmethod
+    def exists(prefix_path):
+        return (
+            MMapIndexedDataset.exists(prefix_path)
+            and os.path.exists(fbank_stats_file_path(prefix_path))
+        )
@@ -33,12 +33,14 @@ class Seq2SeqCollater(object):
         pad_index=1,
         eos_index=2,
         move_eos_to_beginning=True,
+        feature_dtype=None,
     ):
         self.feature_index = feature_index
         self.label_index = label_index
         self.pad_index = pad_index
         self.eos_index = eos_index
         self.move_eos_to_beginning = move_eos_to_beginning
+        self.feature_dtype = feature_dtype
 
     def _collate_frames(self, frames):
         """Convert a list of 2d frames into a padded 3d tensor
@@ -47,13 +49,15 @@ class Seq2SeqCollater(object):
                 length of i-th frame and f_dim is static dimension of features
         Returns:
             3d tensor of size len(frames)*len_max*f_dim where len_max is max of L[i]
+            (of type feature_dtype, if given, else of the type of the frames)
         """
         len_max = max(frame.size(0) for frame in frames)
         f_dim = frames[0].size(1)
-        res = frames[0].new(len(frames), len_max, f_dim).fill_(0.0)
+        dtype = self.feature_dtype if self.feature_dtype is not None else frames[0].dtype
+        res = frames[0].new_zeros(len(frames), len_max, f_dim, dtype=dtype)
 
         for i, v in enumerate(frames):
-            res[i, : v.size(0)] = v
+            res[i, : v.size(0)].copy_(v)
 
         return res
 
@@ -81,13 +85,14 @@ class Seq2SeqCollater(object):
             parsed_samples.append(parsed_sample)
         samples = parsed_samples
 
-        id = torch.LongTensor([s["id"] for s in samples])
-        frames = self._collate_frames([s["source"] for s in samples])
-        # sort samples by descending number of frames
+        # sort samples by descending number of frames, so that the frames are
+        # copied into the batch only once
         frames_lengths = torch.LongTensor([s["source"].size(0) for s in samples])
         frames_lengths, sort_order = frames_lengths.sort(descending=True)
-        id = id.index_select(0, sort_order)
-        frames = frames.index_select(0, sort_order)
+        samples = [samples[i] for i in sort_order.tolist()]
+
+        id = torch.LongTensor([s["id"] for s in samples])
+        frames = self._collate_frames([s["source"] for s in samples])
 
         target = None
         target_lengths = None
@@ -101,10 +106,9 @@ class Seq2SeqCollater(object):
                 left_pad=False,
                 move_eos_to_beginning=False,
             )
-            target = target.index_select(0, sort_order)
             target_lengths = torch.LongTensor(
                 [s["target"].size(0) for s in samples]
-            ).index_select(0, sort_order)
+            )
             prev_output_tokens = fairseq_data_utils.collate_tokens(
                 [s["target"] for s in samples],
                 self.pad_index,
@@ -112,7 +116,6 @@ class Seq2SeqCollater(object):
                 left_pad=False,
                 move_eos_to_beginning=self.move_eos_to_beginning,
             )
-            prev_output_tokens = prev_output_tokens.index_select(0, sort_order)
         else:
             ntokens = sum(len(s["source"]) for s in samples)
 
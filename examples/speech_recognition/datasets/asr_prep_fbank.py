@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Compute the mean-variance normalized fbank features of the utterances of a
+json manifest (see asr_prep_json.py) once, and store them as float16 in a
+memory-mapped indexed dataset <data>/<split>.fbank.{bin,idx}, with the
+per-utterance normalization statistics in <data>/<split>.fbank.npz. The
+speech_recognition task reads these instead of the audio files.
+
+Run from the fairseq root:
+
+    python -m examples.speech_recognition.datasets.asr_prep_fbank $DATA --splits train valid
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import multiprocessing
+import os
+
+import numpy as np
+from fairseq.data import Dictionary
+from fairseq.data.indexed_dataset import (
+    MMapIndexedDatasetBuilder,
+    data_file_path,
+    index_file_path,
+)
+
+from examples.speech_recognition.data.asr_dataset import fbank_stats_file_path
+from examples.speech_recognition.data.data_utils import calc_mean_invstddev
+from examples.speech_recognition.tasks.speech_recognition import get_asr_dataset_from_json
+
+
+_dataset = None
+
+
+def _init_worker(dataset):
+    global _dataset
+    _dataset = dataset
+
+
+def _featurize(index):
+    features = _dataset.fbank(index)
+    mean, invstddev = calc_mean_invstddev(features)
+    features = (features - mean) * invstddev
+    return features.half(), mean.numpy(), invstddev.numpy()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("data", help="directory with dict.txt and the <split>.json manifests")
+    parser.add_argument("--splits", nargs="+", default=["train", "valid"],
+                        help="splits to featurize")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="number of processes computing features")
+    args = parser.parse_args()
+
+    tgt_dict = Dictionary.load(os.path.join(args.data, "dict.txt"))
+
+    for split in args.splits:
+        dataset = get_asr_dataset_from_json(os.path.join(args.data, "{}.json".format(split)), tgt_dict)
+        prefix = os.path.join(args.data, "{}.fbank".format(split))
+        builder = MMapIndexedDatasetBuilder(data_file_path(prefix), dtype=np.float16)
+        mean, invstddev = [], []
+        with multiprocessing.Pool(args.workers, initializer=_init_worker, initargs=(dataset, )) as pool:
+            for features, utt_mean, utt_invstddev in pool.imap(_featurize, range(len(dataset)), chunksize=16):
+                builder.add_item(features)
+                mean.append(utt_mean)
+                invstddev.append(utt_invstddev)
+        builder.finalize(index_file_path(prefix))
+        np.savez(
+            fbank_stats_file_path(prefix),
+            ids=np.array(dataset.ids),
+            mean=np.stack(mean),
+            invstddev=np.stack(invstddev),
+            num_mel_bins=dataset.num_mel_bins,
+            frame_length=dataset.frame_length,
+            frame_shift=dataset.frame_shift,
+        )
+        print("| {}: stored the features of {} utterances in {}".format(split, len(dataset), prefix))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,14 +10,17 @@ import re
 import torch
 from fairseq.data import Dictionary
 from fairseq.tasks import FairseqTask, register_task
-from examples.speech_recognition.data import AsrDataset
+from examples.speech_recognition.data import AsrDataset, MMapAsrDataset
 
 
-def get_asr_dataset_from_json(data_json_path, tgt_dict):
+def get_asr_dataset_from_json(data_json_path, tgt_dict, fbank_prefix=None):
     """
     Parse data json and create dataset.
     See scripts/asr_prep_json.py which pack json from raw files
 
+    If *fbank_prefix* is given, the features are read from the store written
+    by datasets/asr_prep_fbank.py instead of being computed from the audio.
+
     Json example:
     {
     "utts": {
@@ -62,6 +65,8 @@ def get_asr_dataset_from_json(data_json_path, tgt_dict):
         ]
         # append eos
         tgt = [torch.cat([t, torch.LongTensor([tgt_dict.eos()])]) for t in tgt]
+        if fbank_prefix is not None:
+            return MMapAsrDataset(fbank_prefix, tgt, tgt_dict, ids, speakers)
         return AsrDataset(
             aud_paths, frame_sizes, tgt, tgt_dict, ids, speakers
         )
@@ -98,10 +103,16 @@ class SpeechRecognitionTask(FairseqTask):
 
         Args:
             split (str): name of the split (e.g., train, valid, test)
+
+        The precomputed features ``<data>/<split>.fbank.{bin,idx,npz}`` are
+        used if they exist.
         """
         data_json_path = os.path.join(self.args.data, "{}.json".format(split))
+        fbank_prefix = os.path.join(self.args.data, "{}.fbank".format(split))
+        if not MMapAsrDataset.exists(fbank_prefix):
+            fbank_prefix = None
         self.datasets[split] = get_asr_dataset_from_json(
-            data_json_path, self.tgt_dict)
+            data_json_path, self.tgt_dict, fbank_prefix)
 
     @property
     def target_dictionary(self):
@@ -5,6 +5,8 @@
 
 import ctypes
 import math
+
+import numpy as np
 import torch
 
 try:
@@ -33,6 +35,57 @@ class BleuStat(ctypes.Structure):
     ]
 
 
+NUM_STATS = len(BleuStat._fields_)
+
+
+def _add_to_stat(stat, ref, pred, pad, eos, unk):
+    if not isinstance(ref, torch.IntTensor):
+        raise TypeError('ref must be a torch.IntTensor (got {})'
+                        .format(type(ref)))
+    if not isinstance(pred, torch.IntTensor):
+        raise TypeError('pred must be a torch.IntTensor(got {})'
+                        .format(type(pred)))
+
+    # don't match unknown words
+    rref = ref.clone()
+    assert not rref.lt(0).any()
+    rref[rref.eq(unk)] = -999
+
+    rref = rref.contiguous().view(-1)
+    pred = pred.contiguous().view(-1)
+
+    C.bleu_add(
+        ctypes.byref(stat),
+        ctypes.c_size_t(rref.size(0)),
+        ctypes.c_void_p(rref.data_ptr()),
+        ctypes.c_size_t(pred.size(0)),
+        ctypes.c_void_p(pred.data_ptr()),
+        ctypes.c_int(pad),
+        ctypes.c_int(eos))
+
+
+def sentence_stats(ref, pred, pad, eos, unk):
+    """Returns the BLEU statistics of a single sentence as an array of
+    length :data:`NUM_STATS`, in the field order of :class:`BleuStat`."""
+    stat = BleuStat()
+    C.bleu_zero_init(ctypes.byref(stat))
+    _add_to_stat(stat, ref, pred, pad, eos, unk)
+    return np.array([getattr(stat, name) for name, _ in BleuStat._fields_], dtype=np.int64)
+
+
+def bleu_from_stats(stats, order=4):
+    """Vectorized :func:`Scorer.score` for one or more rows of summed
+    statistics (see :func:`sentence_stats`)."""
+    stats = np.asarray(stats, dtype=np.float64)
+    reflen, predlen = stats[..., 0], stats[..., 1]
+    match, count = stats[..., 2::2][..., :order], stats[..., 3::2][..., :order]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(count > 0, match / count, 0.)
+        psum = np.where(precision > 0, np.log(precision), -np.inf).sum(axis=-1)
+        brevity = np.minimum(1., np.exp(1. - reflen / predlen))
+    return brevity * np.exp(psum / order) * 100
+
+
 class SacrebleuScorer(object):
     def __init__(self):
         import sacrebleu
@@ -73,29 +126,7 @@ class Scorer(object):
             C.bleu_zero_init(ctypes.byref(self.stat))
 
     def add(self, ref, pred):
-        if not isinstance(ref, torch.IntTensor):
-            raise TypeError('ref must be a torch.IntTensor (got {})'
-                            .format(type(ref)))
-        if not isinstance(pred, torch.IntTensor):
-            raise TypeError('pred must be a torch.IntTensor(got {})'
-                            .format(type(pred)))
-
-        # don't match unknown words
-        rref = ref.clone()
-        assert not rref.lt(0).any()
-        rref[rref.eq(self.unk)] = -999
-
-        rref = rref.contiguous().view(-1)
-        pred = pred.contiguous().view(-1)
-
-        C.bleu_add(
-            ctypes.byref(self.stat),
-            ctypes.c_size_t(rref.size(0)),
-            ctypes.c_void_p(rref.data_ptr()),
-            ctypes.c_size_t(pred.size(0)),
-            ctypes.c_void_p(pred.data_ptr()),
-            ctypes.c_int(self.pad),
-            ctypes.c_int(self.eos))
+        _add_to_stat(self.stat, ref, pred, self.pad, self.eos, self.unk)
 
     def score(self, order=4):
         psum = sum(math.log(p) if p > 0 else float('-Inf')
@@ -127,3 +158,109 @@ class Scorer(object):
         return fmt.format(order, self.score(order=order), *bleup,
                           self.brevity(), self.stat.predlen/self.stat.reflen,
                           self.stat.predlen, self.stat.reflen)
+
+
+class CachedScorer(object):
+    """BLEU scorer that keeps the statistics of every sentence, so that
+    sentences can be removed again and corpus BLEU can be computed for any
+    subset of them (e.g., for bootstrap resampling or per-domain scores)
+    without rescoring.
+
+    Has the same interface as :class:`Scorer`; :func:`add` additionally
+    returns the index of the sentence.
+    """
+
+    def __init__(self, pad, eos, unk):
+        self.pad = pad
+        self.eos = eos
+        self.unk = unk
+        self.reset()
+
+    def reset(self, one_init=False):
+        # as bleu_one_init, one_init adds one match and count to the 2- to
+        # 4-gram statistics of every corpus (e.g., for sentence-level BLEU)
+        self._init_stats = np.zeros(NUM_STATS, dtype=np.int64)
+        if one_init:
+            self._init_stats[4:] = 1
+        self._stats = np.zeros((16, NUM_STATS), dtype=np.int64)
+        self._active = np.zeros(16, dtype=bool)
+        self._size = 0
+        self.total = self._init_stats.copy()
+
+    def __len__(self):
+        return int(self._active[:self._size].sum())
+
+    @property
+    def stats(self):
+        """Statistics of all sentences that were added (including removed ones)."""
+        return self._stats[:self._size]
+
+    def add(self, ref, pred):
+        return int(self.add_stats(sentence_stats(ref, pred, self.pad, self.eos, self.unk)[None, :])[0])
+
+    def add_stats(self, stats):
+        """Adds precomputed sentence statistics of shape ``(n, NUM_STATS)``
+        and returns their indices."""
+        stats = np.asarray(stats, dtype=np.int64).reshape(-1, NUM_STATS)
+        end = self._size + len(stats)
+        if end > len(self._stats):
+            capacity = max(end, 2 * len(self._stats))
+            self._stats = np.resize(self._stats, (capacity, NUM_STATS))
+            self._active = np.resize(self._active, capacity)
+        self._stats[self._size:end] = stats
+        self._active[self._size:end] = True
+        self.total += stats.sum(axis=0)
+        indices = np.arange(self._size, end)
+        self._size = end
+        return indices
+
+    def remove(self, index):
+        assert self._active[index], 'sentence {} is not part of the corpus'.format(index)
+        self._active[index] = False
+        self.total -= self._stats[index]
+
+    def corpus_stats(self, indices=None):
+        """Summed statistics of the sentences *indices* (default: all
+        sentences that were not removed)."""
+        if indices is None:
+            return self.total
+        return self._init_stats + self._stats[np.asarray(indices)].sum(axis=0)
+
+    def score(self, order=4, indices=None):
+        return float(bleu_from_stats(self.corpus_stats(indices), order))
+
+    def precision(self, indices=None):
+        stats = self.corpus_stats(indices)
+        return [m / c if c > 0 else 0 for m, c in zip(stats[2::2], stats[3::2])]
+
+    def brevity(self, indices=None):
+        stats = self.corpus_stats(indices)
+        r = stats[0] / stats[1]
+        return min(1, math.exp(1 - r))
+
+    def bootstrap(self, num_samples=1000, seed=1, order=4, max_elements=2 ** 24):
+        """Corpus BLEU of *num_samples* bootstrap resamples (with
+        replacement) of the current corpus."""
+        stats = self._stats[:self._size][self._active[:self._size]]
+        n = len(stats)
+        rng = np.random.RandomState(seed)
+        batch_size = max(1, max_elements // max(n, 1))
+        scores = []
+        for start in range(0, num_samples, batch_size):
+            size = min(batch_size, num_samples - start)
+            # how often each sentence occurs in each resample
+            counts = rng.multinomial(n, np.full(n, 1. / n), size=size)
+            scores.append(bleu_from_stats(counts.dot(stats) + self._init_stats, order))
+        return np.concatenate(scores)
+
+    def result_string(self, order=4, indices=None):
+        assert order <= 4, "BLEU scores for order > 4 aren't supported"
+        fmt = 'BLEU{} = {:2.2f}, {:2.1f}'
+        for _ in range(1, order):
+            fmt += '/{:2.1f}'
+        fmt += ' (BP={:.3f}, ratio={:.3f}, syslen={}, reflen={})'
+        stats = self.corpus_stats(indices)
+        bleup = [p * 100 for p in self.precision(indices)[:order]]
+        return fmt.format(order, self.score(order, indices), *bleup,
+                          self.brevity(indices), stats[1] / stats[0],
+                          stats[1], stats[0])
@@ -3,18 +3,24 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
 from typing import Union
 import collections
 import logging
 import os
+import pickle
 import re
+import struct
 import traceback
 import shutil
 
+import numpy as np
 import torch
 from torch.serialization import default_restore_location
 
+from fairseq.meters import StopwatchMeter
 from fairseq.models import FairseqEncoder, FairseqDecoder
 
 
@@ -155,7 +161,7 @@ def load_checkpoint_to_cpu(path, arg_overrides=None):
     return state
 
 
-def load_model_ensemble(filenames, arg_overrides=None, task=None):
+def load_model_ensemble(filenames, arg_overrides=None, task=None, num_workers=None):
     """Loads an ensemble of models.
 
     Args:
@@ -163,31 +169,242 @@ def load_model_ensemble(filenames, arg_overrides=None, task=None):
         arg_overrides (Dict[str,Any], optional): override model args that
             were used during model training
         task (fairseq.tasks.FairseqTask, optional): task to use for loading
+        num_workers (int, optional): number of threads reading checkpoints
+            (default: one per checkpoint, up to the number of CPUs)
     """
-    ensemble, args, _task = load_model_ensemble_and_task(filenames, arg_overrides, task)
+    ensemble, args, _task = load_model_ensemble_and_task(filenames, arg_overrides, task, num_workers)
     return ensemble, args
 
 
-def load_model_ensemble_and_task(filenames, arg_overrides=None, task=None):
-    from fairseq import tasks
-
+def _load_state_for_inference(filename, arg_overrides):
+    if not os.path.exists(filename):
+        raise IOError('Model file not found: {}'.format(filename))
+    if is_inference_checkpoint(filename):
+        return load_inference_checkpoint(filename, arg_overrides), True
+    state = load_checkpoint_to_cpu(filename, arg_overrides)
+    # drop the optimizer state etc. right away, only the weights are needed
+    return {
+        'args': state['args'],
+        'model': state['model'],
+        'quantized': state.get('quantized', False),
+    }, False
+
+
+def load_model_ensemble_and_task(filenames, arg_overrides=None, task=None, num_workers=None):
+    from fairseq import tasks, utils
+
+    # checkpoints are read in parallel, while the models are built (without
+    # random initialization, as all weights are overwritten) one by one in
+    # the order of *filenames*; at most *num_workers* checkpoints are read
+    # ahead, and each one is released as soon as its model has the weights
+    if num_workers is None:
+        num_workers = min(len(filenames), os.cpu_count() or 1)
+    num_workers = max(num_workers, 1)
+    read_timer, build_timer, load_timer = StopwatchMeter(), StopwatchMeter(), StopwatchMeter()
+    read_timer.start()
     ensemble = []
-    for filename in filenames:
-        if not os.path.exists(filename):
-            raise IOError('Model file not found: {}'.format(filename))
-        state = load_checkpoint_to_cpu(filename, arg_overrides)
-
-        args = state['args']
-        if task is None:
-            task = tasks.setup_task(args)
-
-        # build model for ensemble
-        model = task.build_model(args)
-        model.load_state_dict(state['model'], strict=True, args=args)
-        ensemble.append(model)
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        pending = iter(filenames)
+        futures = deque(
+            pool.submit(_load_state_for_inference, filename, arg_overrides)
+            for filename in islice(pending, num_workers)
+        )
+        while len(futures) > 0:
+            state, mmap = futures.popleft().result()
+            read_timer.stop()
+            for filename in islice(pending, 1):
+                futures.append(pool.submit(_load_state_for_inference, filename, arg_overrides))
+
+            args = state['args']
+            if task is None:
+                task = tasks.setup_task(args)
+
+            # build model for ensemble
+            build_timer.start()
+            if state.get('quantized', False):
+                # the weights are quantized when the model is, so they must
+                # be initialized (even though they are overwritten)
+                model = task.build_model(args)
+                model.quantize_()
+            else:
+                with utils.no_param_init():
+                    model = task.build_model(args)
+            build_timer.stop()
+
+            load_timer.start()
+            if mmap:
+                _assign_state_dict(model, state['model'], args)
+            else:
+                model.load_state_dict(state['model'], strict=True, args=args)
+            del state
+            load_timer.stop()
+            ensemble.append(model)
+            read_timer.start()
+    read_timer.stop()
+
+    print(
+        '| loaded {} model(s) in {:.1f}s (read {:.1f}s, build {:.1f}s, load weights {:.1f}s)'.format(
+            len(ensemble), read_timer.sum + build_timer.sum + load_timer.sum,
+            read_timer.sum, build_timer.sum, load_timer.sum,
+        )
+    )
     return ensemble, args, task
 
 
+_INFERENCE_MAGIC = b'FSQINF\x00\x00'
+_INFERENCE_VERSION = 1
+_INFERENCE_ALIGN = 64
+
+_NUMPY_DTYPES = {
+    torch.float64: np.float64,
+    torch.float32: np.float32,
+    torch.float16: np.float16,
+    torch.int64: np.int64,
+    torch.int32: np.int32,
+    torch.int16: np.int16,
+    torch.int8: np.int8,
+    torch.uint8: np.uint8,
+    torch.bool: np.bool_,
+}
+
+
+def _align(offset):
+    return (offset + _INFERENCE_ALIGN - 1) // _INFERENCE_ALIGN * _INFERENCE_ALIGN
+
+
+def save_inference_checkpoint(filename, args, model_state_dict, dtype=None):
+    """Saves only the model args and weights, in a format that
+    :func:`load_model_ensemble_and_task` memory-maps instead of unpickling.
+
+    The file consists of a small pickled header with the args and a tensor
+    index, followed by the raw (aligned) tensor data. Tensors that share
+    storage, e.g. tied embeddings, are stored once.
+
+    Args:
+        filename (str): file to write
+        args (argparse.Namespace): model args
+        model_state_dict (dict): model weights
+        dtype (torch.dtype, optional): convert floating point tensors to this
+            type (e.g., ``torch.float16`` to halve the file size)
+    """
+    index = []
+    tensors = []
+    shared = {}
+    size = 0
+    for key, tensor in model_state_dict.items():
+        ident = (tensor.data_ptr(), tensor.dtype, tuple(tensor.size()), tensor.stride())
+        if ident in shared:
+            index.append((key, ) + shared[ident])
+            continue
+        if dtype is not None and tensor.is_floating_point():
+            tensor = tensor.to(dtype)
+        assert tensor.dtype in _NUMPY_DTYPES, \
+            'unsupported tensor type {} for {}'.format(tensor.dtype, key)
+        array = tensor.detach().cpu().contiguous().numpy()
+        shared[ident] = (array.dtype.str, array.shape, size)
+        index.append((key, ) + shared[ident])
+        tensors.append((size, array))
+        size = _align(size + array.nbytes)
+
+    header = pickle.dumps({
+        'version': _INFERENCE_VERSION,
+        'args': args,
+        'tensors': index,
+    })
+    data_offset = _align(len(_INFERENCE_MAGIC) + 8 + len(header))
+    with open(filename, 'wb') as f:
+        f.write(_INFERENCE_MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for offset, array in tensors:
+            f.seek(data_offset + offset)
+            f.write(array.tobytes())
+        f.truncate(data_offset + size)
+
+
+def is_inference_checkpoint(filename):
+    """Whether *filename* was written by :func:`save_inference_checkpoint`."""
+    with open(filename, 'rb') as f:
+        return f.read(len(_INFERENCE_MAGIC)) == _INFERENCE_MAGIC
+
+
+def load_inference_checkpoint(filename, arg_overrides=None):
+    """Loads a checkpoint written by :func:`save_inference_checkpoint`.
+
+    The tensors of ``state['model']`` are copy-on-write memory maps of the
+    file, so no weights are read until they are used and processes that load
+    the same file share its pages.
+    """
+    with open(filename, 'rb') as f:
+        assert f.read(len(_INFERENCE_MAGIC)) == _INFERENCE_MAGIC, \
+            '{} is not an inference checkpoint'.format(filename)
+        header_len, = struct.unpack('<Q', f.read(8))
+        header = pickle.loads(f.read(header_len))
+    assert header['version'] == _INFERENCE_VERSION, \
+        'unsupported inference checkpoint version: {}'.format(header['version'])
+    data_offset = _align(len(_INFERENCE_MAGIC) + 8 + header_len)
+
+    buffer = np.memmap(filename, dtype=np.uint8, mode='c')
+    state_dict = OrderedDict()
+    for key, dtype, shape, offset in header['tensors']:
+        dtype = np.dtype(dtype)
+        start = data_offset + offset
+        end = start + dtype.itemsize * int(np.prod(shape))
+        state_dict[key] = torch.from_numpy(buffer[start:end].view(dtype).reshape(shape))
+
+    args = header['args']
+    if arg_overrides is not None:
+        for arg_name, arg_val in arg_overrides.items():
+            setattr(args, arg_name, arg_val)
+    _set_arg_defaults(args)
+    return {'args': args, 'model': state_dict}
+
+
+def _assign_state_dict(model, state_dict, args):
+    """Like ``model.load_state_dict(state_dict, strict=True, args=args)``, but
+    makes the parameters and buffers of *model* point to the tensors of
+    *state_dict* instead of copying them. Only tensors whose type differs from
+    the model's (e.g., float16 weights of a float32 model) are copied."""
+    model.upgrade_state_dict(state_dict)
+    state_dict = prune_state_dict(state_dict, args)
+    expected = set(model.state_dict().keys())
+    missing = expected - set(state_dict.keys())
+    unexpected = set(state_dict.keys()) - expected
+    if len(missing) > 0 or len(unexpected) > 0:
+        raise KeyError(
+            'Error(s) in loading state_dict for {}: missing keys {}, unexpected keys {}'.format(
+                model.__class__.__name__, sorted(missing), sorted(unexpected),
+            )
+        )
+    with torch.no_grad():
+        for name, tensor in chain(model.named_parameters(), model.named_buffers()):
+            if name not in state_dict:
+                continue  # non-persistent buffer
+            if tensor.size() != state_dict[name].size():
+                raise RuntimeError('size mismatch for {}: checkpoint {}, model {}'.format(
+                    name, tuple(state_dict[name].size()), tuple(tensor.size()),
+                ))
+            value = state_dict[name]
+            if value.dtype != tensor.dtype:
+                value = value.to(tensor.dtype)
+            tensor.data = value
+
+
+def save_quantized_checkpoint(filename, args, model):
+    """Saves the args and weights of a model quantized with
+    :func:`~fairseq.models.BaseFairseqModel.quantize_`.
+
+    :func:`load_model_ensemble_and_task` quantizes the models it builds for
+    such a checkpoint before loading the (int8) weights.
+    """
+    assert model._is_quantized, 'the model is not quantized'
+    torch_persistent_save({
+        'args': args,
+        'model': model.state_dict(),
+        'quantized': True,
+    }, filename)
+
+
 def checkpoint_paths(path, pattern=r'checkpoint(\d+)\.pt'):
     """Retrieves all checkpoints found in `path` directory.
 
@@ -268,7 +485,10 @@ def save_state(
 
 def _upgrade_state_dict(state):
     """Helper for upgrading old model checkpoints."""
-    from fairseq import models, registry, tasks
+    if state.get('quantized', False):
+        # quantized checkpoints only contain the model args and weights
+        _set_arg_defaults(state['args'])
+        return state
 
     # add optimizer_history
     if 'optimizer_history' not in state:
@@ -318,20 +538,25 @@ def _upgrade_state_dict(state):
             'epoch': state['extra_state']['epoch'],
             'iterations_in_epoch': state['extra_state'].get('batch_offset', 0),
         }
+    _set_arg_defaults(state['args'])
+    return state
+
+
+def _set_arg_defaults(args):
+    from fairseq import models, registry, tasks
+
     # default to translation task
-    if not hasattr(state['args'], 'task'):
-        state['args'].task = 'translation'
+    if not hasattr(args, 'task'):
+        args.task = 'translation'
 
     # set any missing default values in the task, model or other registries
-    registry.set_defaults(state['args'], tasks.TASK_REGISTRY[state['args'].task])
-    registry.set_defaults(state['args'], models.ARCH_MODEL_REGISTRY[state['args'].arch])
+    registry.set_defaults(args, tasks.TASK_REGISTRY[args.task])
+    registry.set_defaults(args, models.ARCH_MODEL_REGISTRY[args.arch])
     for registry_name, REGISTRY in registry.REGISTRIES.items():
-        choice = getattr(state['args'], registry_name, None)
+        choice = getattr(args, registry_name, None)
         if choice is not None:
             cls = REGISTRY['registry'][choice]
-            registry.set_defaults(state['args'], cls)
-
-    return state
+            registry.set_defaults(args, cls)
 
 
 def prune_state_dict(state_dict, args):
@@ -36,6 +36,7 @@ class LabelSmoothedCrossEntropyCriterion(FairseqCriterion):
     def __init__(self, args, task):
         super().__init__(args, task)
         self.eps = args.label_smoothing
+        self.vocab_chunk = getattr(args, 'loss_vocab_chunk', 0)
 
     @staticmethod
     def add_args(parser):
@@ -43,6 +44,11 @@ class LabelSmoothedCrossEntropyCriterion(FairseqCriterion):
         # fmt: off
         parser.add_argument('--label-smoothing', default=0., type=float, metavar='D',
                             help='epsilon for label smoothing, 0 means no label smoothing')
+        parser.add_argument('--loss-vocab-chunk', default=0, type=int, metavar='N',
+                            help='compute the loss from the decoder features for N vocabulary entries at a '
+                                 'time, without storing the log-probabilities over the whole vocabulary '
+                                 '(for decoders with get_label_smoothed_nll_loss, e.g. transformer); '
+                                 '0 disables')
         # fmt: on
 
     def forward(self, model, sample, reduce=True):
@@ -53,8 +59,7 @@ class LabelSmoothedCrossEntropyCriterion(FairseqCriterion):
         2) the sample size, which is used as the denominator for the gradient
         3) logging outputs to display while training
         """
-        net_output = model(**sample['net_input'])
-        loss, nll_loss = self.compute_loss(model, net_output, sample, reduce=reduce)
+        net_output, loss, nll_loss = self.compute_output_and_loss(model, sample, reduce=reduce)
         sample_size = sample['target'].size(0) if self.args.sentence_avg else sample['ntokens']
         logging_output = {
             'loss': utils.item(loss.data) if reduce else loss.data,
@@ -65,6 +70,27 @@ class LabelSmoothedCrossEntropyCriterion(FairseqCriterion):
         }
         return loss, sample_size, logging_output
 
+    def compute_output_and_loss(self, model, sample, reduce=True):
+        """Run the model and compute the loss, from the decoder features with
+        :meth:`compute_chunked_loss` if ``--loss-vocab-chunk`` is set and the
+        decoder supports it."""
+        decoder = getattr(model, 'decoder', None)
+        if self.vocab_chunk > 0 and reduce and hasattr(decoder, 'get_label_smoothed_nll_loss'):
+            net_output = model(**sample['net_input'], features_only=True)
+            loss, nll_loss = self.compute_chunked_loss(model, net_output, sample)
+        else:
+            net_output = model(**sample['net_input'])
+            loss, nll_loss = self.compute_loss(model, net_output, sample, reduce=reduce)
+        return net_output, loss, nll_loss
+
+    def compute_chunked_loss(self, model, net_output, sample):
+        target = model.get_targets(sample, net_output)
+        # drop the padding positions before projecting to the vocabulary
+        non_pad_mask = target.ne(self.padding_idx)
+        return model.decoder.get_label_smoothed_nll_loss(
+            net_output[0][non_pad_mask], target[non_pad_mask], self.eps, self.vocab_chunk,
+        )
+
     def compute_loss(self, model, net_output, sample, reduce=True):
         lprobs = model.get_normalized_probs(net_output, log_probs=True)
         lprobs = lprobs.view(-1, lprobs.size(-1))
@@ -9,7 +9,7 @@ from .fairseq_dataset import FairseqDataset
 
 from .base_wrapper_dataset import BaseWrapperDataset
 
-from .audio.raw_audio_dataset import FileAudioDataset
+from .audio.raw_audio_dataset import FileAudioDataset, MMapAudioDataset, MMapAudioDatasetBuilder
 from .backtranslation_dataset import BacktranslationDataset
 from .colorize_dataset import ColorizeDataset
 from .concat_dataset import ConcatDataset
@@ -74,6 +74,8 @@ __all__ = [
     'LMContextWindowDataset',
     'LRUCacheDataset',
     'MaskTokensDataset',
+    'MMapAudioDataset',
+    'MMapAudioDatasetBuilder',
     'MMapIndexedDataset',
     'MonolingualDataset',
     'NestedDictionaryDataset',
@@ -154,3 +154,116 @@ class FileAudioDataset(RawAudioDataset):
         feats = torch.from_numpy(wav).float()
         feats = self.postprocess(feats, curr_sample_rate)
         return {"id": index, "source": feats}
+
+
+def audio_data_file_path(prefix_path):
+    return prefix_path + '.audio.bin'
+
+
+def audio_index_file_path(prefix_path):
+    return prefix_path + '.audio.npz'
+
+
+class MMapAudioDatasetBuilder(object):
+    """Packs decoded waveforms into the memory-mapped store read by
+    :class:`MMapAudioDataset`.
+
+    Args:
+        prefix_path (str): output path prefix
+        sample_rate (int): sample rate of the waveforms
+        int16 (bool, optional): quantize the waveforms (in [-1, 1]) to 16-bit
+            integers, which halves the size of the store (default: False)
+    """
+
+    def __init__(self, prefix_path, sample_rate, int16=False):
+        self.prefix_path = prefix_path
+        self.sample_rate = sample_rate
+        self.dtype = np.int16 if int16 else np.float32
+        self.scale = 32768. if int16 else 1.
+        self._data_file = open(audio_data_file_path(prefix_path), 'wb')
+        self._sizes = []
+
+    def add_item(self, wav):
+        wav = np.asarray(wav)
+        if self.dtype == np.int16:
+            wav = np.clip(np.round(wav * self.scale), -32768, 32767)
+        self._data_file.write(wav.astype(self.dtype).tobytes())
+        self._sizes.append(len(wav))
+
+    def finalize(self):
+        self._data_file.close()
+        sizes = np.array(self._sizes, dtype=np.int64)
+        np.savez(
+            audio_index_file_path(self.prefix_path),
+            sizes=sizes,
+            offsets=np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64),
+            dtype=np.dtype(self.dtype).str,
+            scale=self.scale,
+            sample_rate=self.sample_rate,
+        )
+
+
+class MMapAudioDataset(RawAudioDataset):
+    """Reads waveforms packed by :class:`MMapAudioDatasetBuilder` (see
+    ``scripts/wav2vec_pack.py``) from a single memory-mapped file.
+
+    Items are views of the mapped file, so nothing is copied until the
+    (randomly cropped) waveforms are collated, and resampling was already
+    done when packing.
+    """
+
+    def __init__(
+        self,
+        prefix_path,
+        sample_rate,
+        max_sample_size=None,
+        min_sample_size=None,
+        shuffle=True,
+        min_length=0,
+    ):
+        super().__init__(
+            sample_rate=sample_rate,
+            max_sample_size=max_sample_size,
+            min_sample_size=min_sample_size,
+            shuffle=shuffle,
+            min_length=min_length,
+        )
+
+        self.prefix_path = prefix_path
+        index = np.load(audio_index_file_path(prefix_path))
+        assert int(index['sample_rate']) == sample_rate, \
+            '{} was packed at {} Hz, expected {} Hz'.format(prefix_path, int(index['sample_rate']), sample_rate)
+        self.sizes = index['sizes']
+        self.offsets = index['offsets']
+        self.dtype = np.dtype(str(index['dtype']))
+        self.scale = float(index['scale'])
+        self._data = None
+
+    @staticmethod
+    def exists(prefix_path):
+        return (
+            os.path.exists(audio_index_file_path(prefix_path))
+            and os.path.exists(audio_data_file_path(prefix_path))
+        )
+
+    @property
+    def data(self):
+        # mapped lazily, so that the dataset can be pickled into workers
+        if self._data is None:
+            self._data = np.memmap(audio_data_file_path(self.prefix_path), dtype=self.dtype, mode='r')
+        return self._data
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def __getitem__(self, index):
+        offset, size = self.offsets[index], self.sizes[index]
+        return {"id": index, "source": torch.from_numpy(self.data[offset:offset + size])}
+
+    def collater(self, samples):
+        batch = super().collater(samples)
+        if len(batch) > 0 and self.dtype != np.float32:
+            batch["net_input"]["source"] = batch["net_input"]["source"].float() / self.scale
+        return batch
@@ -3,10 +3,12 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+from typing import List
+
 from fairseq import file_utils
 from fairseq.data.encoders import register_bpe
 
-from .gpt2_bpe_utils import get_encoder
+from .gpt2_bpe_utils import DEFAULT_CACHE_SIZE, get_encoder
 
 
 DEFAULT_ENCODER_JSON = 'https://dl.fbaipublicfiles.com/fairseq/gpt2_bpe/encoder.json'
@@ -25,6 +27,10 @@ class GPT2BPE(object):
         parser.add_argument('--gpt2-vocab-bpe', type=str,
                             default=DEFAULT_VOCAB_BPE,
                             help='path to vocab.bpe')
+        parser.add_argument('--gpt2-bpe-cache-size', type=int,
+                            default=DEFAULT_CACHE_SIZE,
+                            help='max number of words kept in the BPE word cache '
+                                 '(<= 0 for an unbounded cache)')
         # fmt: on
 
     def __init__(self, args):
@@ -34,11 +40,17 @@ class GPT2BPE(object):
         vocab_bpe = file_utils.cached_path(
             getattr(args, 'gpt2_vocab_bpe', DEFAULT_VOCAB_BPE)
         )
-        self.bpe = get_encoder(encoder_json, vocab_bpe)
+        self.bpe = get_encoder(
+            encoder_json, vocab_bpe,
+            cache_size=getattr(args, 'gpt2_bpe_cache_size', DEFAULT_CACHE_SIZE),
+        )
 
     def encode(self, x: str) -> str:
         return ' '.join(map(str, self.bpe.encode(x)))
 
+    def encode_many(self, xs: List[str]) -> List[str]:
+        return [' '.join(map(str, ids)) for ids in self.bpe.encode_many(xs)]
+
     def decode(self, x: str) -> str:
         return self.bpe.decode(map(int, x.split()))
 
@@ -5,10 +5,15 @@ Original source: https://github.com/openai/gpt-2/blob/master/src/encoder.py
 Original license: MIT
 """
 
+from collections import OrderedDict
 from functools import lru_cache
+import heapq
 import json
 
 
+DEFAULT_CACHE_SIZE = 2 ** 18
+
+
 @lru_cache()
 def bytes_to_unicode():
     """
@@ -42,16 +47,70 @@ def get_pairs(word):
         prev_char = char
     return pairs
 
+class BPECache(object):
+    """Bounded LRU cache mapping words to their BPE segmentation.
+
+    Args:
+        max_size (int): maximum number of cached words; ``None`` or a
+            non-positive value means unbounded (the original behavior)
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size if max_size is not None and max_size > 0 else None
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        try:
+            value = self._cache[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.max_size is not None:
+            self._cache.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._cache[key] = value
+        if self.max_size is not None and len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._cache),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0.,
+        }
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def __len__(self):
+        return len(self._cache)
+
+
 class Encoder:
 
-    def __init__(self, encoder, bpe_merges, errors='replace'):
+    def __init__(self, encoder, bpe_merges, errors='replace', cache_size=DEFAULT_CACHE_SIZE):
         self.encoder = encoder
         self.decoder = {v:k for k,v in self.encoder.items()}
         self.errors = errors # how to handle errors in decoding
         self.byte_encoder = bytes_to_unicode()
         self.byte_decoder = {v:k for k, v in self.byte_encoder.items()}
         self.bpe_ranks = dict(zip(bpe_merges, range(len(bpe_merges))))
-        self.cache = {}
+        self.rank_to_merge = {rank: merge for merge, rank in self.bpe_ranks.items()}
+        self.cache = BPECache(cache_size)
 
         try:
             import regex as re
@@ -63,8 +122,67 @@ class Encoder:
         self.pat = self.re.compile(r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""")
 
     def bpe(self, token):
-        if token in self.cache:
-            return self.cache[token]
+        word = self.cache.get(token)
+        if word is not None:
+            return word
+        if len(token) < 2:
+            return token
+
+        # Symbols live in a doubly linked list over the character positions
+        # (merged symbols are stored at their left-most position) and all
+        # candidate merges sit in a heap ordered by (rank, position). All
+        # occurrences of the lowest ranked merge are applied left to right
+        # before any new pair is considered, exactly like the classic loop.
+        ranks = self.bpe_ranks
+        symbols = list(token)
+        n = len(symbols)
+        prev = list(range(-1, n - 1))
+        nxt = list(range(1, n + 1))
+        nxt[-1] = -1
+
+        heap = []
+        for i in range(n - 1):
+            rank = ranks.get((symbols[i], symbols[i + 1]))
+            if rank is not None:
+                heap.append((rank, i))
+        heapq.heapify(heap)
+
+        while heap:
+            rank = heap[0][0]
+            first, second = self.rank_to_merge[rank]
+            merged = []
+            while heap and heap[0][0] == rank:
+                i = heapq.heappop(heap)[1]
+                j = nxt[i]
+                # skip stale entries
+                if symbols[i] != first or j == -1 or symbols[j] != second:
+                    continue
+                symbols[i] = first + second
+                symbols[j] = None
+                k = nxt[j]
+                nxt[i] = k
+                if k != -1:
+                    prev[k] = i
+                merged.append(i)
+
+            for i in merged:
+                p, k = prev[i], nxt[i]
+                if p != -1:
+                    new_rank = ranks.get((symbols[p], symbols[i]))
+                    if new_rank is not None:
+                        heapq.heappush(heap, (new_rank, p))
+                if k != -1:
+                    new_rank = ranks.get((symbols[i], symbols[k]))
+                    if new_rank is not None:
+                        heapq.heappush(heap, (new_rank, i))
+
+        word = ' '.join(s for s in symbols if s is not None)
+        self.cache.put(token, word)
+        return word
+
+    def bpe_pairwise(self, token):
+        """Reference (uncached) implementation of :func:`bpe` using the
+        classic pairwise-merge loop from the original GPT-2 encoder."""
         word = tuple(token)
         pairs = get_pairs(word)
 
@@ -99,9 +217,7 @@ class Encoder:
                 break
             else:
                 pairs = get_pairs(word)
-        word = ' '.join(word)
-        self.cache[token] = word
-        return word
+        return ' '.join(word)
 
     def encode(self, text):
         bpe_tokens = []
@@ -110,12 +226,34 @@ class Encoder:
             bpe_tokens.extend(self.encoder[bpe_token] for bpe_token in self.bpe(token).split(' '))
         return bpe_tokens
 
+    def encode_many(self, texts):
+        """Encode a batch of texts, returning a list of token id lists.
+
+        Words are looked up once per batch, so repeated words only go through
+        the word cache (and the merge loop) a single time.
+        """
+        findall, pat = self.re.findall, self.pat
+        byte_encoder, encoder, bpe = self.byte_encoder, self.encoder, self.bpe
+        batch_cache = {}
+        results = []
+        for text in texts:
+            bpe_tokens = []
+            for token in findall(pat, text):
+                ids = batch_cache.get(token)
+                if ids is None:
+                    word = ''.join(byte_encoder[b] for b in token.encode('utf-8'))
+                    ids = [encoder[bpe_token] for bpe_token in bpe(word).split(' ')]
+                    batch_cache[token] = ids
+                bpe_tokens.extend(ids)
+            results.append(bpe_tokens)
+        return results
+
     def decode(self, tokens):
         text = ''.join([self.decoder[token] for token in tokens])
         text = bytearray([self.byte_decoder[c] for c in text]).decode('utf-8', errors=self.errors)
         return text
 
-def get_encoder(encoder_json_path, vocab_bpe_path):
+def get_encoder(encoder_json_path, vocab_bpe_path, cache_size=DEFAULT_CACHE_SIZE):
     with open(encoder_json_path, 'r') as f:
         encoder = json.load(f)
     with open(vocab_bpe_path, 'r', encoding="utf-8") as f:
@@ -124,4 +262,5 @@ def get_encoder(encoder_json_path, vocab_bpe_path):
     return Encoder(
         encoder=encoder,
         bpe_merges=bpe_merges,
+        cache_size=cache_size,
     )
@@ -88,7 +88,9 @@ dtypes = {
     5: np.int64,
     6: np.float,
     7: np.double,
-    8: np.uint16
+    8: np.uint16,
+    9: np.float32,
+    10: np.float16,
 }
 
 
@@ -473,7 +475,7 @@ class MMapIndexedDataset(torch.utils.data.Dataset):
     def __getitem__(self, i):
         ptr, size = self._index[i]
         np_array = np.frombuffer(self._bin_buffer, dtype=self._index.dtype, count=size, offset=ptr)
-        if self._index.dtype != np.int64:
+        if self._index.dtype != np.int64 and np.issubdtype(self._index.dtype, np.integer):
             np_array = np_array.astype(np.int64)
 
         return torch.from_numpy(np_array)
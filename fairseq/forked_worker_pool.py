@@ -0,0 +1,152 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import copyreg
+import gc
+import io
+import pickle
+import queue
+import traceback
+
+import torch
+import torch.multiprocessing as mp
+
+
+def _reduce_tensor(tensor):
+    # a compact copy, so that views are not sent with their whole storage
+    return tensor.clone().__reduce_ex__(pickle.HIGHEST_PROTOCOL)
+
+
+def _dumps(obj):
+    f = io.BytesIO()
+    pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = copyreg.dispatch_table.copy()
+    pickler.dispatch_table[torch.Tensor] = _reduce_tensor
+    pickler.dump(obj)
+    return f.getvalue()
+
+
+def _worker_loop(fn, num_threads, worker_id, in_queue, out_queue):
+    torch.set_num_threads(num_threads)
+    while True:
+        item = in_queue.get()
+        if item is None:
+            break
+        idx, x = pickle.loads(item)
+        try:
+            out_queue.put((worker_id, idx, _dumps(fn(x)), None))
+        except Exception:
+            out_queue.put((worker_id, idx, None, traceback.format_exc()))
+
+
+class ForkedWorkerPool(object):
+    """Applies *fn* to items in *num_workers* processes forked from the
+    current one, so that the workers share the state that *fn* uses (e.g.,
+    the models of a generator) instead of loading their own copy.
+
+    Models should be loaded and prepared for inference before the pool is
+    created; their parameters and buffers should be moved to shared memory
+    with :func:`torch.nn.Module.share_memory`, so that they are not copied
+    when the workers touch them. Only the items and the results of *fn* are
+    sent between the processes. Their tensors are copied (views without the
+    rest of their storage), since moving many small tensors to shared memory
+    is slower.
+
+    Args:
+        fn (callable): function applied to each item; it does not need to
+            be picklable
+        num_workers (int): number of worker processes
+        num_threads (int, optional): number of intra-op threads of each
+            worker (default: the number of threads of this process divided
+            by *num_workers*)
+        max_pending (int, optional): maximum number of items that are
+            dispatched but not returned yet (default: 2 per worker)
+    """
+
+    def __init__(self, fn, num_workers, num_threads=None, max_pending=None):
+        assert num_workers > 0
+        if num_threads is None:
+            num_threads = max(1, torch.get_num_threads() // num_workers)
+        self.num_workers = num_workers
+        self.max_pending = max_pending if max_pending is not None else 2 * num_workers
+
+        # keep the garbage collector from writing to (and thereby copying)
+        # the pages of the objects that exist before forking
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+
+        ctx = mp.get_context('fork')
+        # unlike SimpleQueues, Queues write to their pipe in a feeder thread,
+        # so putting a large item cannot block until the other side reads
+        self.in_queues = [ctx.Queue() for _ in range(num_workers)]
+        self.out_queue = ctx.Queue()
+        self.workers = []
+        for i in range(num_workers):
+            worker = ctx.Process(
+                target=_worker_loop,
+                args=(fn, num_threads, i, self.in_queues[i], self.out_queue),
+                daemon=True,
+            )
+            worker.start()
+            self.workers.append(worker)
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+        # number of dispatched items that each worker has not returned yet
+        self.queue_depths = [0] * num_workers
+
+    def imap(self, items):
+        """Yield ``fn(item)`` for each of *items*, in order. Each item goes
+        to the worker with the fewest pending items."""
+        items = iter(items)
+        results = {}
+        num_dispatched, num_returned = 0, 0
+        exhausted = False
+        while True:
+            while not exhausted and sum(self.queue_depths) < self.max_pending:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                worker_id = min(range(self.num_workers), key=lambda i: self.queue_depths[i])
+                self.in_queues[worker_id].put(_dumps((num_dispatched, item)))
+                self.queue_depths[worker_id] += 1
+                num_dispatched += 1
+            if exhausted and num_returned == num_dispatched:
+                return
+
+            try:
+                worker_id, idx, result, error = self.out_queue.get(timeout=1)
+            except queue.Empty:
+                # a worker that died (e.g., killed for using too much memory)
+                # would never return its pending items
+                for worker_id, (depth, worker) in enumerate(zip(self.queue_depths, self.workers)):
+                    if depth > 0 and not worker.is_alive():
+                        raise RuntimeError('worker {} exited with code {} before returning {} item(s)'.format(
+                            worker_id, worker.exitcode, depth,
+                        ))
+                continue
+            self.queue_depths[worker_id] -= 1
+            if error is not None:
+                raise RuntimeError('worker {} failed:\n{}'.format(worker_id, error))
+            results[idx] = pickle.loads(result)
+            while num_returned in results:
+                yield results.pop(num_returned)
+                num_returned += 1
+
+    def close(self):
+        for in_queue in self.in_queues:
+            in_queue.put(None)
+        # read the results that were not returned (e.g., after an error),
+        # since a worker only exits once its results are written to the pipe
+        while any(depth > 0 and worker.is_alive() for depth, worker in zip(self.queue_depths, self.workers)):
+            try:
+                worker_id, _, _, _ = self.out_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            self.queue_depths[worker_id] -= 1
+        for worker in self.workers:
+            worker.join()
@@ -0,0 +1,61 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import torch
+
+
+class LexicalShortlist(object):
+    """Restricts the output vocabulary of a batch to the most likely
+    translations of its source words plus the most frequent target words.
+
+    The candidates of a batch are a sorted LongTensor of target indices. They
+    always include the special symbols and the *num_frequent* most frequent
+    target words, i.e., the first ``tgt_dict.nspecial + num_frequent``
+    indices of a (finalized) dictionary, so that the special symbols keep
+    their indices in the shortlist.
+
+    Args:
+        table (LongTensor): ``len(src_dict) x K`` target indices of the K most
+            likely translations of each source word (padded with
+            ``tgt_dict.pad()``)
+        num_always (int): number of leading target indices that are always
+            candidates
+    """
+
+    def __init__(self, table, num_always):
+        self.table = table
+        self.always = torch.arange(num_always)
+
+    @classmethod
+    def load(cls, path, src_dict, tgt_dict, topk=100, num_frequent=100):
+        """Load a lexical translation table written by
+        ``scripts/build_lexical_shortlist.py``, with one
+        ``source_word target_word probability`` triple per line, keeping the
+        *topk* most likely translations of each source word."""
+        translations = [[] for _ in range(len(src_dict))]
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                src, tgt, prob = line.split()
+                src_idx, tgt_idx = src_dict.index(src), tgt_dict.index(tgt)
+                if src_idx == src_dict.unk() or tgt_idx == tgt_dict.unk():
+                    continue
+                translations[src_idx].append((float(prob), tgt_idx))
+
+        table = torch.full((len(src_dict), max(1, topk)), tgt_dict.pad(), dtype=torch.long)
+        for src_idx, tgts in enumerate(translations):
+            tgts = [tgt_idx for _, tgt_idx in sorted(tgts, reverse=True)[:topk]]
+            table[src_idx, :len(tgts)] = torch.LongTensor(tgts)
+        return cls(table, min(len(tgt_dict), tgt_dict.nspecial + num_frequent))
+
+    def candidates(self, src_tokens, prefix_tokens=None):
+        """Return the sorted target indices that may be generated for the
+        source sentences *src_tokens* (and the forced *prefix_tokens*)."""
+        if self.table.device != src_tokens.device:
+            self.table = self.table.to(src_tokens.device)
+            self.always = self.always.to(src_tokens.device)
+        candidates = [self.always, self.table[src_tokens.view(-1)].view(-1)]
+        if prefix_tokens is not None:
+            candidates.append(prefix_tokens.view(-1))
+        return torch.unique(torch.cat(candidates), sorted=True)
@@ -24,6 +24,7 @@ class BaseFairseqModel(nn.Module):
     def __init__(self):
         super().__init__()
         self._is_generation_fast = False
+        self._is_quantized = False
 
     @staticmethod
     def add_args(parser):
@@ -130,6 +131,33 @@ class BaseFairseqModel(nn.Module):
         self.eval()
         self.train = train
 
+    def quantize_(self):
+        """Apply dynamic int8 quantization to the linear and LSTM layers of
+        the model, for faster inference on CPU.
+
+        The weights are quantized once, the activations on the fly for each
+        batch. Submodules can implement ``prepare_for_quantization_`` to
+        adapt to quantized layers, e.g., to move an output projection that
+        uses the embedding matrix into its own linear layer. The quantized
+        model can only run on CPU and is not trainable.
+        """
+        if self._is_quantized:
+            return  # only apply once
+        self._is_quantized = True
+
+        seen = set()
+
+        def apply_prepare_for_quantization_(module):
+            if module != self and hasattr(module, 'prepare_for_quantization_') \
+                    and module not in seen:
+                seen.add(module)
+                module.prepare_for_quantization_()
+
+        self.apply(apply_prepare_for_quantization_)
+        torch.quantization.quantize_dynamic(
+            self, {nn.Linear, nn.LSTM, nn.LSTMCell}, dtype=torch.qint8, inplace=True,
+        )
+
     def prepare_for_onnx_export_(self, **kwargs):
         """Make model exportable via ONNX trace."""
         seen = set()
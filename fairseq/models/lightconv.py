@@ -317,6 +317,7 @@ class LightConvDecoder(FairseqIncrementalDecoder):
         ])
 
         self.adaptive_softmax = None
+        self.output_projection = None
 
         self.project_out_dim = Linear(embed_dim, output_embed_dim, bias=False) \
             if embed_dim != output_embed_dim and not args.tie_adaptive_weights else None
@@ -404,10 +405,10 @@ class LightConvDecoder(FairseqIncrementalDecoder):
 
         if self.adaptive_softmax is None:
             # project back to size of vocabulary
-            if self.share_input_output_embed:
-                x = F.linear(x, self.embed_tokens.weight)
+            if self.output_projection is not None:
+                x = self.output_projection(x)
             else:
-                x = F.linear(x, self.embed_out)
+                x = F.linear(x, self.output_weight())
 
         return x, {'attn': attn, 'inner_states': inner_states}
 
@@ -417,6 +418,25 @@ class LightConvDecoder(FairseqIncrementalDecoder):
             return self.max_target_positions
         return min(self.max_target_positions, self.embed_positions.max_positions())
 
+    def output_weight(self):
+        """The weight matrix of the output projection; once the model is
+        quantized (see :func:`~fairseq.models.BaseFairseqModel.quantize_`),
+        the dequantized weights of :attr:`output_projection`."""
+        if self.output_projection is not None:
+            weight = self.output_projection.weight
+            # dynamically quantized linear layers return their int8 weights
+            return weight().dequantize() if callable(weight) else weight
+        if self.share_input_output_embed:
+            return self.embed_tokens.weight
+        return self.embed_out
+
+    def prepare_for_quantization_(self):
+        if self.adaptive_softmax is None:
+            # see TransformerDecoder.prepare_for_quantization_
+            weight = self.output_weight()
+            self.output_projection = nn.Linear(weight.size(1), weight.size(0), bias=False)
+            self.output_projection.weight = weight
+
     def buffered_future_mask(self, tensor):
         dim = tensor.size(0)
         if not hasattr(self, '_future_mask') or self._future_mask is None or self._future_mask.device != tensor.device:
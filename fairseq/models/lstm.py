@@ -440,10 +440,10 @@ class LSTMDecoder(FairseqIncrementalDecoder):
             if hasattr(self, 'additional_fc'):
                 x = self.additional_fc(x)
                 x = F.dropout(x, p=self.dropout_out, training=self.training)
-            if self.share_input_output_embed:
-                x = F.linear(x, self.embed_tokens.weight)
-            else:
+            if hasattr(self, 'fc_out'):
                 x = self.fc_out(x)
+            else:
+                x = F.linear(x, self.embed_tokens.weight)
         return x, attn_scores
 
     def reorder_incremental_state(self, incremental_state, new_order):
@@ -467,6 +467,13 @@ class LSTMDecoder(FairseqIncrementalDecoder):
     def make_generation_fast_(self, need_attn=False, **kwargs):
         self.need_attn = need_attn
 
+    def prepare_for_quantization_(self):
+        if self.adaptive_softmax is None and self.share_input_output_embed:
+            # a linear layer that shares the embedding matrix, so that the
+            # output projection is quantized with the other linear layers
+            self.fc_out = nn.Linear(self.embed_tokens.embedding_dim, self.embed_tokens.num_embeddings, bias=False)
+            self.fc_out.weight = self.embed_tokens.weight
+
 
 def Embedding(num_embeddings, embedding_dim, padding_idx):
     m = nn.Embedding(num_embeddings, embedding_dim, padding_idx=padding_idx)
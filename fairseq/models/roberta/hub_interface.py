@@ -3,6 +3,8 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+from typing import List
+
 import numpy as np
 import torch
 import torch.nn as nn
@@ -61,6 +63,23 @@ class RobertaHubInterface(nn.Module):
         tokens = self.task.source_dictionary.encode_line(bpe_sentence, append_eos=False)
         return tokens.long()
 
+    def encode_many(self, sentences: List[str]) -> List[torch.LongTensor]:
+        """
+        BPE-encode a batch of single sentences, equivalent to calling
+        :func:`encode` on each of them but sharing the BPE work across the
+        batch when the BPE supports it.
+        """
+        if hasattr(self.bpe, 'encode_many'):
+            bpe_sentences = self.bpe.encode_many(sentences)
+        else:
+            bpe_sentences = [self.bpe.encode(s) for s in sentences]
+        return [
+            self.task.source_dictionary.encode_line(
+                '<s> ' + bpe_sentence + ' </s>', append_eos=False
+            ).long()
+            for bpe_sentence in bpe_sentences
+        ]
+
     def decode(self, tokens: torch.LongTensor):
         assert tokens.dim() == 1
         tokens = tokens.numpy()
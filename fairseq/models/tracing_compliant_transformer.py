@@ -623,3 +623,8 @@ class TracingTransformerDecoder(FairseqIncrementalDecoder):
             state_dict[version_key] = torch.Tensor([1])
 
         return state_dict
+
+
+@register_model_architecture('tracing_transformer', 'tracing_transformer')
+def tracing_transformer(args):
+    base_architecture(args)
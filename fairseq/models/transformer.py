@@ -19,6 +19,7 @@ from fairseq.models import (
 )
 from fairseq.modules import (
     AdaptiveSoftmax,
+    chunked_label_smoothed_nll_loss,
     LayerNorm,
     PositionalEmbedding,
     SinusoidalPositionalEmbedding,
@@ -29,6 +30,7 @@ import random
 
 DEFAULT_MAX_SOURCE_POSITIONS = 1024
 DEFAULT_MAX_TARGET_POSITIONS = 1024
+DEFAULT_VOCAB_CHUNK = 8192
 
 
 @register_model('transformer')
@@ -136,6 +138,9 @@ class TransformerModel(FairseqEncoderDecoderModel):
                             help='LayerDrop probability for encoder')
         parser.add_argument('--decoder-layerdrop', type=float, metavar='D', default=0,
                             help='LayerDrop probability for decoder')
+        parser.add_argument('--checkpoint-activations', type=int, metavar='N', default=0,
+                            help='recompute the activations of every N-th encoder and decoder layer '
+                                 'during the backward pass instead of storing them (0 disables)')
         parser.add_argument('--encoder-layers-to-keep', default=None,
                             help='which layers to *keep* when pruning as a comma-separated list')
         parser.add_argument('--decoder-layers-to-keep', default=None,
@@ -210,6 +215,14 @@ class TransformerModel(FairseqEncoderDecoderModel):
             no_encoder_attn=getattr(args, 'no_cross_attention', False),
         )
 
+    def forward(self, src_tokens, src_lengths, prev_output_tokens, features_only=False, **kwargs):
+        """Same as :meth:`FairseqEncoderDecoderModel.forward`, except that
+        with *features_only* the decoder returns its features instead of
+        applying the output layer (see
+        :meth:`TransformerDecoder.get_label_smoothed_nll_loss`)."""
+        encoder_out = self.encoder(src_tokens, src_lengths=src_lengths, **kwargs)
+        return self.decoder(prev_output_tokens, encoder_out=encoder_out, features_only=features_only, **kwargs)
+
 
 @register_model('transformer_align')
 class TransformerAlignModel(TransformerModel):
@@ -244,9 +257,13 @@ class TransformerAlignModel(TransformerModel):
         transformer_model = TransformerModel.build_model(args, task)
         return TransformerAlignModel(transformer_model.encoder, transformer_model.decoder, args)
 
-    def forward(self, src_tokens, src_lengths, prev_output_tokens):
+    def forward(self, src_tokens, src_lengths, prev_output_tokens, features_only=False):
+        encoder_out = self.encoder(src_tokens, src_lengths)
+        return self.forward_decoder(prev_output_tokens, encoder_out, features_only=features_only)
+
+    def extract_features(self, src_tokens, src_lengths, prev_output_tokens):
         encoder_out = self.encoder(src_tokens, src_lengths)
-        return self.forward_decoder(prev_output_tokens, encoder_out)
+        return self.forward_decoder(prev_output_tokens, encoder_out, features_only=True)
 
     def forward_decoder(
         self,
@@ -260,6 +277,7 @@ class TransformerAlignModel(TransformerModel):
         decoder_out = self.decoder(
             prev_output_tokens,
             encoder_out,
+            features_only=features_only,
             **attn_args,
             **extra_args,
         )
@@ -291,6 +309,7 @@ class TransformerEncoder(FairseqEncoder):
 
         self.dropout = args.dropout
         self.encoder_layerdrop = args.encoder_layerdrop
+        self.checkpoint_activations = getattr(args, 'checkpoint_activations', 0)
 
         embed_dim = embed_tokens.embedding_dim
         self.padding_idx = embed_tokens.padding_idx
@@ -361,11 +380,16 @@ class TransformerEncoder(FairseqEncoder):
         encoder_states = [] if return_all_hiddens else None
 
         # encoder layers
-        for layer in self.layers:
+        for idx, layer in enumerate(self.layers):
             # add LayerDrop (see https://arxiv.org/abs/1909.11556 for description)
             dropout_probability = random.uniform(0, 1)
             if not self.training or (dropout_probability > self.encoder_layerdrop):
-                x = layer(x, encoder_padding_mask)
+                if utils.should_checkpoint(self, idx, self.checkpoint_activations):
+                    x = utils.checkpoint_activations(
+                        lambda x, layer=layer: layer(x, encoder_padding_mask), x,
+                    )
+                else:
+                    x = layer(x, encoder_padding_mask)
                 if return_all_hiddens:
                     encoder_states.append(x)
 
@@ -456,6 +480,7 @@ class TransformerDecoder(FairseqIncrementalDecoder):
 
         self.dropout = args.dropout
         self.decoder_layerdrop = args.decoder_layerdrop
+        self.checkpoint_activations = getattr(args, 'checkpoint_activations', 0)
         self.share_input_output_embed = args.share_decoder_input_output_embed
 
         input_embed_dim = embed_tokens.embedding_dim
@@ -485,6 +510,8 @@ class TransformerDecoder(FairseqIncrementalDecoder):
         ])
 
         self.adaptive_softmax = None
+        self.shortlist_weight = None
+        self.output_projection = None
 
         self.project_out_dim = Linear(embed_dim, self.output_embed_dim, bias=False) \
             if embed_dim != self.output_embed_dim and not args.tie_adaptive_weights else None
@@ -568,9 +595,6 @@ class TransformerDecoder(FairseqIncrementalDecoder):
                 - the decoder's features of shape `(batch, tgt_len, embed_dim)`
                 - a dictionary with any model-specific outputs
         """
-        if alignment_layer is None:
-            alignment_layer = len(self.layers) - 1
-
         # embed positions
         positions = self.embed_positions(
             prev_output_tokens,
@@ -582,8 +606,43 @@ class TransformerDecoder(FairseqIncrementalDecoder):
             if positions is not None:
                 positions = positions[:, -1:]
 
+        self_attn_padding_mask = prev_output_tokens.eq(self.padding_idx)
+        if not self_attn_padding_mask.any() and not self.cross_self_attention:
+            self_attn_padding_mask = None
+
+        return self._extract_features(
+            prev_output_tokens,
+            positions,
+            encoder_out,
+            incremental_state,
+            self_attn_padding_mask,
+            future_mask=incremental_state is None and not full_context_alignment,
+            alignment_layer=alignment_layer,
+            alignment_heads=alignment_heads,
+        )
+
+    def _extract_features(
+        self,
+        tokens,
+        positions,
+        encoder_out,
+        incremental_state,
+        self_attn_padding_mask,
+        future_mask=True,
+        cache_len=0,
+        alignment_layer=None,
+        alignment_heads=None,
+    ):
+        """Run *tokens* (with their positional embeddings *positions*)
+        through the decoder layers; shared by :func:`extract_features` and
+        :func:`forward_stream`. If *future_mask* is set, every position only
+        attends to itself, to the previous positions and to *cache_len*
+        cached positions."""
+        if alignment_layer is None:
+            alignment_layer = len(self.layers) - 1
+
         # embed tokens and positions
-        x = self.embed_scale * self.embed_tokens(prev_output_tokens)
+        x = self.embed_scale * self.embed_tokens(tokens)
 
         if self.project_in_dim is not None:
             x = self.project_in_dim(x)
@@ -595,9 +654,12 @@ class TransformerDecoder(FairseqIncrementalDecoder):
         # B x T x C -> T x B x C
         x = x.transpose(0, 1)
 
-        self_attn_padding_mask = prev_output_tokens.eq(self.padding_idx)
-        if not self_attn_padding_mask.any() and not self.cross_self_attention:
-            self_attn_padding_mask = None
+        if future_mask:
+            self_attn_mask = self.buffered_future_mask(x)
+            if cache_len > 0:
+                self_attn_mask = torch.cat([x.new_zeros(x.size(0), cache_len), self_attn_mask], dim=1)
+        else:
+            self_attn_mask = None
 
         # decoder layers
         attn = None
@@ -610,24 +672,26 @@ class TransformerDecoder(FairseqIncrementalDecoder):
                 else:
                     encoder_state = encoder_out['encoder_out']
 
-            if incremental_state is None and not full_context_alignment:
-                self_attn_mask = self.buffered_future_mask(x)
-            else:
-                self_attn_mask = None
-
             # add LayerDrop (see https://arxiv.org/abs/1909.11556 for description)
             dropout_probability = random.uniform(0, 1)
             if not self.training or (dropout_probability > self.decoder_layerdrop):
-                x, layer_attn = layer(
-                    x,
-                    encoder_state,
-                    encoder_out['encoder_padding_mask'] if encoder_out is not None else None,
-                    incremental_state,
-                    self_attn_mask=self_attn_mask,
-                    self_attn_padding_mask=self_attn_padding_mask,
-                    need_attn=(idx == alignment_layer),
-                    need_head_weights=(idx == alignment_layer),
-                )
+                def run_layer(x, *encoder_state, layer=layer, idx=idx):
+                    return layer(
+                        x,
+                        encoder_state[0] if encoder_state else None,
+                        encoder_out['encoder_padding_mask'] if encoder_out is not None else None,
+                        incremental_state,
+                        self_attn_mask=self_attn_mask,
+                        self_attn_padding_mask=self_attn_padding_mask,
+                        need_attn=(idx == alignment_layer),
+                        need_head_weights=(idx == alignment_layer),
+                    )
+
+                layer_inputs = [x] if encoder_state is None else [x, encoder_state]
+                if incremental_state is None and utils.should_checkpoint(self, idx, self.checkpoint_activations):
+                    x, layer_attn = utils.checkpoint_activations(run_layer, *layer_inputs)
+                else:
+                    x, layer_attn = run_layer(*layer_inputs)
                 inner_states.append(x)
                 if layer_attn is not None and idx == alignment_layer:
                     attn = layer_attn.float()
@@ -650,17 +714,140 @@ class TransformerDecoder(FairseqIncrementalDecoder):
 
         return x, {'attn': attn, 'inner_states': inner_states}
 
+    def forward_stream(self, tokens, incremental_state, max_context, features_only=False):
+        """Decode a block of *tokens* that continues the token streams whose
+        self-attention keys/values are cached in *incremental_state* (one
+        stream per batch row), so that every token goes through the layers
+        only once. Afterwards at most *max_context* positions are kept in
+        the cache for the next block.
+
+        Only supported for decoders without encoder attention (i.e., LMs).
+        The positions of *tokens* continue after the previous tokens of their
+        stream, also once the cache was trimmed, so that cached keys/values
+        keep the positions they were computed with. With learned positional
+        embeddings a stream can't be longer than :func:`max_positions`.
+
+        Args:
+            tokens (LongTensor): right-padded block of shape `(batch, tgt_len)`;
+                the batch may shrink (but not grow) between blocks
+            incremental_state (dict): cache carried across blocks
+            max_context (int): number of cached positions to keep
+
+        Returns:
+            the same outputs as :func:`forward`
+        """
+        assert all(layer.encoder_attn is None for layer in self.layers), \
+            'forward_stream is only supported by decoder-only models'
+        bsz = tokens.size(0)
+
+        cache_len = 0
+        saved_state = self.layers[0].self_attn._get_input_buffer(incremental_state)
+        if 'prev_key' in saved_state:
+            if saved_state['prev_key'].size(0) > bsz:
+                # streams that ended are dropped from the end of the batch
+                self.reorder_incremental_state(
+                    incremental_state, torch.arange(bsz, device=tokens.device),
+                )
+            cache_len = saved_state['prev_key'].size(2)
+
+        # number of tokens decoded so far in every stream
+        offset = utils.get_incremental_state(self, incremental_state, 'stream_offset')
+        offset = tokens.new_zeros(bsz) if offset is None else offset[:bsz]
+        mask = tokens.ne(self.padding_idx).long()
+
+        positions = None
+        if self.embed_positions is not None:
+            positions = (offset.unsqueeze(1) + torch.cumsum(mask, dim=1)) * mask + self.padding_idx
+            if isinstance(self.embed_positions, SinusoidalPositionalEmbedding):
+                positions = self.embed_positions(tokens, positions=positions)
+            else:
+                assert positions.max().item() < self.embed_positions.num_embeddings, (
+                    'a stream is longer than the {} learned positions of the decoder, '
+                    'evaluate it with --context-window only'.format(self.embed_positions.max_positions())
+                )
+                positions = F.embedding(positions, self.embed_positions.weight, self.padding_idx)
+        utils.set_incremental_state(self, incremental_state, 'stream_offset', offset + mask.sum(dim=1))
+
+        # the padding mask is always given so that it can be cached with the keys
+        x, extra = self._extract_features(
+            tokens,
+            positions,
+            None,
+            incremental_state,
+            tokens.eq(self.padding_idx),
+            cache_len=cache_len,
+        )
+
+        # only keep the last max_context positions
+        for layer in self.layers:
+            saved_state = layer.self_attn._get_input_buffer(incremental_state)
+            start = max(0, saved_state['prev_key'].size(2) - max_context)
+            saved_state['prev_key'] = saved_state['prev_key'][:, :, start:]
+            saved_state['prev_value'] = saved_state['prev_value'][:, :, start:]
+            saved_state['prev_key_padding_mask'] = saved_state['prev_key_padding_mask'][:, start:]
+            layer.self_attn._set_input_buffer(incremental_state, saved_state)
+
+        if not features_only:
+            x = self.output_layer(x)
+        return x, extra
+
+    def set_output_shortlist(self, candidates):
+        """Project the features onto the vocabulary entries *candidates*
+        only (see :class:`~fairseq.lexical_shortlist.LexicalShortlist`), or
+        onto the whole vocabulary if None."""
+        if candidates is None:
+            self.shortlist_weight = None
+            return
+        assert self.adaptive_softmax is None, 'a shortlist is not supported with adaptive softmax'
+        self.shortlist_weight = self.output_weight().index_select(0, candidates)
+
+    def output_weight(self):
+        """The weight matrix of the output projection; once the model is
+        quantized (see :func:`~fairseq.models.BaseFairseqModel.quantize_`),
+        the dequantized weights of :attr:`output_projection`."""
+        if self.output_projection is not None:
+            weight = self.output_projection.weight
+            # dynamically quantized linear layers return their int8 weights
+            return weight().dequantize() if callable(weight) else weight
+        if self.share_input_output_embed:
+            return self.embed_tokens.weight
+        return self.embed_out
+
     def output_layer(self, features, **kwargs):
         """Project features to the vocabulary size."""
+        if self.shortlist_weight is not None:
+            return F.linear(features, self.shortlist_weight)
         if self.adaptive_softmax is None:
             # project back to size of vocabulary
-            if self.share_input_output_embed:
-                return F.linear(features, self.embed_tokens.weight)
-            else:
-                return F.linear(features, self.embed_out)
+            if self.output_projection is not None:
+                return self.output_projection(features)
+            return F.linear(features, self.output_weight())
         else:
             return features
 
+    def prepare_for_quantization_(self):
+        if self.adaptive_softmax is None:
+            # a linear layer that shares the output weights, so that it is
+            # quantized with the other linear layers
+            weight = self.output_weight()
+            self.output_projection = nn.Linear(weight.size(1), weight.size(0), bias=False)
+            self.output_projection.weight = weight
+
+    def get_target_log_probs(self, features, target, vocab_chunk=DEFAULT_VOCAB_CHUNK):
+        """Log-probabilities of *target* given the decoder *features*,
+        without materializing the output distribution over the vocabulary."""
+        if self.adaptive_softmax is not None:
+            return self.adaptive_softmax.get_target_log_prob(features, target).float()
+        return utils.chunked_target_log_probs(features, self.output_weight(), target, vocab_chunk)
+
+    def get_label_smoothed_nll_loss(self, features, target, epsilon, vocab_chunk=DEFAULT_VOCAB_CHUNK):
+        """Summed label-smoothed NLL loss of *target* given the decoder
+        *features* (N x C), computed by
+        :class:`~fairseq.modules.ChunkedLabelSmoothedNLLLoss` without
+        materializing the log-probabilities over the vocabulary."""
+        assert self.adaptive_softmax is None, 'the chunked loss does not support adaptive softmax'
+        return chunked_label_smoothed_nll_loss(features, self.output_weight(), target, epsilon, vocab_chunk)
+
     def max_positions(self):
         """Maximum output length supported by the decoder."""
         if self.embed_positions is None:
@@ -103,6 +103,9 @@ class TransformerLanguageModel(FairseqLanguageModel):
                             help='LayerDrop probability for decoder')
         parser.add_argument('--decoder-layers-to-keep', default=None,
                             help='which layers to *keep* when pruning as a comma-separated list')
+        parser.add_argument('--checkpoint-activations', type=int, metavar='N', default=0,
+                            help='recompute the activations of every N-th decoder layer '
+                                 'during the backward pass instead of storing them (0 disables)')
         # fmt: on
 
     @classmethod
@@ -186,6 +186,37 @@ class Wav2VecModel(BaseFairseqModel):
 
         return result
 
+    def extract_features(self, source, lengths=None):
+        """Computes the features (``z``) and context vectors (``c``) of a
+        right-padded batch of waveforms.
+
+        Args:
+            source (FloatTensor): waveforms of shape `(batch, samples)`
+            lengths (LongTensor, optional): number of samples of each waveform
+                (default: no padding)
+
+        Returns:
+            tuple:
+                - features of shape `(batch, dim, frames)`
+                - context vectors of shape `(batch, agg_dim, frames)`
+                - the number of frames of each waveform
+
+            Frames within the lengths are computed as if each waveform were
+            processed on its own.
+        """
+        if lengths is None:
+            lengths = source.new_full((source.size(0), ), source.size(1), dtype=torch.long)
+        z, lengths = self.feature_extractor.forward_padded(source, lengths)
+        if isinstance(self.feature_aggregator, ConvAggegator):
+            c, lengths = self.feature_aggregator.forward_padded(z, lengths)
+        else:
+            # the GRU aggregator treats the first dimension as time, so
+            # sequences are aggregated one by one
+            c = z.new_zeros(z.size(0), self.feature_aggregator[1].hidden_size, z.size(2))
+            for i, length in enumerate(lengths.tolist()):
+                c[i, :, :length] = self.feature_aggregator(z[i:i + 1, :, :length])[0]
+        return z, c, lengths
+
     def upgrade_state_dict_named(self, state_dict, name):
         super().upgrade_state_dict_named(state_dict, name)
 
@@ -254,6 +285,44 @@ def norm_block(is_layer_norm, dim, affine=True):
     return mod
 
 
+def masked_group_norm(norm, x, lengths):
+    """Applies the :class:`torch.nn.GroupNorm` *norm* to the right-padded batch
+    *x* of shape `(batch, channels, time)`, computing the statistics of each
+    sequence over its first *lengths* time steps only."""
+    bsz, dim, tsz = x.size()
+    groups = norm.num_groups
+    mask = torch.arange(tsz, device=x.device)[None, :] >= lengths[:, None]
+    mask = mask.view(bsz, 1, 1, tsz)
+    x_ = x.float().view(bsz, groups, dim // groups, tsz)
+    count = (lengths.float() * (dim // groups)).clamp(min=1).view(bsz, 1, 1, 1)
+    mean = x_.masked_fill(mask, 0).sum(dim=(2, 3), keepdim=True) / count
+    var = (x_ - mean).masked_fill(mask, 0).pow(2).sum(dim=(2, 3), keepdim=True) / count
+    output = ((x_ - mean) / torch.sqrt(var + norm.eps)).view(bsz, dim, tsz)
+    if norm.weight is not None:
+        output = output * norm.weight.float().view(1, dim, 1) + norm.bias.float().view(1, dim, 1)
+    return output.type_as(x)
+
+
+def padded_forward(block, x, lengths):
+    """Runs the modules of *block* on a right-padded batch *x* of shape
+    `(batch, channels, time)` and returns the output and its lengths."""
+    for module in block:
+        if isinstance(module, nn.GroupNorm):
+            x = masked_group_norm(module, x, lengths)
+            continue
+        x = module(x)
+        if isinstance(module, nn.Conv1d):
+            assert module.padding[0] == 0, 'padded convolutions are not supported'
+            lengths = (lengths - module.dilation[0] * (module.kernel_size[0] - 1) - 1) // module.stride[0] + 1
+        elif isinstance(module, ZeroPad1d):
+            assert module.pad_right == 0, 'right padding is not supported'
+            lengths = lengths + module.pad_left
+        elif isinstance(module, nn.ReplicationPad1d):
+            assert module.padding[1] == 0, 'right padding is not supported'
+            lengths = lengths + module.padding[0]
+    return x, lengths
+
+
 class ConvFeatureExtractionModel(nn.Module):
     def __init__(self, conv_layers, dropout, log_compression, skip_connections, residual_scale, non_affine_group_norm):
         super().__init__()
@@ -297,6 +366,28 @@ class ConvFeatureExtractionModel(nn.Module):
 
         return x
 
+    def forward_padded(self, x, lengths):
+        """Like :func:`forward`, for a right-padded batch with *lengths*."""
+        x = x.unsqueeze(1)
+
+        for conv in self.conv_layers:
+            residual, residual_lengths = x, lengths
+            x, lengths = padded_forward(conv, x, lengths)
+            if self.skip_connections and x.size(1) == residual.size(1):
+                # residual[..., ::r_tsz // tsz][..., :tsz] with the unpadded
+                # sizes of each sequence
+                step = residual_lengths // lengths.clamp(min=1)
+                index = torch.arange(x.size(2), device=x.device)[None, :] * step[:, None]
+                index = index.clamp(max=residual.size(2) - 1).unsqueeze(1).expand(-1, residual.size(1), -1)
+                x = (x + residual.gather(2, index)) * self.residual_scale
+
+        if self.log_compression:
+            x = x.abs()
+            x = x + 1
+            x = x.log()
+
+        return x, lengths
+
 
 class ZeroPad1d(nn.Module):
     def __init__(self, pad_left, pad_right):
@@ -356,6 +447,18 @@ class ConvAggegator(nn.Module):
                 x = (x + residual) * self.residual_scale
         return x
 
+    def forward_padded(self, x, lengths):
+        """Like :func:`forward`, for a right-padded batch with *lengths*."""
+        for rproj, conv in zip(self.residual_proj, self.conv_layers):
+            residual = x
+            x, out_lengths = padded_forward(conv, x, lengths)
+            if self.skip_connections:
+                if rproj is not None:
+                    residual = rproj(residual)
+                x = (x + residual) * self.residual_scale
+            lengths = out_lengths
+        return x, lengths
+
 
 class Wav2VecPredictionsModel(nn.Module):
     def __init__(self, in_dim, out_dim, prediction_steps, n_negatives, cross_sample_negatives, sample_distance,
@@ -372,11 +475,11 @@ class Wav2VecPredictionsModel(nn.Module):
         self.balanced_classes = balanced_classes
 
     def sample_negatives(self, y):
+        """Samples the negatives for every time step of *y* (B x C x T) and
+        returns their indices into the flattened (B x T) time steps, of shape
+        B x N x T."""
         bsz, fsz, tsz = y.shape
 
-        y = y.transpose(0, 1)  # BCT -> CBT
-        y = y.contiguous().view(fsz, -1)  # CBT => C(BxT)
-
         if self.cross_sample_negatives:
             high = tsz * bsz
             assert self.sample_distance is None, 'sample distance is not supported with cross sampling'
@@ -392,41 +495,54 @@ class Wav2VecPredictionsModel(nn.Module):
                               device=neg_idxs.device, dtype=neg_idxs.dtype)])
 
         if not self.cross_sample_negatives:
-            for i in range(1, bsz):
-                neg_idxs[i] += i * high
+            neg_idxs += torch.arange(bsz, dtype=neg_idxs.dtype).unsqueeze(1) * high
 
-        negs = y[..., neg_idxs.view(-1)]
-        negs = negs.view(fsz, bsz, self.n_negatives, tsz).permute(2, 1, 0, 3)  # to NxBxCxT
-
-        return negs
+        return neg_idxs.view(bsz, self.n_negatives, tsz).to(y.device)
 
     def forward(self, x, y):
-        negatives = self.sample_negatives(y)
-        y = y.unsqueeze(0)
-        targets = torch.cat([y, negatives], dim=0)
+        bsz, dim, tsz = y.shape
+        copies = self.n_negatives + 1
+
+        # gather the positive and the negatives of each time step with a single
+        # index_select, into a (B x T) x (1 + N) x C buffer
+        neg_idxs = self.sample_negatives(y)
+        idxs = torch.cat([
+            torch.arange(bsz * tsz, device=y.device).view(bsz, 1, tsz),
+            neg_idxs,
+        ], dim=1).transpose(1, 2).reshape(-1)
+        targets = y.transpose(1, 2).reshape(bsz * tsz, dim).index_select(0, idxs)
+        targets = targets.view(bsz * tsz, copies, dim)
 
         x = x.unsqueeze(-1)
         x = self.project_to_steps(x)  # BxCxTxS
         x = self.dropout(x)
-        x = x.unsqueeze(0).expand(targets.size(0), -1, -1, -1, -1)
+        steps = min(x.size(-1), tsz - self.offset)
+        x = x.permute(0, 2, 3, 1).contiguous().view(bsz * tsz, -1, dim)  # (BxT)xSxC
+
+        # the prediction of step i at position p is compared with the targets
+        # at p + offset + i; on the flattened time steps these are contiguous
+        # slices (positions that cross into the next sequence are dropped)
+        predictions = []
+        for i in range(steps):
+            offset = i + self.offset
+            num = bsz * tsz - offset
+            logits = torch.bmm(targets[offset:], x[:num, i].unsqueeze(-1))  # num x (1 + N) x 1
+            logits = F.pad(logits.view(num, copies), (0, 0, 0, offset))
+            logits = logits.view(bsz, tsz, copies)[:, :tsz - offset]
+            predictions.append(logits.permute(2, 0, 1).flatten())
+        predictions = torch.cat(predictions)
 
-        copies, bsz, dim, tsz, steps = x.shape
-        steps = min(steps, tsz - self.offset)
-        predictions = x.new(bsz * copies * (tsz - self.offset + 1) * steps - ((steps + 1) * steps // 2) * copies * bsz)
         labels = torch.zeros_like(predictions)
         weights = torch.full_like(labels, 1 / self.n_negatives) if self.balanced_classes else None
 
-        start = end = 0
+        start = 0
         for i in range(steps):
-            offset = i + self.offset
-            end = start + (tsz - offset) * bsz * copies
-            pos_num = (end - start) // copies
-            predictions[start:end] = (x[..., :-offset, i] * targets[..., offset:]).sum(dim=2).flatten()
+            pos_num = (tsz - i - self.offset) * bsz
             labels[start:start + pos_num] = 1.
             if weights is not None:
                 weights[start:start + pos_num] = 1.
-            start = end
-        assert end == predictions.numel(), '{} != {}'.format(end, predictions.numel())
+            start += pos_num * copies
+        assert start == predictions.numel(), '{} != {}'.format(start, predictions.numel())
 
         if weights is not None:
             labels = (labels, weights)
@@ -7,6 +7,7 @@ from .adaptive_input import AdaptiveInput
 from .adaptive_softmax import AdaptiveSoftmax
 from .beamable_mm import BeamableMM
 from .character_token_embedder import CharacterTokenEmbedder
+from .chunked_label_smoothed_nll_loss import ChunkedLabelSmoothedNLLLoss, chunked_label_smoothed_nll_loss
 from .conv_tbc import ConvTBC
 from .downsampled_multihead_attention import DownsampledMultiHeadAttention
 from .dynamic_convolution import DynamicConv, DynamicConv1dTBC
@@ -34,6 +35,8 @@ __all__ = [
     'AdaptiveSoftmax',
     'BeamableMM',
     'CharacterTokenEmbedder',
+    'ChunkedLabelSmoothedNLLLoss',
+    'chunked_label_smoothed_nll_loss',
     'ConvTBC',
     'DownsampledMultiHeadAttention',
     'DynamicConv1dTBC',
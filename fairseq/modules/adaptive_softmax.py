@@ -3,6 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import math
 import operator
 import functools
 
@@ -204,3 +205,81 @@ class AdaptiveSoftmax(nn.Module):
 
         log_probs = log_probs.view(bsz, length, -1)
         return log_probs
+
+    def get_pruned_log_prob(self, input, k):
+        """
+        Computes the log probabilities of the words of the head and of the
+        tail clusters that may hold one of the *k* most likely words of each
+        position, given a 3D tensor of hidden vectors. The log probabilities
+        of the words of the other clusters are set to -inf.
+
+        The log probability of a word of a tail cluster is bounded by the log
+        probability of its cluster in the head, so a cluster is only computed
+        for the positions where this bound exceeds the k-th best log
+        probability found so far. The *k* most likely words of each position
+        are therefore exact, as are the log probabilities of all the words of
+        the head.
+        """
+
+        bsz, length, dim = input.size()
+        input = input.contiguous().view(-1, dim)
+
+        head_lprobs = self.lsm(self.head(input))
+        log_probs = head_lprobs.new_full((input.size(0), self.vocab_size), -math.inf)
+        log_probs[:, :self.cutoff[0]] = head_lprobs[:, :self.cutoff[0]]
+        tail_priors = head_lprobs[:, self.cutoff[0]:]
+
+        # the k-th best log probability of each position (a lower bound of it
+        # until all the clusters that may hold better words are computed)
+        if k <= self.cutoff[0]:
+            kth_best = head_lprobs[:, :self.cutoff[0]].topk(k, dim=1)[0][:, -1]
+        else:
+            kth_best = head_lprobs.new_full((input.size(0),), -math.inf)
+
+        for i in range(len(self.tail)):
+            start = self.cutoff[i]
+            end = self.cutoff[i + 1]
+
+            idxs = tail_priors[:, i].gt(kth_best).nonzero().squeeze(1)
+            if idxs.numel() == 0:
+                continue
+            tail_lprobs = self.lsm(self.tail[i](input[idxs])).add_(tail_priors[idxs, i, None])
+            log_probs[idxs, start:end] = tail_lprobs
+            if k <= end - start:
+                kth_best[idxs] = torch.max(kth_best[idxs], tail_lprobs.topk(k, dim=1)[0][:, -1])
+
+        log_probs = log_probs.view(bsz, length, -1)
+        return log_probs
+
+    def get_topk_log_prob(self, input, k):
+        """
+        Returns the *k* largest log probabilities and the indices of the
+        corresponding words for each position of a 3D tensor of hidden
+        vectors, only computing the tail clusters that may hold them (see
+        :func:`get_pruned_log_prob`).
+        """
+
+        return self.get_pruned_log_prob(input, k).topk(k, dim=-1)
+
+    def get_target_log_prob(self, input, target):
+        """
+        Computes the log probabilities of the target words only, given a 3D
+        tensor of hidden vectors, without building the distribution over the
+        whole vocabulary.
+        """
+
+        bsz, length, dim = input.size()
+        input = input.contiguous().view(-1, dim)
+
+        new_target, target_idxs = self.adapt_target(target)
+
+        head_y = self.head(input)
+        log_probs = self.lsm(head_y).gather(1, new_target[0].unsqueeze(1)).squeeze(1)
+
+        for i in range(len(self.tail)):
+            if target_idxs[i] is not None:
+                idxs = target_idxs[i]
+                tail_log_probs = self.lsm(self.tail[i](input[idxs]))
+                log_probs.index_add_(0, idxs, tail_log_probs.gather(1, new_target[i + 1].unsqueeze(1)).squeeze(1))
+
+        return log_probs.view(bsz, length)
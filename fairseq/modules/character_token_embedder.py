@@ -3,6 +3,8 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import os
+
 import torch
 import torch.nn.functional as F
 
@@ -52,6 +54,7 @@ class CharacterTokenEmbedder(torch.nn.Module):
 
         assert vocab is not None or char_inputs, "vocab must be set if not using char inputs"
         self.vocab = None
+        self.frozen_embeddings = None
         if vocab is not None:
             self.set_vocab(vocab, max_char_len)
 
@@ -81,6 +84,61 @@ class CharacterTokenEmbedder(torch.nn.Module):
 
         self.vocab = vocab
         self.word_to_char = word_to_char
+        self.frozen_embeddings = None
+
+    @torch.no_grad()
+    def freeze(self, cache_path=None, batch_size=1024):
+        """Precompute the embeddings of the whole vocabulary, so that forward
+        becomes a lookup into this table until the vocabulary changes or the
+        module is put in training mode.
+
+        If *cache_path* is given, the table is read from it if it was
+        computed for the same parameters and vocabulary, and written to it
+        otherwise.
+        """
+        assert not self.char_inputs, 'cannot freeze the embeddings of character inputs'
+        self.frozen_embeddings = None
+        state_dict = {k: v.cpu() for k, v in self.state_dict().items()}
+
+        if cache_path is not None and os.path.exists(cache_path):
+            cache = torch.load(cache_path, map_location='cpu')
+            if (
+                torch.equal(cache['word_to_char'], self.word_to_char)
+                and cache['state_dict'].keys() == state_dict.keys()
+                and all(torch.equal(cache['state_dict'][k], v) for k, v in state_dict.items())
+            ):
+                self.frozen_embeddings = cache['table']
+                return
+
+        device = self.projection.weight.device
+        words = torch.arange(len(self.vocab), device=device)
+        table = torch.cat([
+            self(words[i:i + batch_size].unsqueeze(0))[0]
+            for i in range(0, len(words), batch_size)
+        ])
+        if cache_path is not None:
+            torch.save({
+                'word_to_char': self.word_to_char,
+                'state_dict': state_dict,
+                'table': table.cpu(),
+            }, cache_path)
+        self.frozen_embeddings = table
+
+    def train(self, mode=True):
+        if mode:
+            # the parameters may change
+            self.frozen_embeddings = None
+        return super().train(mode)
+
+    def make_generation_fast_(self, char_embed_cache=None, **kwargs):
+        if not self.char_inputs:
+            self.freeze(char_embed_cache)
+
+    def prepare_for_quantization_(self):
+        # keep the (small) embedder in float, so that the frozen embeddings
+        # match the weights
+        for module in self.modules():
+            module.qconfig = None
 
     @property
     def padding_idx(self):
@@ -98,6 +156,12 @@ class CharacterTokenEmbedder(torch.nn.Module):
             self,
             input: torch.Tensor,
     ):
+        if self.frozen_embeddings is not None:
+            weight = self.projection.weight
+            if self.frozen_embeddings.device != weight.device or self.frozen_embeddings.dtype != weight.dtype:
+                self.frozen_embeddings = self.frozen_embeddings.to(weight)
+            return F.embedding(input, self.frozen_embeddings)
+
         if self.char_inputs:
             chars = input.view(-1, self.max_char_len)
             pads = chars[:, 0].eq(CHAR_PAD_IDX)
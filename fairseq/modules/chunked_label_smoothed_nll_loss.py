@@ -0,0 +1,73 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import torch
+import torch.nn.functional as F
+
+
+class ChunkedLabelSmoothedNLLLoss(torch.autograd.Function):
+    """Label-smoothed NLL loss of *target* under ``softmax(features @ weight.T)``,
+    summed over the rows of *features* (N x C).
+
+    The logits are computed for *chunk_size* rows of *weight* (V x C) at a
+    time, in both the forward and the backward pass, so neither the logits nor
+    the log-probabilities over the whole vocabulary are ever stored; the
+    gradient is computed directly from the recomputed logits as
+    ``softmax - (1 - epsilon) * one_hot(target) - epsilon / V``.
+
+    Returns the loss and the (non-differentiable) NLL loss.
+    """
+
+    @staticmethod
+    def forward(ctx, features, weight, target, epsilon, chunk_size):
+        x = features.float()
+        lse, logits_sum = None, 0.
+        for start in range(0, weight.size(0), chunk_size):
+            logits = F.linear(x, weight[start:start + chunk_size].float())
+            chunk_lse = torch.logsumexp(logits, dim=-1)
+            lse = chunk_lse if lse is None else torch.logaddexp(lse, chunk_lse)
+            logits_sum = logits_sum + logits.sum(dim=-1)
+            del logits
+        target_logits = (x * weight.index_select(0, target).float()).sum(dim=-1)
+
+        nll_loss = (lse - target_logits).sum()
+        smooth_loss = (weight.size(0) * lse - logits_sum).sum()
+        loss = (1. - epsilon) * nll_loss + epsilon / weight.size(0) * smooth_loss
+
+        ctx.save_for_backward(features, weight, target, lse)
+        ctx.epsilon = epsilon
+        ctx.chunk_size = chunk_size
+        ctx.mark_non_differentiable(nll_loss)
+        return loss, nll_loss
+
+    @staticmethod
+    def backward(ctx, grad_loss, grad_nll_loss):
+        features, weight, target, lse = ctx.saved_tensors
+        epsilon, chunk_size = ctx.epsilon, ctx.chunk_size
+        x = features.float()
+        rows = torch.arange(x.size(0), device=x.device)
+
+        grad_features = torch.zeros_like(x) if ctx.needs_input_grad[0] else None
+        grad_weight = torch.empty_like(weight) if ctx.needs_input_grad[1] else None
+        for start in range(0, weight.size(0), chunk_size):
+            w = weight[start:start + chunk_size].float()
+            grad_logits = F.linear(x, w).sub_(lse.unsqueeze(-1)).exp_().sub_(epsilon / weight.size(0))
+            in_chunk = (target >= start) & (target < start + w.size(0))
+            grad_logits[rows[in_chunk], target[in_chunk] - start] -= 1. - epsilon
+            grad_logits.mul_(grad_loss)
+            if grad_features is not None:
+                grad_features.addmm_(grad_logits, w)
+            if grad_weight is not None:
+                grad_weight[start:start + chunk_size] = grad_logits.t().mm(x)
+            del grad_logits
+
+        if grad_features is not None:
+            grad_features = grad_features.type_as(features)
+        return grad_features, grad_weight, None, None, None
+
+
+def chunked_label_smoothed_nll_loss(features, weight, target, epsilon, chunk_size):
+    """See :class:`ChunkedLabelSmoothedNLLLoss`."""
+    return ChunkedLabelSmoothedNLLLoss.apply(features, weight, target, epsilon, chunk_size)
@@ -8,7 +8,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from fairseq import utils
-from .unfold import unfold1d
+from .unfold import roll_to_ring_buffer, unfold1d
 
 
 def DynamicConv(input_size, kernel_size=1, padding_l=None, num_heads=1,
@@ -109,7 +109,9 @@ class DynamicConv1dTBC(nn.Module):
 
         if query is None:
             query = x
-        if unfold:
+        if incremental_state is not None:
+            output = self._forward_incremental(x, incremental_state, query)
+        elif unfold:
             output = self._forward_unfolded(x, incremental_state, query)
         else:
             output = self._forward_expanded(x, incremental_state, query)
@@ -134,39 +136,61 @@ class DynamicConv1dTBC(nn.Module):
             weight = self.weight_linear(query).view(T*B*H, -1)
 
         # renorm_padding is only implemented in _forward_expanded
-        assert not self.renorm_padding or incremental_state is not None
+        assert not self.renorm_padding
 
-        if incremental_state is not None:
-            input_buffer = self._get_input_buffer(incremental_state)
-            if input_buffer is None:
-                input_buffer = x.new()
-            x_unfold = torch.cat([input_buffer, x.unsqueeze(3)], dim=3)
-            if self.kernel_size > 1:
-                self._set_input_buffer(incremental_state, x_unfold[:, :, :, -self.kernel_size+1:])
-            x_unfold = x_unfold.view(T*B*H, R, -1)
-        else:
-            padding_l = self.padding_l
-            if K > T and padding_l == K-1:
-                weight = weight.narrow(1, K-T, T)
-                K, padding_l = T, T-1
-            # unfold the input: T x B x C --> T' x B x C x K
-            x_unfold = unfold1d(x, K, padding_l, 0)
-            x_unfold = x_unfold.view(T*B*H, R, K)
-
-        if self.weight_softmax and not self.renorm_padding:
+        padding_l = self.padding_l
+        if K > T and padding_l == K-1:
+            weight = weight.narrow(1, K-T, T)
+            K, padding_l = T, T-1
+        # unfold the input: T x B x C --> T' x B x C x K
+        x_unfold = unfold1d(x, K, padding_l, 0)
+        x_unfold = x_unfold.view(T*B*H, R, K)
+
+        if self.weight_softmax:
             weight = F.softmax(weight, dim=1)
         weight = weight.narrow(1, 0, K)
 
-        if incremental_state is not None:
-            weight = weight[:, -x_unfold.size(2):]
-            K = weight.size(1)
+        weight = F.dropout(weight, self.weight_dropout, training=self.training, inplace=False)
 
-        if self.weight_softmax and self.renorm_padding:
-            weight = F.softmax(weight, dim=1)
+        output = torch.bmm(x_unfold, weight.unsqueeze(2))  # T*B*H x R x 1
+        output = output.view(T, B, C)
+        return output
 
+    def _forward_incremental(self, x, incremental_state, query):
+        '''One decoding step. The last K inputs are kept in a ring buffer of
+        shape B x C x K that is written in place, and the filters are rolled
+        to the slots of the inputs instead of shifting the buffer.'''
+        T, B, C = x.size()
+        K, H = self.kernel_size, self.num_heads
+        R = C // H
+        assert T == 1 and R * H == C == self.input_size
+
+        if self.in_proj:
+            proj = self.weight_linear(x)
+            x = proj.narrow(2, 0, self.input_size)
+            weight = proj.narrow(2, self.input_size, H*K).contiguous().view(B*H, K)
+        else:
+            weight = self.weight_linear(query).view(B*H, K)
+
+        input_buffer = self._get_input_buffer(incremental_state)
+        step = self._get_buffer_step(incremental_state)
+        if input_buffer is None:
+            input_buffer = x.new_zeros(B, C, K)
+            step = 0
+            self._set_input_buffer(incremental_state, input_buffer)
+        # the slots of the future steps are still zero
+        input_buffer[:, :, step % K] = x[0]
+        self._set_buffer_step(incremental_state, step + 1)
+
+        if self.weight_softmax and self.renorm_padding and step < K - 1:
+            # only normalize over the inputs seen so far
+            weight = weight.masked_fill(torch.arange(K, device=weight.device).lt(K - 1 - step), float('-inf'))
+        if self.weight_softmax:
+            weight = F.softmax(weight, dim=1)
         weight = F.dropout(weight, self.weight_dropout, training=self.training, inplace=False)
+        weight = roll_to_ring_buffer(weight, step)
 
-        output = torch.bmm(x_unfold, weight.unsqueeze(2))  # T*B*H x R x 1
+        output = torch.bmm(input_buffer.view(B*H, R, K), weight.unsqueeze(2))  # B*H x R x 1
         output = output.view(T, B, C)
         return output
 
@@ -219,7 +243,7 @@ class DynamicConv1dTBC(nn.Module):
     def reorder_incremental_state(self, incremental_state, new_order):
         input_buffer = self._get_input_buffer(incremental_state)
         if input_buffer is not None:
-            input_buffer = input_buffer.index_select(1, new_order)
+            input_buffer = input_buffer.index_select(0, new_order)
             self._set_input_buffer(incremental_state, input_buffer)
 
     def _get_input_buffer(self, incremental_state):
@@ -228,6 +252,12 @@ class DynamicConv1dTBC(nn.Module):
     def _set_input_buffer(self, incremental_state, new_buffer):
         return utils.set_incremental_state(self, incremental_state, 'input_buffer', new_buffer)
 
+    def _get_buffer_step(self, incremental_state):
+        return utils.get_incremental_state(self, incremental_state, 'buffer_step')
+
+    def _set_buffer_step(self, incremental_state, step):
+        return utils.set_incremental_state(self, incremental_state, 'buffer_step', step)
+
     def extra_repr(self):
         s = '{}, kernel_size={}, padding_l={}, num_heads={}, weight_softmax={}, conv_bias={}, renorm_padding={}, in_proj={}'.format(
             self.input_size, self.kernel_size, self.padding_l,
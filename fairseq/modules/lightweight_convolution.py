@@ -8,7 +8,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from fairseq import utils
-from fairseq.modules.unfold import unfold1d
+from fairseq.modules.unfold import roll_to_ring_buffer, unfold1d
 
 
 def LightweightConv(input_size, kernel_size=1, padding_l=None, num_heads=1,
@@ -153,7 +153,9 @@ class LightweightConv1dTBC(nn.Module):
         '''
         unfold = unfold or (incremental_state is not None)
 
-        if unfold:
+        if incremental_state is not None:
+            output = self._forward_incremental(x, incremental_state)
+        elif unfold:
             output = self._forward_unfolded(x, incremental_state)
         else:
             output = self._forward_expanded(x, incremental_state)
@@ -174,26 +176,13 @@ class LightweightConv1dTBC(nn.Module):
         assert R * H == C == self.input_size
 
         weight = self.weight.view(H, K)
-        if incremental_state is not None:
-            input_buffer = self._get_input_buffer(incremental_state)
-            if input_buffer is None:
-                input_buffer = x.new()
-            x_unfold = torch.cat([input_buffer, x.unsqueeze(3)], dim=3)
-            if self.kernel_size > 1:
-                self._set_input_buffer(incremental_state, x_unfold[:, :, :, -self.kernel_size+1:])
-            x_unfold = x_unfold.view(T*B*H, R, -1)
-        else:
-            # unfold the input: T x B x C --> T' x B x C x K
-            x_unfold = unfold1d(x, self.kernel_size, self.padding_l, 0)
-            x_unfold = x_unfold.view(T*B*H, R, K)
+        # unfold the input: T x B x C --> T' x B x C x K
+        x_unfold = unfold1d(x, self.kernel_size, self.padding_l, 0)
+        x_unfold = x_unfold.view(T*B*H, R, K)
 
         if self.weight_softmax:
             weight = utils.softmax(weight, dim=1, onnx_trace=self.onnx_trace).type_as(weight)
 
-        if incremental_state is not None:
-            weight = weight[:, -x_unfold.size(2):]
-            K = weight.size(1)
-
         weight = weight.view(1, H, K).expand(T*B, H, K).contiguous().view(T*B*H, K, 1)
 
         weight = F.dropout(weight, self.weight_dropout, training=self.training)
@@ -201,6 +190,35 @@ class LightweightConv1dTBC(nn.Module):
         output = output.view(T, B, C)
         return output
 
+    def _forward_incremental(self, x, incremental_state):
+        '''One decoding step. The last K inputs are kept in a ring buffer of
+        shape B x C x K that is written in place, and the filters are rolled
+        to the slots of the inputs instead of shifting the buffer.'''
+        T, B, C = x.size()
+        K, H = self.kernel_size, self.num_heads
+        R = C // H
+        assert T == 1 and R * H == C == self.input_size
+
+        input_buffer = self._get_input_buffer(incremental_state)
+        step = self._get_buffer_step(incremental_state)
+        if input_buffer is None:
+            input_buffer = x.new_zeros(B, C, K)
+            step = 0
+            self._set_input_buffer(incremental_state, input_buffer)
+        # the slots of the future steps are still zero
+        input_buffer[:, :, step % K] = x[0]
+        self._set_buffer_step(incremental_state, step + 1)
+
+        weight = self.weight.view(H, K)
+        if self.weight_softmax:
+            weight = utils.softmax(weight, dim=1, onnx_trace=self.onnx_trace).type_as(weight)
+        weight = F.dropout(weight, self.weight_dropout, training=self.training)
+        weight = roll_to_ring_buffer(weight, step)
+
+        output = torch.matmul(input_buffer.view(B, H, R, K), weight.view(H, K, 1))  # B x H x R x 1
+        output = output.view(T, B, C)
+        return output
+
     def _forward_expanded(self, x, incremental_state):
         '''Turn the convolution filters into band matrices and do matrix multiplication.
         This is faster when the sequence is short, but less memory efficient.
@@ -235,7 +253,7 @@ class LightweightConv1dTBC(nn.Module):
     def reorder_incremental_state(self, incremental_state, new_order):
         input_buffer = self._get_input_buffer(incremental_state)
         if input_buffer is not None:
-            input_buffer = input_buffer.index_select(1, new_order)
+            input_buffer = input_buffer.index_select(0, new_order)
             self._set_input_buffer(incremental_state, input_buffer)
 
     def _get_input_buffer(self, incremental_state):
@@ -244,6 +262,12 @@ class LightweightConv1dTBC(nn.Module):
     def _set_input_buffer(self, incremental_state, new_buffer):
         return utils.set_incremental_state(self, incremental_state, 'input_buffer', new_buffer)
 
+    def _get_buffer_step(self, incremental_state):
+        return utils.get_incremental_state(self, incremental_state, 'buffer_step')
+
+    def _set_buffer_step(self, incremental_state, step):
+        return utils.set_incremental_state(self, incremental_state, 'buffer_step', step)
+
     def extra_repr(self):
         s = '{}, kernel_size={}, padding_l={}, num_heads={}, weight_softmax={}, bias={}'.format(
             self.input_size, self.kernel_size, self.padding_l,
@@ -66,6 +66,10 @@ class MultiheadAttention(nn.Module):
     def prepare_for_onnx_export_(self):
         self.onnx_trace = True
 
+    def prepare_for_quantization_(self):
+        # F.multi_head_attention_forward needs the float projection weights
+        self.enable_torch_version = False
+
     def reset_parameters(self):
         if self.qkv_same_dim:
             # Empirically observed the convergence to be much better with
@@ -52,10 +52,14 @@ class SinusoidalPositionalEmbedding(nn.Module):
             emb[padding_idx, :] = 0
         return emb
 
-    def forward(self, input, incremental_state=None, timestep=None, **kwargs):
-        """Input is expected to be of size [bsz x seqlen]."""
+    def forward(self, input, incremental_state=None, timestep=None, positions=None, **kwargs):
+        """Input is expected to be of size [bsz x seqlen]. The position
+        numbers of its tokens (starting at padding_idx+1) may be given as
+        *positions*."""
         bsz, seq_len = torch.onnx.operators.shape_as_tensor(input)
         max_pos = self.padding_idx + 1 + seq_len
+        if positions is not None:
+            max_pos = max(max_pos, int(positions.max()) + 1)
         if self.weights is None or max_pos > self.weights.size(0):
             # recompute/expand embeddings if needed
             self.weights = SinusoidalPositionalEmbedding.get_embedding(
@@ -72,7 +76,8 @@ class SinusoidalPositionalEmbedding(nn.Module):
                 return self.weights.index_select(index=self.padding_idx + pos, dim=0).unsqueeze(1).repeat(bsz, 1, 1)
             return self.weights[self.padding_idx + pos, :].expand(bsz, 1, -1)
 
-        positions = utils.make_positions(input, self.padding_idx, onnx_trace=self.onnx_trace)
+        if positions is None:
+            positions = utils.make_positions(input, self.padding_idx, onnx_trace=self.onnx_trace)
         if self.onnx_trace:
             flat_embeddings = self.weights.detach().index_select(0, positions.view(-1))
             embedding_shape = torch.cat((bsz.view(1), seq_len.view(1), torch.LongTensor([-1])))
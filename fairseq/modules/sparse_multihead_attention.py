@@ -4,10 +4,82 @@
 # LICENSE file in the root directory of this source tree.
 
 import math
+from functools import lru_cache
+
 import torch
+import torch.nn.functional as F
+
+from fairseq import utils
 from .multihead_attention import MultiheadAttention
 
 
+def _is_summary(word_index, stride, expressivity):
+    # the last c words of each window and the first word of the next window
+    offset = word_index % stride
+    return word_index.ge(stride - expressivity) & (offset.eq(0) | offset.ge(stride - expressivity))
+
+
+@lru_cache(maxsize=16)
+def fixed_sparse_pattern(tgt_len, src_len, stride, expressivity, is_bidirectional, device=None):
+    """Returns a ``tgt_len x src_len`` BoolTensor that is True where the
+    fixed factorized attention pattern lets a word attend to another word
+    (see :class:`SparseMultiheadAttention`)."""
+    i = torch.arange(tgt_len, device=device).unsqueeze(1)
+    j = torch.arange(src_len, device=device).unsqueeze(0)
+
+    # A(1): the stride window of each word; the first word of a window
+    # (except the first one) attends to the previous window instead
+    window_start = i // stride * stride
+    starts_window = (i % stride).eq(0) & i.ne(0)
+    lower = torch.where(starts_window, i - stride, window_start)
+    upper = torch.where(starts_window, i, window_start + stride)
+    pattern = j.ge(lower) & j.le(upper)
+
+    # A(2): the summary of each window
+    pattern |= _is_summary(j, stride, expressivity)
+
+    if is_bidirectional:
+        pattern &= j.lt(tgt_len)
+    else:
+        pattern &= j.le(i)
+    return pattern
+
+
+@lru_cache(maxsize=16)
+def block_sparse_layout(seq_len, stride, expressivity, is_bidirectional, device=None):
+    """Splits the fixed attention pattern of a sequence into a local part,
+    the three stride windows around the window of each query, and a global
+    part, the summary words, which are the only words that a query may
+    attend to outside of the local part.
+
+    Returns the ``num_windows x stride x 3*stride`` BoolTensor mask of the
+    local part, the indices of the summary words and the
+    ``num_windows*stride x num_summaries`` BoolTensor mask of the global part,
+    which excludes the summary words that are in the local part. The queries
+    are padded to a multiple of *stride*; a padding query attends to itself.
+    """
+    num_windows = (seq_len + stride - 1) // stride
+    padded_len = num_windows * stride
+    pattern = fixed_sparse_pattern(seq_len, seq_len, stride, expressivity, is_bidirectional, device)
+    padded = pattern.new_zeros(padded_len, padded_len + 2 * stride)
+    padded[:seq_len, stride:stride + seq_len] = pattern
+    pad_idx = torch.arange(seq_len, padded_len, device=device)
+    padded[pad_idx, pad_idx + stride] = True
+
+    # local column t of the queries of window w is the word w*stride - stride + t
+    local_mask = torch.stack([
+        padded[w * stride:(w + 1) * stride, w * stride:(w + 3) * stride]
+        for w in range(num_windows)
+    ])
+
+    words = torch.arange(seq_len, device=device)
+    summary_idx = words[_is_summary(words, stride, expressivity)]
+    window = torch.arange(padded_len, device=device).unsqueeze(1) // stride
+    local = summary_idx.unsqueeze(0).ge((window - 1) * stride) & summary_idx.unsqueeze(0).lt((window + 2) * stride)
+    global_mask = padded[:, stride:stride + seq_len][:, summary_idx] & ~local
+    return local_mask, summary_idx, global_mask
+
+
 class SparseMultiheadAttention(MultiheadAttention):
     """ Sparse Multi-Headed Attention.
 
@@ -33,6 +105,9 @@ class SparseMultiheadAttention(MultiheadAttention):
         self.expressivity = expressivity
         assert(self.stride > 0 and self.stride >= self.expressivity)
 
+        # the fused implementation of PyTorch does not apply the sparse mask
+        self.enable_torch_version = False
+
     # Used for Ai(2) calculations - beginning of [l-c, l] range
     def compute_checkpoint(self, word_index):
         if word_index % self.stride == 0 and word_index != 0:
@@ -81,24 +156,111 @@ class SparseMultiheadAttention(MultiheadAttention):
 
         return subset_one.union(subset_two)
 
-    # Compute sparse mask - if bidirectional, can pre-compute and store
+    # Compute sparse mask - the pattern is cached per length and configuration
     def buffered_sparse_mask(self, tensor, tgt_len, src_len):
-        assert(tgt_len > self.stride)
-        sparse_mask = torch.empty((tgt_len, src_len)).float().fill_(float('-inf'))
-
-        # If bidirectional, subset 2 is the same for every index
-        subset_summaries = set()
-        if self.is_bidirectional:
-            subset_summaries = self.compute_subset_summaries(tgt_len)
-
-        for i in range(tgt_len):
-            fixed_attention_subset = self.compute_fixed_attention_subset(i, tgt_len)
-            fixed_attention_subset = fixed_attention_subset.union(subset_summaries)
-            included_word_indices = torch.LongTensor(list(fixed_attention_subset))
-            sparse_mask[i].index_fill_(0, included_word_indices, 0)
-        return sparse_mask.type_as(tensor)
+        pattern = fixed_sparse_pattern(
+            tgt_len, src_len, self.stride, self.expressivity, self.is_bidirectional, tensor.device,
+        )
+        sparse_mask = tensor.new_zeros(tgt_len, src_len)
+        return sparse_mask.masked_fill_(~pattern, float('-inf'))
 
     def apply_sparse_mask(self, attn_weights, tgt_len, src_len, bsz):
         sparse_mask = self.buffered_sparse_mask(attn_weights, tgt_len, src_len)
         sparse_mask = sparse_mask.unsqueeze(0).expand(bsz * self.num_heads, tgt_len, src_len)
         attn_weights += sparse_mask
+        return attn_weights
+
+    def forward(
+        self,
+        query, key, value,
+        key_padding_mask=None,
+        incremental_state=None,
+        need_weights=True,
+        static_kv=False,
+        attn_mask=None,
+        before_softmax=False,
+        need_head_weights=False,
+    ):
+        """Input shape: Time x Batch x Channel
+
+        Self-attention over whole sequences that does not need to return the
+        attention weights only computes the blocks of the attention matrix
+        that the sparse pattern does not mask (see :func:`block_sparse_attention`).
+        Otherwise, see :class:`MultiheadAttention`.
+        """
+        if (
+            not self.self_attention or incremental_state is not None or attn_mask is not None
+            or need_weights or need_head_weights or before_softmax or self.onnx_trace
+            or self.bias_k is not None or self.add_zero_attn
+        ):
+            return super().forward(
+                query, key, value, key_padding_mask=key_padding_mask,
+                incremental_state=incremental_state, need_weights=need_weights,
+                static_kv=static_kv, attn_mask=attn_mask, before_softmax=before_softmax,
+                need_head_weights=need_head_weights,
+            )
+
+        seq_len, bsz, embed_dim = query.size()
+        assert embed_dim == self.embed_dim
+
+        q = self.q_proj(query) * self.scaling
+        k = self.k_proj(query)
+        v = self.v_proj(query)
+        q = q.contiguous().view(seq_len, bsz * self.num_heads, self.head_dim).transpose(0, 1)
+        k = k.contiguous().view(seq_len, bsz * self.num_heads, self.head_dim).transpose(0, 1)
+        v = v.contiguous().view(seq_len, bsz * self.num_heads, self.head_dim).transpose(0, 1)
+
+        if key_padding_mask is not None and key_padding_mask.shape == torch.Size([]):
+            key_padding_mask = None
+
+        attn = self.block_sparse_attention(q, k, v, key_padding_mask, bsz)
+        attn = attn.transpose(0, 1).contiguous().view(seq_len, bsz, embed_dim)
+        attn = self.out_proj(attn)
+        return attn, None
+
+    def block_sparse_attention(self, q, k, v, key_padding_mask, bsz):
+        """Computes the attention of the queries *q* over the keys *k* and
+        values *v* (all of shape ``(bsz * num_heads, seq_len, head_dim)``)
+        under the fixed sparse pattern, without the masked blocks.
+
+        Each window of *stride* queries attends to the three windows of keys
+        around it and to the summary words (see :func:`block_sparse_layout`),
+        so the cost grows with ``seq_len * (3 * stride + seq_len * (c + 1) / stride)``
+        instead of ``seq_len ** 2``.
+        """
+        bh, seq_len, head_dim = q.size()
+        stride = self.stride
+        local_mask, summary_idx, global_mask = block_sparse_layout(
+            seq_len, stride, self.expressivity, self.is_bidirectional, q.device,
+        )
+        num_windows = local_mask.size(0)
+        pad = num_windows * stride - seq_len
+
+        # local part: (bh x num_windows x stride x 3*stride)
+        q = F.pad(q, (0, 0, 0, pad)).view(bh, num_windows, stride, head_dim)
+        k_local = F.pad(k, (0, 0, stride, pad + stride)).unfold(1, 3 * stride, stride)
+        v_local = F.pad(v, (0, 0, stride, pad + stride)).unfold(1, 3 * stride, stride)
+        local_weights = torch.matmul(q, k_local)
+        local_weights.masked_fill_(~local_mask, float('-inf'))
+
+        # global part: (bh x num_windows x stride x num_summaries)
+        global_weights = torch.matmul(q, k[:, summary_idx].transpose(1, 2).unsqueeze(1))
+        global_weights.masked_fill_(~global_mask.view(num_windows, stride, -1), float('-inf'))
+
+        if key_padding_mask is not None:
+            # don't attend to padding symbols
+            local_padding = F.pad(key_padding_mask, (stride, pad + stride)).unfold(1, 3 * stride, stride)
+            local_weights = local_weights.view(bsz, -1, num_windows, stride, 3 * stride).masked_fill(
+                local_padding.unsqueeze(1).unsqueeze(3).bool(), float('-inf'),
+            ).view(bh, num_windows, stride, 3 * stride)
+            global_weights = global_weights.view(bsz, -1, num_windows, stride, summary_idx.numel()).masked_fill(
+                key_padding_mask[:, summary_idx].view(bsz, 1, 1, 1, -1).bool(), float('-inf'),
+            ).view(bh, num_windows, stride, -1)
+
+        attn_weights = torch.cat([local_weights, global_weights], dim=-1)
+        attn_weights_float = utils.softmax(attn_weights, dim=-1, onnx_trace=self.onnx_trace)
+        attn_probs = F.dropout(attn_weights_float.type_as(attn_weights), p=self.dropout, training=self.training)
+
+        attn = torch.matmul(attn_probs[..., :3 * stride], v_local.transpose(-1, -2))
+        attn = attn + torch.matmul(attn_probs[..., 3 * stride:], v[:, summary_idx].unsqueeze(1))
+        return attn.view(bh, num_windows * stride, head_dim)[:, :seq_len]
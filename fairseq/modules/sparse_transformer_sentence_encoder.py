@@ -25,6 +25,7 @@ class SparseTransformerSentenceEncoder(TransformerSentenceEncoder):
         dropout: float = 0.1,
         attention_dropout: float = 0.1,
         activation_dropout: float = 0.1,
+        layerdrop: float = 0.0,
         max_seq_len: int = 256,
         num_segments: int = 2,
         use_position_embeddings: bool = True,
@@ -47,7 +48,7 @@ class SparseTransformerSentenceEncoder(TransformerSentenceEncoder):
         super().__init__(
             padding_idx, vocab_size, num_encoder_layers, embedding_dim,
             ffn_embedding_dim, num_attention_heads, dropout, attention_dropout,
-            activation_dropout, max_seq_len, num_segments, use_position_embeddings,
+            activation_dropout, layerdrop, max_seq_len, num_segments, use_position_embeddings,
             offset_positions_by_padding, encoder_normalize_before, apply_bert_init,
             activation_fn, learned_pos_embedding, add_bias_kv, add_zero_attn,
             embed_scale, freeze_embeddings, n_trans_layers_to_freeze, export
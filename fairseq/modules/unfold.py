@@ -3,6 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import torch
 import torch.nn.functional as F
 
 
@@ -15,3 +16,10 @@ def unfold1d(x, kernel_size, padding_l, pad_value=0):
     else:
         x = x.unsqueeze(3)
     return x
+
+
+def roll_to_ring_buffer(weight, step):
+    '''roll N x K filters, whose last tap applies to the input of time step
+    *step*, to the slots of a ring buffer holding the last K inputs, where the
+    input of time step t is written to slot t % K'''
+    return torch.roll(weight, (step + 1) % weight.size(1), dims=1)
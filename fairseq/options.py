@@ -25,6 +25,7 @@ def get_training_parser(default_task='translation'):
     add_model_args(parser)
     add_optimization_args(parser)
     add_checkpoint_args(parser)
+    add_bleu_validation_args(parser)
     return parser
 
 
@@ -41,6 +42,14 @@ def get_interactive_generation_parser(default_task='translation'):
     return get_generation_parser(interactive=True, default_task=default_task)
 
 
+def get_backtranslation_parser(default_task='translation'):
+    parser = get_parser('Back-translation', default_task)
+    add_dataset_args(parser, gen=True)
+    add_generation_args(parser)
+    add_backtranslation_args(parser)
+    return parser
+
+
 def get_eval_lm_parser(default_task='language_modeling'):
     parser = get_parser('Evaluate Language Model', default_task)
     add_dataset_args(parser, gen=True)
@@ -426,6 +435,31 @@ def add_checkpoint_args(parser):
     return group
 
 
+def add_bleu_validation_args(parser):
+    group = parser.add_argument_group('BLEU validation')
+    # fmt: off
+    group.add_argument('--eval-bleu', action='store_true',
+                       help='also decode the validation subset(s) with the model being trained '
+                            'and report BLEU (use --best-checkpoint-metric bleu '
+                            '--maximize-best-checkpoint-metric to select checkpoints by BLEU)')
+    group.add_argument('--eval-bleu-max-sentences', default=1000, type=int, metavar='N',
+                       help='decode a fixed random sample of at most N sentences of each '
+                            'validation subset')
+    group.add_argument('--eval-bleu-beam', default=1, type=int, metavar='N',
+                       help='beam size (1 decodes greedily)')
+    group.add_argument('--eval-bleu-max-len-a', default=0, type=float, metavar='N',
+                       help='generate sequences of maximum length ax + b, where x is the source length')
+    group.add_argument('--eval-bleu-max-len-b', default=200, type=int, metavar='N',
+                       help='generate sequences of maximum length ax + b, where x is the source length')
+    group.add_argument('--eval-bleu-remove-bpe', nargs='?', const='@@ ', default=None,
+                       help='remove BPE tokens before scoring (can be set to sentencepiece)')
+    group.add_argument('--eval-bleu-time-share', default=0.1, type=float, metavar='R',
+                       help='stop decoding once the total decoding time exceeds this share of '
+                            'the training time (at least one batch is always decoded)')
+    # fmt: on
+    return group
+
+
 def add_common_eval_args(group):
     # fmt: off
     group.add_argument('--path', metavar='FILE',
@@ -439,6 +473,12 @@ def add_common_eval_args(group):
                             'that were used during model training')
     group.add_argument('--results-path', metavar='RESDIR', type=str, default=None,
                        help='path to save eval results (optional)"')
+    group.add_argument('--cache-char-embeddings', action='store_true',
+                       help='save the word embeddings precomputed by character embedders next to each '
+                            'model file (as FILE.char_embed) and reuse them in later runs')
+    group.add_argument('--quantize', action='store_true',
+                       help='apply dynamic int8 quantization to the linear and LSTM layers of the models '
+                            '(requires --cpu)')
     # fmt: on
 
 
@@ -453,6 +493,10 @@ def add_eval_lm_args(parser):
     group.add_argument('--context-window', default=0, type=int, metavar='N',
                        help='ensures that every evaluated token has access to a context of at least this size,'
                             ' if possible')
+    group.add_argument('--stateful-eval', action='store_true',
+                       help='carry cached self-attention keys/values (up to --context-window tokens) across'
+                            ' consecutive blocks instead of re-encoding the context for every block'
+                            ' (transformer LMs only)')
     group.add_argument('--softmax-batch', default=sys.maxsize, type=int, metavar='N',
                        help='if BxT is more than this, will batch the softmax over vocab to this amount of tokens'
                             ' in order to fit into GPU memory')
@@ -511,6 +555,17 @@ def add_generation_args(parser):
                        help='strength of diversity penalty for Diverse Beam Search')
     group.add_argument('--print-alignment', action='store_true',
                        help='if set, uses attention feedback to compute and print alignment to source tokens')
+    group.add_argument('--shortlist', default=None, metavar='FILE',
+                       help='only generate the most likely translations of the source words (from this '
+                            'lexical table, see scripts/build_lexical_shortlist.py) and the most frequent '
+                            'target words, projecting the decoder output onto these words only')
+    group.add_argument('--shortlist-topk', default=100, type=int, metavar='N',
+                       help='number of translations of each source word in the shortlist')
+    group.add_argument('--shortlist-frequent', default=100, type=int, metavar='N',
+                       help='number of most frequent target words always in the shortlist')
+    group.add_argument('--torchscript', action='store_true',
+                       help='run the beam search with the transformer model compiled to TorchScript '
+                            '(single model, without sampling, prefixes or alignments)')
     group.add_argument('--print-step', action='store_true')
 
     # arguments for iterative refinement generator
@@ -527,6 +582,24 @@ def add_generation_args(parser):
     return group
 
 
+def add_backtranslation_args(parser):
+    group = parser.add_argument_group('Back-translation')
+    # fmt: off
+    group.add_argument('--bt-input', metavar='FP', default=None,
+                       help='prefix of the binarized monolingual dataset to back-translate '
+                            '(e.g., data-bin/mono.de)')
+    group.add_argument('--bt-destdir', metavar='DIR', default='data-bin-bt',
+                       help='destination dir for the binarized back-translated shards')
+    group.add_argument('--bt-split', metavar='SPLIT', default='train',
+                       help='split name of the written shards; shard k>0 is written as SPLITk '
+                            'so that the shards can be combined when loading')
+    group.add_argument('--bt-workers', metavar='N', default=1, type=int,
+                       help='number of local generation processes; each process handles '
+                            'one of num_shards*N shards')
+    # fmt: on
+    return group
+
+
 def add_interactive_args(parser):
     group = parser.add_argument_group('Interactive')
     # fmt: off
@@ -534,6 +607,12 @@ def add_interactive_args(parser):
                        help='read this many sentences into a buffer before processing them')
     group.add_argument('--input', default='-', type=str, metavar='FILE',
                        help='file to read from; use - for stdin')
+    group.add_argument('--serve-workers', default=1, type=int, metavar='N',
+                       help='translate the batches of each buffer in N worker processes, which are '
+                            'forked after loading the models and share their weights (requires --cpu)')
+    group.add_argument('--serve-threads', default=None, type=int, metavar='N',
+                       help='number of intra-op threads of each worker '
+                            '(default: number of threads divided by --serve-workers)')
     # fmt: on
 
 
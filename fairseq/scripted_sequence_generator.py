@@ -0,0 +1,573 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Beam search for transformer models compiled to TorchScript.
+
+:func:`script_transformer` wraps the encoder, a single decoder step and the
+beam search of :class:`~fairseq.sequence_generator.SequenceGenerator` into a
+:class:`torch.jit.ScriptModule`. The modules share the parameters of the
+model (including dynamically quantized ones), and the decoder keeps its
+self-attention keys and values in a single tensor instead of the dict-based
+``incremental_state``. The scripted module can be saved with
+:func:`torch.jit.save` and run with :func:`torch.jit.load` alone, without
+importing fairseq (see ``scripts/export_torchscript.py``).
+"""
+
+import math
+from typing import List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch import Tensor
+
+from fairseq.modules import LearnedPositionalEmbedding
+from fairseq.modules.gelu import gelu, gelu_accurate
+
+
+def _activation_name(activation_fn):
+    for name, fn in [('relu', F.relu), ('gelu', gelu), ('gelu_accurate', gelu_accurate), ('tanh', torch.tanh)]:
+        if activation_fn is fn:
+            return name
+    raise NotImplementedError('TorchScript generation does not support this --activation-fn')
+
+
+def _make_positions(tokens: Tensor, padding_idx: int) -> Tensor:
+    mask = tokens.ne(padding_idx).long()
+    return torch.cumsum(mask, dim=1) * mask + padding_idx
+
+
+class _PositionalEmbedding(nn.Module):
+    """Learned positional embeddings, or sinusoidal ones computed for the
+    given positions only, so that there is no table whose size is fixed at
+    compile time."""
+
+    def __init__(self, embed_positions):
+        super().__init__()
+        self.learned = isinstance(embed_positions, LearnedPositionalEmbedding)
+        self.weight = embed_positions.weight if self.learned else torch.zeros(0)
+        self.padding_idx = embed_positions.padding_idx
+        self.embedding_dim = embed_positions.embedding_dim
+
+    def forward(self, positions: Tensor) -> Tensor:
+        if self.learned:
+            return F.embedding(positions, self.weight)
+        half_dim = self.embedding_dim // 2
+        freq = math.log(10000) / (half_dim - 1)
+        freq = torch.exp(torch.arange(half_dim, dtype=torch.float, device=positions.device) * -freq)
+        emb = positions.float().unsqueeze(-1) * freq
+        emb = torch.cat([torch.sin(emb), torch.cos(emb)], dim=-1)
+        if self.embedding_dim % 2 == 1:
+            emb = F.pad(emb, [0, 1])
+        return emb.masked_fill(positions.eq(self.padding_idx).unsqueeze(-1), 0.)
+
+
+class _Attention(nn.Module):
+    """Multi-head attention on keys and values of shape
+    `(batch, heads, length, head_dim)`."""
+
+    def __init__(self, attn):
+        super().__init__()
+        assert attn.bias_k is None and not attn.add_zero_attn, \
+            'TorchScript generation does not support --add-bias-kv or --add-zero-attn'
+        self.q_proj = attn.q_proj
+        self.k_proj = attn.k_proj
+        self.v_proj = attn.v_proj
+        self.out_proj = attn.out_proj
+        self.num_heads = attn.num_heads
+        self.head_dim = attn.head_dim
+        self.scaling = attn.scaling
+
+    def _split_heads(self, x: Tensor) -> Tensor:
+        # T x B x C -> B x H x T x D
+        return x.view(x.size(0), x.size(1), self.num_heads, self.head_dim).permute(1, 2, 0, 3)
+
+    def project_kv(self, x: Tensor) -> Tuple[Tensor, Tensor]:
+        return self._split_heads(self.k_proj(x)), self._split_heads(self.v_proj(x))
+
+    def forward(self, x: Tensor, k: Tensor, v: Tensor, key_padding_mask: Optional[Tensor]) -> Tensor:
+        q = self._split_heads(self.q_proj(x) * self.scaling)
+        attn_weights = torch.matmul(q, k.transpose(2, 3))
+        if key_padding_mask is not None:
+            attn_weights = attn_weights.masked_fill(
+                key_padding_mask.unsqueeze(1).unsqueeze(2), float('-inf'),
+            )
+        attn_probs = F.softmax(attn_weights.float(), dim=-1).type_as(attn_weights)
+        attn = torch.matmul(attn_probs, v)
+        # B x H x T x D -> T x B x C
+        attn = attn.permute(2, 0, 1, 3).reshape(x.size(0), x.size(1), self.num_heads * self.head_dim)
+        return self.out_proj(attn)
+
+
+class _FeedForward(nn.Module):
+
+    def __init__(self, layer):
+        super().__init__()
+        self.fc1 = layer.fc1
+        self.fc2 = layer.fc2
+        self.activation = _activation_name(layer.activation_fn)
+
+    def forward(self, x: Tensor) -> Tensor:
+        x = self.fc1(x)
+        if self.activation == 'relu':
+            x = F.relu(x)
+        elif self.activation == 'gelu':
+            x = F.gelu(x.float()).type_as(x)
+        elif self.activation == 'gelu_accurate':
+            x = 0.5 * x * (1 + torch.tanh(math.sqrt(2 / math.pi) * (x + 0.044715 * torch.pow(x, 3))))
+        else:
+            x = torch.tanh(x)
+        return self.fc2(x)
+
+
+class _EncoderLayer(nn.Module):
+
+    def __init__(self, layer):
+        super().__init__()
+        self.self_attn = _Attention(layer.self_attn)
+        self.self_attn_layer_norm = layer.self_attn_layer_norm
+        self.ffn = _FeedForward(layer)
+        self.final_layer_norm = layer.final_layer_norm
+        self.normalize_before = layer.normalize_before
+
+    def forward(self, x: Tensor, padding_mask: Tensor) -> Tensor:
+        residual = x
+        if self.normalize_before:
+            x = self.self_attn_layer_norm(x)
+        k, v = self.self_attn.project_kv(x)
+        x = residual + self.self_attn(x, k, v, padding_mask)
+        if not self.normalize_before:
+            x = self.self_attn_layer_norm(x)
+
+        residual = x
+        if self.normalize_before:
+            x = self.final_layer_norm(x)
+        x = residual + self.ffn(x)
+        if not self.normalize_before:
+            x = self.final_layer_norm(x)
+        return x
+
+
+class _DecoderLayer(nn.Module):
+
+    def __init__(self, layer):
+        super().__init__()
+        assert layer.encoder_attn is not None, 'TorchScript generation does not support --no-cross-attention'
+        self.self_attn = _Attention(layer.self_attn)
+        self.self_attn_layer_norm = layer.self_attn_layer_norm
+        self.encoder_attn = _Attention(layer.encoder_attn)
+        self.encoder_attn_layer_norm = layer.encoder_attn_layer_norm
+        self.ffn = _FeedForward(layer)
+        self.final_layer_norm = layer.final_layer_norm
+        self.normalize_before = layer.normalize_before
+
+    def forward(
+        self, x: Tensor, prev_key: Tensor, prev_value: Tensor,
+        encoder_key: Tensor, encoder_value: Tensor, encoder_padding_mask: Tensor,
+    ) -> Tuple[Tensor, Tensor, Tensor]:
+        residual = x
+        if self.normalize_before:
+            x = self.self_attn_layer_norm(x)
+        k, v = self.self_attn.project_kv(x)
+        k = torch.cat([prev_key, k], dim=2)
+        v = torch.cat([prev_value, v], dim=2)
+        x = residual + self.self_attn(x, k, v, None)
+        if not self.normalize_before:
+            x = self.self_attn_layer_norm(x)
+
+        residual = x
+        if self.normalize_before:
+            x = self.encoder_attn_layer_norm(x)
+        x = residual + self.encoder_attn(x, encoder_key, encoder_value, encoder_padding_mask)
+        if not self.normalize_before:
+            x = self.encoder_attn_layer_norm(x)
+
+        residual = x
+        if self.normalize_before:
+            x = self.final_layer_norm(x)
+        x = residual + self.ffn(x)
+        if not self.normalize_before:
+            x = self.final_layer_norm(x)
+        return x, k, v
+
+
+class ScriptedTransformerEncoder(nn.Module):
+    """Scriptable inference version of a transformer encoder."""
+
+    def __init__(self, encoder):
+        super().__init__()
+        assert not getattr(encoder, 'layer_wise_attention', False), \
+            'TorchScript generation does not support --layer-wise-attention'
+        self.embed_tokens = encoder.embed_tokens
+        self.embed_scale = float(encoder.embed_scale)
+        self.padding_idx = encoder.padding_idx
+        self.embed_positions = (
+            _PositionalEmbedding(encoder.embed_positions) if encoder.embed_positions is not None else None
+        )
+        self.layers = nn.ModuleList([_EncoderLayer(layer) for layer in encoder.layers])
+        self.layer_norm = encoder.layer_norm
+
+    def forward(self, src_tokens: Tensor) -> Tuple[Tensor, Tensor]:
+        """Returns the encoder output of shape `(src_len, batch, embed_dim)`
+        and the padding mask of shape `(batch, src_len)`."""
+        x = self.embed_scale * self.embed_tokens(src_tokens)
+        if self.embed_positions is not None:
+            x = x + self.embed_positions(_make_positions(src_tokens, self.padding_idx)).type_as(x)
+        x = x.transpose(0, 1)
+        padding_mask = src_tokens.eq(self.padding_idx)
+        for layer in self.layers:
+            x = layer(x, padding_mask)
+        if self.layer_norm is not None:
+            x = self.layer_norm(x)
+        return x, padding_mask
+
+
+class ScriptedTransformerDecoder(nn.Module):
+    """Scriptable inference version of a transformer decoder, which decodes
+    one step at a time. The self-attention keys and values of the previous
+    steps are passed in as a tensor of shape
+    `(layers, 2, batch, heads, steps, head_dim)`, and the encoder-decoder
+    attention keys and values (see :func:`encoder_kv`) as a tensor of shape
+    `(layers, 2, batch, heads, src_len, head_dim)`, so that the state can be
+    reordered with :func:`torch.index_select` along dimension 2."""
+
+    def __init__(self, decoder):
+        super().__init__()
+        assert decoder.adaptive_softmax is None, 'TorchScript generation does not support adaptive softmax'
+        assert not getattr(decoder, 'cross_self_attention', False), \
+            'TorchScript generation does not support --cross-self-attention'
+        assert not getattr(decoder, 'layer_wise_attention', False), \
+            'TorchScript generation does not support --layer-wise-attention'
+        self.embed_tokens = decoder.embed_tokens
+        self.embed_scale = float(decoder.embed_scale)
+        self.padding_idx = decoder.padding_idx
+        self.project_in_dim = decoder.project_in_dim
+        self.embed_positions = (
+            _PositionalEmbedding(decoder.embed_positions) if decoder.embed_positions is not None else None
+        )
+        self.layers = nn.ModuleList([_DecoderLayer(layer) for layer in decoder.layers])
+        self.layer_norm = decoder.layer_norm
+        self.project_out_dim = decoder.project_out_dim
+        self.num_heads = self.layers[0].self_attn.num_heads
+        self.head_dim = self.layers[0].self_attn.head_dim
+
+        output_projection = getattr(decoder, 'output_projection', None)
+        if output_projection is None:
+            weight = decoder.embed_tokens.weight if decoder.share_input_output_embed else decoder.embed_out
+            output_projection = nn.Linear(weight.size(1), weight.size(0), bias=False)
+            output_projection.weight = weight
+        self.output_projection = output_projection
+
+    @torch.jit.export
+    def encoder_kv(self, encoder_out: Tensor) -> Tensor:
+        kv = []
+        for layer in self.layers:
+            k, v = layer.encoder_attn.project_kv(encoder_out)
+            kv.append(torch.stack([k, v]))
+        return torch.stack(kv)
+
+    @torch.jit.export
+    def empty_self_kv(self, encoder_kv: Tensor) -> Tensor:
+        return encoder_kv.new_zeros(
+            len(self.layers), 2, encoder_kv.size(2), self.num_heads, 0, self.head_dim,
+        )
+
+    def forward(
+        self, prev_tokens: Tensor, step: int, self_kv: Tensor, encoder_kv: Tensor, encoder_padding_mask: Tensor,
+    ) -> Tuple[Tensor, Tensor]:
+        """Returns the log-probabilities of the next tokens after
+        *prev_tokens* (of shape `(batch)`) at decoding step *step*, and the
+        updated self-attention keys and values."""
+        x = self.embed_scale * self.embed_tokens(prev_tokens.unsqueeze(0))
+        if self.project_in_dim is not None:
+            x = self.project_in_dim(x)
+        if self.embed_positions is not None:
+            positions = torch.full_like(prev_tokens, self.padding_idx + step + 1).unsqueeze(0)
+            x = x + self.embed_positions(positions).type_as(x)
+
+        new_self_kv = []
+        for i, layer in enumerate(self.layers):
+            x, k, v = layer(x, self_kv[i, 0], self_kv[i, 1], encoder_kv[i, 0], encoder_kv[i, 1], encoder_padding_mask)
+            new_self_kv.append(torch.stack([k, v]))
+
+        if self.layer_norm is not None:
+            x = self.layer_norm(x)
+        if self.project_out_dim is not None:
+            x = self.project_out_dim(x)
+        logits = self.output_projection(x[0])
+        return F.log_softmax(logits.float(), dim=-1), torch.stack(new_self_kv)
+
+
+class ScriptedBeamSearch(nn.Module):
+    """Scriptable beam search with the same results as
+    :class:`~fairseq.sequence_generator.SequenceGenerator` with a single
+    model, beam search and no prefix tokens."""
+
+    def __init__(self, model, tgt_dict):
+        super().__init__()
+        self.encoder = ScriptedTransformerEncoder(model.encoder)
+        self.decoder = ScriptedTransformerDecoder(model.decoder)
+        self.pad = tgt_dict.pad()
+        self.unk = tgt_dict.unk()
+        self.eos = tgt_dict.eos()
+        self.vocab_size = len(tgt_dict)
+        self.max_decoder_positions = model.max_decoder_positions()
+
+    def forward(
+        self,
+        src_tokens: Tensor,
+        beam_size: int = 5,
+        max_len_a: float = 0.,
+        max_len_b: int = 200,
+        min_len: int = 1,
+        normalize_scores: bool = True,
+        len_penalty: float = 1.,
+        unk_penalty: float = 0.,
+    ) -> Tuple[Tensor, Tensor, Tensor, Tensor]:
+        """Returns the hypotheses of each sentence in *src_tokens*, best
+        first, as tensors of:
+
+        - tokens of shape `(batch, beam, max_len + 1)`, padded with pad,
+        - scores of shape `(batch, beam)`,
+        - positional scores of shape `(batch, beam, max_len + 1)`,
+        - lengths (including eos) of shape `(batch, beam)`.
+        """
+        device = src_tokens.device
+        bsz = src_tokens.size(0)
+        # the max beam size is the dictionary size - 1, since we never select pad
+        beam_size = min(beam_size, self.vocab_size - 1)
+        max_len = min(int(max_len_a * src_tokens.size(1) + max_len_b), self.max_decoder_positions - 1)
+
+        encoder_out, encoder_padding_mask = self.encoder(src_tokens)
+        new_order = torch.arange(bsz, device=device).view(-1, 1).repeat(1, beam_size).view(-1)
+        encoder_kv = self.decoder.encoder_kv(encoder_out).index_select(2, new_order)
+        encoder_padding_mask = encoder_padding_mask.index_select(0, new_order)
+        self_kv = self.decoder.empty_self_kv(encoder_kv)
+
+        scores = torch.zeros(bsz * beam_size, max_len + 1, device=device)
+        tokens = torch.full((bsz * beam_size, max_len + 2), self.pad, dtype=torch.long, device=device)
+        tokens[:, 0] = self.eos
+        blacklist = torch.zeros(bsz, beam_size, dtype=torch.bool, device=device)
+
+        finalized_tokens = torch.full((bsz, beam_size, max_len + 1), self.pad, dtype=torch.long, device=device)
+        finalized_scores = torch.full((bsz, beam_size), float('-inf'), device=device)
+        finalized_pos_scores = torch.zeros(bsz, beam_size, max_len + 1, device=device)
+        finalized_lengths = torch.zeros(bsz, beam_size, dtype=torch.long, device=device)
+        num_finalized = [0 for _ in range(bsz)]
+        # the sentence of each row of the (shrinking) batch
+        sent_ids = [i for i in range(bsz)]
+        num_remaining_sent = bsz
+
+        # number of candidate hypos per step
+        cand_size = 2 * beam_size  # 2 x beam size in case half are EOS
+        bbsz_offsets = (torch.arange(bsz, device=device) * beam_size).unsqueeze(1)
+        cand_offsets = torch.arange(cand_size, device=device)
+
+        for step in range(max_len + 1):  # one extra step for EOS marker
+            lprobs, self_kv = self.decoder(tokens[:, step], step, self_kv, encoder_kv, encoder_padding_mask)
+
+            lprobs[:, self.pad] = float('-inf')  # never select pad
+            lprobs[:, self.unk] -= unk_penalty  # apply unk penalty
+
+            # handle min and max length constraints
+            if step >= max_len:
+                lprobs[:, :self.eos] = float('-inf')
+                lprobs[:, self.eos + 1:] = float('-inf')
+            elif step < min_len:
+                lprobs[:, self.eos] = float('-inf')
+
+            # see BeamSearch.step
+            lprobs = lprobs.view(bsz, beam_size, -1)
+            if step == 0:
+                # at the first step all hypotheses are equally likely, so use
+                # only the first beam
+                lprobs = lprobs[:, :1, :].contiguous()
+            else:
+                lprobs = lprobs + scores.view(bsz, beam_size, -1)[:, :, step - 1].unsqueeze(-1)
+            lprobs = lprobs.view(bsz, -1)
+            cand_scores, cand_indices = torch.topk(lprobs, k=min(cand_size, lprobs.size(1) - 1))
+            cand_beams = torch.div(cand_indices, self.vocab_size, rounding_mode='floor')
+            cand_indices = cand_indices.fmod(self.vocab_size)
+            cand_bbsz_idx = cand_beams + bbsz_offsets
+
+            # finalize hypotheses that end in eos (except for blacklisted ones),
+            # when eos is among the top beam_size candidates
+            eos_mask = cand_indices.eq(self.eos)
+            eos_mask[:, :beam_size] = eos_mask[:, :beam_size] & ~blacklist
+            eos_bbsz_idx = torch.masked_select(cand_bbsz_idx[:, :beam_size], eos_mask[:, :beam_size])
+
+            finalized_sents: List[int] = []
+            if eos_bbsz_idx.numel() > 0:
+                eos_scores = torch.masked_select(cand_scores[:, :beam_size], eos_mask[:, :beam_size])
+                # skip the first index, which is EOS
+                tokens_clone = tokens.index_select(0, eos_bbsz_idx)[:, 1:step + 2]
+                tokens_clone[:, step] = self.eos
+                # convert from cumulative to per-position scores
+                pos_scores = scores.index_select(0, eos_bbsz_idx)[:, :step + 1]
+                pos_scores[:, step] = eos_scores
+                pos_scores[:, 1:] = pos_scores[:, 1:] - pos_scores[:, :-1]
+                if normalize_scores:
+                    eos_scores = eos_scores / (step + 1) ** len_penalty
+
+                bbsz_idxs: List[int] = eos_bbsz_idx.tolist()
+                for i, bbsz_idx in enumerate(bbsz_idxs):
+                    unfin_idx = bbsz_idx // beam_size
+                    sent = sent_ids[unfin_idx]
+                    n = num_finalized[sent]
+                    if n < beam_size:
+                        finalized_tokens[sent, n, :step + 1] = tokens_clone[i]
+                        finalized_scores[sent, n] = eos_scores[i]
+                        finalized_pos_scores[sent, n, :step + 1] = pos_scores[i]
+                        finalized_lengths[sent, n] = step + 1
+                        num_finalized[sent] = n + 1
+                        if n + 1 == beam_size:
+                            finalized_sents.append(unfin_idx)
+                num_remaining_sent -= len(finalized_sents)
+
+            if num_remaining_sent == 0:
+                break
+
+            # remove finalized sentences from the batch
+            row_idxs: Optional[Tensor] = None
+            if len(finalized_sents) > 0:
+                new_bsz = bsz - len(finalized_sents)
+                batch_mask = torch.ones(bsz, dtype=torch.bool, device=device)
+                batch_mask[torch.tensor(finalized_sents, device=device)] = False
+                batch_idxs = batch_mask.nonzero().squeeze(-1)
+
+                eos_mask = eos_mask[batch_idxs]
+                bbsz_offsets = bbsz_offsets[:new_bsz]
+                cand_bbsz_idx = cand_beams[batch_idxs] + bbsz_offsets
+                cand_scores = cand_scores[batch_idxs]
+                cand_indices = cand_indices[batch_idxs]
+                blacklist = blacklist[batch_idxs]
+
+                scores = scores.view(bsz, -1)[batch_idxs].view(new_bsz * beam_size, -1)
+                tokens = tokens.view(bsz, -1)[batch_idxs].view(new_bsz * beam_size, -1)
+                row_idxs = (batch_idxs.unsqueeze(1) * beam_size + torch.arange(beam_size, device=device)).view(-1)
+                encoder_kv = encoder_kv.index_select(2, row_idxs)
+                encoder_padding_mask = encoder_padding_mask.index_select(0, row_idxs)
+                kept_rows: List[int] = batch_idxs.tolist()
+                sent_ids = [sent_ids[i] for i in kept_rows]
+                bsz = new_bsz
+
+            # the top beam_size active candidates are the ones with the
+            # smallest values of active_mask, where finalized or blacklisted
+            # candidates have values >= cand_size
+            eos_mask[:, :beam_size] = eos_mask[:, :beam_size] | blacklist
+            active_mask = eos_mask.long() * cand_size + cand_offsets[:eos_mask.size(1)]
+            new_blacklist, active_hypos = torch.topk(active_mask, k=beam_size, dim=1, largest=False)
+
+            # update blacklist to ignore any finalized hypos
+            blacklist = new_blacklist.ge(cand_size)[:, :beam_size]
+
+            active_bbsz_idx = torch.gather(cand_bbsz_idx, dim=1, index=active_hypos).view(-1)
+            tokens = tokens.index_select(0, active_bbsz_idx)
+            tokens[:, step + 1] = torch.gather(cand_indices, dim=1, index=active_hypos).view(-1)
+            scores = scores.index_select(0, active_bbsz_idx)
+            scores[:, step] = torch.gather(cand_scores, dim=1, index=active_hypos).view(-1)
+
+            # reorder the cached keys and values, which are still in the
+            # order of the batch before removing finalized sentences
+            if row_idxs is not None:
+                active_bbsz_idx = row_idxs.index_select(0, active_bbsz_idx)
+            self_kv = self_kv.index_select(2, active_bbsz_idx)
+
+        # sort by score descending
+        finalized_scores, order = torch.sort(finalized_scores, dim=1, descending=True, stable=True)
+        finalized_tokens = finalized_tokens.gather(1, order.unsqueeze(-1).expand_as(finalized_tokens))
+        finalized_pos_scores = finalized_pos_scores.gather(1, order.unsqueeze(-1).expand_as(finalized_pos_scores))
+        finalized_lengths = finalized_lengths.gather(1, order)
+        return finalized_tokens, finalized_scores, finalized_pos_scores, finalized_lengths
+
+
+def script_transformer(model, tgt_dict):
+    """Compile the beam search with the transformer *model* (a
+    :class:`~fairseq.models.transformer.TransformerModel` or
+    :class:`~fairseq.models.tracing_compliant_transformer.TracingTransformerModel`)
+    to TorchScript. The scripted module shares the parameters of *model*."""
+    model.eval()
+    return torch.jit.script(ScriptedBeamSearch(model, tgt_dict))
+
+
+class ScriptedSequenceGenerator(object):
+    """Generates translations with a transformer model compiled to
+    TorchScript, with the same interface and results as
+    :class:`~fairseq.sequence_generator.SequenceGenerator` for beam search.
+
+    The model is compiled at its first use; a scripted module returned by
+    :func:`script_transformer` (e.g. loaded with :func:`torch.jit.load`) can
+    be passed as the model as well.
+    """
+
+    def __init__(
+        self,
+        tgt_dict,
+        beam_size=1,
+        max_len_a=0,
+        max_len_b=200,
+        min_len=1,
+        normalize_scores=True,
+        len_penalty=1.,
+        unk_penalty=0.,
+    ):
+        self.tgt_dict = tgt_dict
+        self.beam_size = beam_size
+        self.max_len_a = max_len_a
+        self.max_len_b = max_len_b
+        self.min_len = min_len
+        self.normalize_scores = normalize_scores
+        self.len_penalty = len_penalty
+        self.unk_penalty = unk_penalty
+        self.model = None
+        self.scripted_model = None
+
+    def script(self, model):
+        if isinstance(model, torch.jit.ScriptModule):
+            return model
+        if model is not self.model:
+            self.scripted_model = script_transformer(model, self.tgt_dict)
+            self.model = model
+        return self.scripted_model
+
+    @torch.no_grad()
+    def generate(self, models, sample, prefix_tokens=None, **kwargs):
+        """Generate a batch of translations.
+
+        Args:
+            models (List[~fairseq.models.FairseqModel]): a single transformer
+                model
+            sample (dict): batch
+        """
+        assert len(models) == 1, 'TorchScript generation does not support ensembles'
+        assert prefix_tokens is None, 'TorchScript generation does not support --prefix-size'
+        model = self.script(models[0])
+        tokens, scores, pos_scores, lengths = model(
+            sample['net_input']['src_tokens'],
+            self.beam_size,
+            float(self.max_len_a),
+            int(self.max_len_b),
+            math.ceil(self.min_len),
+            self.normalize_scores,
+            float(self.len_penalty),
+            float(self.unk_penalty),
+        )
+        lengths = lengths.tolist()
+        scores = scores.tolist()
+        return [
+            [
+                {
+                    'tokens': tokens[i, j, :lengths[i][j]],
+                    'score': scores[i][j],
+                    'attention': None,
+                    'alignment': None,
+                    'positional_scores': pos_scores[i, j, :lengths[i][j]],
+                }
+                for j in range(tokens.size(1))
+                # unfinished beams are padded with empty hypotheses
+                if lengths[i][j] > 0
+            ]
+            for i in range(tokens.size(0))
+        ]
@@ -32,6 +32,7 @@ class SequenceGenerator(object):
         diverse_beam_strength=0.5,
         match_source_len=False,
         no_repeat_ngram_size=0,
+        shortlist=None,
     ):
         """Generates translations of a given source sentence.
 
@@ -64,6 +65,10 @@ class SequenceGenerator(object):
                 Diverse Beam Search sampling
             match_source_len (bool, optional): outputs should match the source
                 length (default: False)
+            shortlist (~fairseq.lexical_shortlist.LexicalShortlist, optional):
+                only generate the candidate words of each batch given by the
+                shortlist; the decoders project onto these words only
+                (default: None)
         """
         self.pad = tgt_dict.pad()
         self.unk = tgt_dict.unk()
@@ -82,6 +87,7 @@ class SequenceGenerator(object):
         self.temperature = temperature
         self.match_source_len = match_source_len
         self.no_repeat_ngram_size = no_repeat_ngram_size
+        self.shortlist = shortlist
         assert sampling_topk < 0 or sampling, '--sampling-topk requires --sampling'
         assert sampling_topp < 0 or sampling, '--sampling-topp requires --sampling'
         assert temperature > 0, '--temperature must be greater than 0'
@@ -121,6 +127,18 @@ class SequenceGenerator(object):
         bos_token=None,
         **kwargs
     ):
+        if self.shortlist is None:
+            return self._decode(model, sample, prefix_tokens, bos_token)
+
+        candidates = self.shortlist.candidates(sample['net_input']['src_tokens'], prefix_tokens)
+        model.set_output_shortlist(candidates)
+        try:
+            return self._decode(model, sample, prefix_tokens, bos_token, candidates)
+        finally:
+            model.set_output_shortlist(None)
+
+    @torch.no_grad()
+    def _decode(self, model, sample, prefix_tokens=None, bos_token=None, candidates=None):
         if not self.retain_dropout:
             model.eval()
 
@@ -180,6 +198,21 @@ class SequenceGenerator(object):
         bbsz_offsets = (torch.arange(0, bsz) * beam_size).unsqueeze(1).type_as(tokens)
         cand_offsets = torch.arange(0, cand_size).type_as(tokens)
 
+        # with a shortlist, the decoders output log-probabilities over the
+        # candidates only, and the chosen candidates are mapped back to the
+        # vocabulary; the special symbols keep their indices
+        vocab_size = self.vocab_size
+        if candidates is not None:
+            vocab_size = candidates.numel()
+            to_candidate = candidates.new_full((self.vocab_size,), -1)
+            to_candidate[candidates] = torch.arange(vocab_size).type_as(candidates)
+            for idx in (self.pad, self.unk, self.eos):
+                assert to_candidate[idx] == idx, 'the shortlist must include the special symbols'
+
+        # number of best candidates of each hypothesis that the search needs
+        # exactly, if the other log-probabilities may be left out
+        num_pruned_cands = self._num_pruned_candidates(model, candidates)
+
         # helper function for allocating buffers on the fly
         buffers = {}
 
@@ -291,8 +324,16 @@ class SequenceGenerator(object):
                 model.reorder_incremental_state(reorder_state)
                 encoder_outs = model.reorder_encoder_out(encoder_outs, reorder_state)
 
+            # the log-probabilities of words that cannot be among the best
+            # candidates may be left out when prefix tokens are not forced;
+            # the margin covers the words masked below (bos, pad, unk, eos
+            # and the last token of each repeated ngram)
+            topk = None
+            if num_pruned_cands is not None and (prefix_tokens is None or step >= prefix_tokens.size(1)):
+                topk = num_pruned_cands + 4 + (step + 1 if self.no_repeat_ngram_size > 0 else 0)
+
             lprobs, avg_attn_scores = model.forward_decoder(
-                tokens[:, :step + 1], encoder_outs, temperature=self.temperature,
+                tokens[:, :step + 1], encoder_outs, temperature=self.temperature, topk=topk,
             )
 
             lprobs[:, self.pad] = -math.inf  # never select pad
@@ -308,6 +349,8 @@ class SequenceGenerator(object):
             # handle prefix tokens (possibly with different lengths)
             if prefix_tokens is not None and step < prefix_tokens.size(1):
                 prefix_toks = prefix_tokens[:, step].unsqueeze(-1).repeat(1, beam_size).view(-1)
+                if candidates is not None:
+                    prefix_toks = to_candidate[prefix_toks]
                 prefix_lprobs = lprobs.gather(-1, prefix_toks.unsqueeze(-1))
                 prefix_mask = prefix_toks.ne(self.pad)
                 lprobs[prefix_mask] = -math.inf
@@ -369,14 +412,22 @@ class SequenceGenerator(object):
                 else:
                     banned_tokens = [[] for bbsz_idx in range(bsz * beam_size)]
 
+                if candidates is not None:
+                    banned_tokens = [
+                        [idx for idx in to_candidate[banned].tolist() if idx >= 0] if len(banned) > 0 else []
+                        for banned in banned_tokens
+                    ]
+
                 for bbsz_idx in range(bsz * beam_size):
                     lprobs[bbsz_idx, banned_tokens[bbsz_idx]] = -math.inf
 
             cand_scores, cand_indices, cand_beams = self.search.step(
                 step,
-                lprobs.view(bsz, -1, self.vocab_size),
+                lprobs.view(bsz, -1, vocab_size),
                 scores.view(bsz, beam_size, -1)[:, :, :step],
             )
+            if candidates is not None:
+                cand_indices = candidates[cand_indices]
 
             # cand_bbsz_idx contains beam indices for the top candidate
             # hypotheses, with a range of values: [0, bsz*beam_size),
@@ -517,6 +568,24 @@ class SequenceGenerator(object):
         return finalized
 
 
+    def _num_pruned_candidates(self, model, candidates):
+        """Return the number of candidates per hypothesis that the search
+        selects from, if the decoder can output exact log-probabilities for
+        the best candidates only (i.e., a single model with an adaptive
+        softmax), or None if the search needs the whole distribution."""
+        if candidates is not None or len(model.models) > 1:
+            return None
+        if getattr(model.models[0].decoder, 'adaptive_softmax', None) is None:
+            return None
+        if isinstance(self.search, search.Sampling):
+            if self.search.sampling_topp > 0 or self.search.sampling_topk <= 0:
+                return None
+            return self.search.sampling_topk
+        if isinstance(self.search, (search.BeamSearch, search.LengthConstrainedBeamSearch)):
+            return 2 * self.beam_size
+        return None
+
+
 class EnsembleModel(torch.nn.Module):
     """A wrapper around an ensemble of models."""
 
@@ -540,7 +609,7 @@ class EnsembleModel(torch.nn.Module):
         return [model.encoder(**encoder_input) for model in self.models]
 
     @torch.no_grad()
-    def forward_decoder(self, tokens, encoder_outs, temperature=1.):
+    def forward_decoder(self, tokens, encoder_outs, temperature=1., topk=None):
         if len(self.models) == 1:
             return self._decode_one(
                 tokens,
@@ -549,6 +618,7 @@ class EnsembleModel(torch.nn.Module):
                 self.incremental_states,
                 log_probs=True,
                 temperature=temperature,
+                topk=topk,
             )
 
         log_probs = []
@@ -575,7 +645,7 @@ class EnsembleModel(torch.nn.Module):
 
     def _decode_one(
         self, tokens, model, encoder_out, incremental_states, log_probs,
-        temperature=1.,
+        temperature=1., topk=None,
     ):
         if self.incremental_states is not None:
             decoder_out = list(model.forward_decoder(
@@ -591,10 +661,26 @@ class EnsembleModel(torch.nn.Module):
             attn = attn.get('attn', None)
         if attn is not None:
             attn = attn[:, -1, :]
-        probs = model.get_normalized_probs(decoder_out, log_probs=log_probs)
+        probs = self._get_normalized_probs(model, decoder_out, log_probs, topk)
         probs = probs[:, -1, :]
         return probs, attn
 
+    def _get_normalized_probs(self, model, decoder_out, log_probs, topk=None):
+        # with an adaptive softmax, only compute the tail clusters that may
+        # hold one of the *topk* most likely words
+        adaptive_softmax = getattr(model.decoder, 'adaptive_softmax', None)
+        if topk is not None and log_probs and adaptive_softmax is not None:
+            return adaptive_softmax.get_pruned_log_prob(decoder_out[0], topk)
+        return model.get_normalized_probs(decoder_out, log_probs=log_probs)
+
+    def set_output_shortlist(self, candidates):
+        """Restrict the output layer of the decoders to the *candidates*, or
+        to the whole vocabulary if None."""
+        for model in self.models:
+            assert hasattr(model.decoder, 'set_output_shortlist'), \
+                '{} does not support a shortlist'.format(model.decoder.__class__.__name__)
+            model.decoder.set_output_shortlist(candidates)
+
     def reorder_encoder_out(self, encoder_outs, new_order):
         if not self.has_encoder():
             return
@@ -688,7 +774,7 @@ class EnsembleModelWithAlignment(EnsembleModel):
 
     def _decode_one(
         self, tokens, model, encoder_out, incremental_states, log_probs,
-        temperature=1.,
+        temperature=1., topk=None,
     ):
         if self.incremental_states is not None:
             decoder_out = list(model.forward_decoder(
@@ -706,6 +792,6 @@ class EnsembleModelWithAlignment(EnsembleModel):
             attn = attn.get('attn', None)
         if attn is not None:
             attn = attn[:, -1, :]
-        probs = model.get_normalized_probs(decoder_out, log_probs=log_probs)
+        probs = self._get_normalized_probs(model, decoder_out, log_probs, topk)
         probs = probs[:, -1, :]
         return probs, attn
@@ -19,8 +19,14 @@ class SequenceScorer(object):
         assert self.softmax_batch > 0
 
     @torch.no_grad()
-    def generate(self, models, sample, **kwargs):
-        """Score a batch of translations."""
+    def generate(self, models, sample, incremental_states=None, max_context=0, **kwargs):
+        """Score a batch of translations.
+
+        If *incremental_states* (one dict per model) is given, every row of
+        the batch continues the token stream of the same row in the previous
+        batch and is scored with the decoder's ``forward_stream``, reusing
+        up to *max_context* cached tokens of context.
+        """
         net_input = sample['net_input']
 
         def batch_for_softmax(dec_out, target):
@@ -45,6 +51,17 @@ class SequenceScorer(object):
             )
             return probs
 
+        def target_log_probs(decoder, features, target):
+            bsz, tsz, dim = features.shape
+            if bsz * tsz < self.softmax_batch:
+                return decoder.get_target_log_probs(features, target)
+            flat = features.contiguous().view(1, -1, dim)
+            flat_tgt = target.contiguous().view(1, -1)
+            return torch.cat([
+                decoder.get_target_log_probs(flat[:, s:s + self.softmax_batch], flat_tgt[:, s:s + self.softmax_batch])
+                for s in range(0, flat.size(1), self.softmax_batch)
+            ], dim=1).view(bsz, tsz)
+
 
         orig_target = sample['target']
 
@@ -53,27 +70,44 @@ class SequenceScorer(object):
         avg_attn = None
         for model in models:
             model.eval()
-            decoder_out = model.forward(**net_input)
+            # decoders that can score the targets directly from their features
+            # never build the output distribution over the whole vocabulary
+            decoder = getattr(model, 'decoder', None)
+            score_targets = hasattr(decoder, 'get_target_log_probs')
+            if incremental_states is not None:
+                decoder_out = model.decoder.forward_stream(
+                    net_input['src_tokens'], incremental_states[model], max_context,
+                    features_only=score_targets,
+                )
+            elif score_targets:
+                decoder_out = model.extract_features(**net_input)
+            else:
+                decoder_out = model.forward(**net_input)
             attn = decoder_out[1]
             if type(attn) is dict:
                 attn = attn.get('attn', None)
 
-            batched = batch_for_softmax(decoder_out, orig_target)
-            probs, idx = None, 0
-            for bd, tgt, is_single in batched:
-                sample['target'] = tgt
-                curr_prob = model.get_normalized_probs(bd, log_probs=len(models) == 1, sample=sample).data
-                if is_single:
-                    probs = gather_target_probs(curr_prob, orig_target)
-                else:
-                    if probs is None:
-                        probs = curr_prob.new(orig_target.numel())
-                    step = curr_prob.size(0) * curr_prob.size(1)
-                    end = step + idx
-                    tgt_probs = gather_target_probs(curr_prob.view(tgt.shape + (curr_prob.size(-1),)), tgt)
-                    probs[idx:end] = tgt_probs.view(-1)
-                    idx = end
-                sample['target'] = orig_target
+            if score_targets:
+                probs = target_log_probs(decoder, decoder_out[0], orig_target)
+                if len(models) > 1:
+                    probs.exp_()
+            else:
+                batched = batch_for_softmax(decoder_out, orig_target)
+                probs, idx = None, 0
+                for bd, tgt, is_single in batched:
+                    sample['target'] = tgt
+                    curr_prob = model.get_normalized_probs(bd, log_probs=len(models) == 1, sample=sample).data
+                    if is_single:
+                        probs = gather_target_probs(curr_prob, orig_target)
+                    else:
+                        if probs is None:
+                            probs = curr_prob.new(orig_target.numel())
+                        step = curr_prob.size(0) * curr_prob.size(1)
+                        end = step + idx
+                        tgt_probs = gather_target_probs(curr_prob.view(tgt.shape + (curr_prob.size(-1),)), tgt)
+                        probs[idx:end] = tgt_probs.view(-1)
+                        idx = end
+                    sample['target'] = orig_target
 
             probs = probs.view(sample['target'].shape)
 
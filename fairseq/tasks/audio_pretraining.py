@@ -5,7 +5,7 @@
 
 import os
 
-from fairseq.data import FileAudioDataset
+from fairseq.data import FileAudioDataset, MMapAudioDataset
 from . import FairseqTask, register_task
 
 
@@ -45,6 +45,16 @@ class AudioPretrainingTask(FairseqTask):
             split (str): name of the split (e.g., train, valid, test)
         """
 
+        # waveforms packed with scripts/wav2vec_pack.py take precedence over
+        # the manifest of audio files
+        prefix = os.path.join(self.args.data, split)
+        if MMapAudioDataset.exists(prefix):
+            self.datasets[split] = MMapAudioDataset(prefix,
+                                                    sample_rate=self.args.sample_rate,
+                                                    max_sample_size=self.args.max_sample_size,
+                                                    min_sample_size=self.args.min_sample_size)
+            return
+
         manifest = os.path.join(self.args.data, '{}.tsv'.format(split))
         self.datasets[split] = FileAudioDataset(manifest,
                                                  sample_rate=self.args.sample_rate,
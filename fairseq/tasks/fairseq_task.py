@@ -36,7 +36,8 @@ class FairseqTask(object):
         return Dictionary.load(filename)
 
     @classmethod
-    def build_dictionary(cls, filenames, workers=1, threshold=-1, nwords=-1, padding_factor=8):
+    def build_dictionary(cls, filenames, workers=1, threshold=-1, nwords=-1, padding_factor=8,
+                         tokenize=tokenizer.tokenize_line):
         """Build the dictionary
 
         Args:
@@ -48,10 +49,14 @@ class FairseqTask(object):
             padding_factor (int): can be used to pad the dictionary size to be a
                 multiple of 8, which is important on some hardware (e.g., Nvidia
                 Tensor Cores).
+            tokenize (callable or list): splits a line into words (default:
+                whitespace tokenization); a list gives one function per file
         """
         d = Dictionary()
-        for filename in filenames:
-            Dictionary.add_file_to_dictionary(filename, d, tokenizer.tokenize_line, workers)
+        if callable(tokenize):
+            tokenize = [tokenize] * len(filenames)
+        for filename, tokenize_fn in zip(filenames, tokenize):
+            Dictionary.add_file_to_dictionary(filename, d, tokenize_fn, workers)
         d.finalize(threshold=threshold, nwords=nwords, padding_factor=padding_factor)
         return d
 
@@ -197,12 +202,37 @@ class FairseqTask(object):
         if getattr(args, 'score_reference', False):
             from fairseq.sequence_scorer import SequenceScorer
             return SequenceScorer(self.target_dictionary)
+        elif getattr(args, 'torchscript', False):
+            from fairseq.scripted_sequence_generator import ScriptedSequenceGenerator
+            assert not (
+                getattr(args, 'sampling', False) or getattr(args, 'diverse_beam_groups', -1) > 0
+                or getattr(args, 'match_source_len', False) or getattr(args, 'no_repeat_ngram_size', 0) > 0
+                or getattr(args, 'print_alignment', False) or getattr(args, 'shortlist', None) is not None
+                or getattr(args, 'temperature', 1.) != 1.
+            ), '--torchscript only supports plain beam search'
+            return ScriptedSequenceGenerator(
+                self.target_dictionary,
+                beam_size=getattr(args, 'beam', 5),
+                max_len_a=getattr(args, 'max_len_a', 0),
+                max_len_b=getattr(args, 'max_len_b', 200),
+                min_len=getattr(args, 'min_len', 1),
+                normalize_scores=(not getattr(args, 'unnormalized', False)),
+                len_penalty=getattr(args, 'lenpen', 1),
+                unk_penalty=getattr(args, 'unkpen', 0),
+            )
         else:
             from fairseq.sequence_generator import SequenceGenerator, SequenceGeneratorWithAlignment
             if getattr(args, 'print_alignment', False):
                 seq_gen_cls = SequenceGeneratorWithAlignment
             else:
                 seq_gen_cls = SequenceGenerator
+            shortlist = None
+            if getattr(args, 'shortlist', None) is not None:
+                from fairseq.lexical_shortlist import LexicalShortlist
+                shortlist = LexicalShortlist.load(
+                    args.shortlist, self.source_dictionary, self.target_dictionary,
+                    topk=args.shortlist_topk, num_frequent=args.shortlist_frequent,
+                )
             return seq_gen_cls(
                 self.target_dictionary,
                 beam_size=getattr(args, 'beam', 5),
@@ -220,6 +250,7 @@ class FairseqTask(object):
                 diverse_beam_strength=getattr(args, 'diverse_beam_strength', 0.5),
                 match_source_len=getattr(args, 'match_source_len', False),
                 no_repeat_ngram_size=getattr(args, 'no_repeat_ngram_size', 0),
+                shortlist=shortlist,
             )
 
     def train_step(self, sample, model, criterion, optimizer, ignore_grad=False):
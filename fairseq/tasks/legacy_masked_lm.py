@@ -51,10 +51,13 @@ class LegacyMaskedLMTask(FairseqTask):
         return BertDictionary.load(filename)
 
     @classmethod
-    def build_dictionary(cls, filenames, workers=1, threshold=-1, nwords=-1, padding_factor=8):
+    def build_dictionary(cls, filenames, workers=1, threshold=-1, nwords=-1, padding_factor=8,
+                         tokenize=tokenizer.tokenize_line):
         d = BertDictionary()
-        for filename in filenames:
-            Dictionary.add_file_to_dictionary(filename, d, tokenizer.tokenize_line, workers)
+        if callable(tokenize):
+            tokenize = [tokenize] * len(filenames)
+        for filename, tokenize_fn in zip(filenames, tokenize):
+            Dictionary.add_file_to_dictionary(filename, d, tokenize_fn, workers)
         d.finalize(threshold=threshold, nwords=nwords, padding_factor=padding_factor)
         return d
 
@@ -81,6 +81,8 @@ class Trainer(object):
             self.meters['loss_scale'] = AverageMeter()  # dynamic loss scale
         self.meters['wall'] = TimeMeter()      # wall time in seconds
         self.meters['train_wall'] = StopwatchMeter()  # train wall time in seconds
+        if getattr(args, 'eval_bleu', False):
+            self.meters['bleu_wall'] = StopwatchMeter()  # BLEU validation decoding time in seconds
 
     @property
     def criterion(self):
@@ -7,6 +7,7 @@ from collections import defaultdict
 import contextlib
 import copy
 import importlib.util
+import inspect
 import math
 import os
 import sys
@@ -15,6 +16,7 @@ import warnings
 
 import torch
 import torch.nn.functional as F
+import torch.utils.checkpoint
 
 from itertools import accumulate
 from fairseq.modules import gelu, gelu_accurate
@@ -304,6 +306,45 @@ def log_softmax(x, dim, onnx_trace=False):
         return F.log_softmax(x, dim=dim, dtype=torch.float32)
 
 
+def chunked_target_log_probs(features, weight, target, chunk_size):
+    """Log-probability of *target* under ``softmax(features @ weight.T)``,
+    computed as ``logit[target] - logsumexp(logits)`` over chunks of
+    *chunk_size* rows of *weight*, so that the full output over the
+    vocabulary is never materialized."""
+    features = features.float()
+    lse = None
+    for start in range(0, weight.size(0), chunk_size):
+        chunk_lse = torch.logsumexp(F.linear(features, weight[start:start + chunk_size].float()), dim=-1)
+        lse = chunk_lse if lse is None else torch.logaddexp(lse, chunk_lse)
+    target_logits = (features * weight[target].float()).sum(dim=-1)
+    return target_logits - lse
+
+
+# whether torch.utils.checkpoint has a non-reentrant implementation
+_CHECKPOINT_HAS_USE_REENTRANT = 'use_reentrant' in inspect.signature(torch.utils.checkpoint.checkpoint).parameters
+
+
+def should_checkpoint(module, idx, every):
+    """Whether the activations of layer *idx* of *module* are recomputed
+    during the backward pass instead of stored, when every *every*-th layer
+    is checkpointed (see ``--checkpoint-activations``)."""
+    return module.training and torch.is_grad_enabled() and every > 0 and idx % every == 0
+
+
+def checkpoint_activations(function, *args):
+    """Call *function* on the tensors *args* without keeping its intermediate
+    activations, which are recomputed during the backward pass. The state of
+    the RNG is restored for the recomputation, so that dropout masks match;
+    other random decisions (e.g., LayerDrop) must be taken outside of
+    *function*."""
+    if _CHECKPOINT_HAS_USE_REENTRANT:
+        return torch.utils.checkpoint.checkpoint(function, *args, use_reentrant=False)
+    # the reentrant implementation only propagates gradients to the
+    # parameters if one of the inputs requires grad
+    args = [arg if arg.requires_grad else arg.detach().requires_grad_() for arg in args]
+    return torch.utils.checkpoint.checkpoint(function, *args)
+
+
 def get_perplexity(loss):
     try:
         return '{:.2f}'.format(math.pow(2, loss))
@@ -354,6 +395,35 @@ def eval(model):
     model.train(is_training)
 
 
+_INIT_FUNCTIONS = [
+    'uniform_', 'normal_', 'trunc_normal_', 'constant_', 'ones_', 'zeros_',
+    'eye_', 'dirac_', 'xavier_uniform_', 'xavier_normal_', 'kaiming_uniform_',
+    'kaiming_normal_', 'orthogonal_', 'sparse_',
+]
+
+
+@contextlib.contextmanager
+def no_param_init():
+    """Turns the functions of :mod:`torch.nn.init` into no-ops, e.g., to skip
+    the random initialization of a model whose weights are loaded right
+    after it is built. Not thread-safe."""
+    init = torch.nn.init
+    saved = {
+        name: getattr(init, name) for name in _INIT_FUNCTIONS if hasattr(init, name)
+    }
+
+    def skip(tensor, *args, **kwargs):
+        return tensor
+
+    try:
+        for name in saved:
+            setattr(init, name, skip)
+        yield
+    finally:
+        for name, fn in saved.items():
+            setattr(init, name, fn)
+
+
 def has_parameters(module):
     try:
         next(module.parameters())
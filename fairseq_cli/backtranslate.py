@@ -0,0 +1 @@
+../backtranslate.py
\ No newline at end of file
@@ -19,6 +19,8 @@ def main(args):
         '--sampling requires --nbest to be equal to --beam'
     assert args.replace_unk is None or args.raw_text, \
         '--replace-unk requires a raw text dataset (--raw-text)'
+    assert not args.quantize or (args.cpu and not args.fp16), \
+        '--quantize requires --cpu and is not compatible with --fp16'
 
     utils.import_user_module(args)
 
@@ -48,11 +50,14 @@ def main(args):
     )
 
     # Optimize ensemble for generation
-    for model in models:
+    for model, path in zip(models, args.path.split(':')):
         model.make_generation_fast_(
             beamable_mm_beam_size=None if args.no_beamable_mm else args.beam,
             need_attn=args.print_alignment,
+            char_embed_cache=path + '.char_embed' if args.cache_char_embeddings else None,
         )
+        if args.quantize:
+            model.quantize_()
         if args.fp16:
             model.half()
         if use_cuda:
@@ -86,7 +91,7 @@ def main(args):
     if args.sacrebleu:
         scorer = bleu.SacrebleuScorer()
     else:
-        scorer = bleu.Scorer(tgt_dict.pad(), tgt_dict.eos(), tgt_dict.unk())
+        scorer = bleu.CachedScorer(tgt_dict.pad(), tgt_dict.eos(), tgt_dict.unk())
     num_sentences = 0
     has_target = True
     with progress_bar.build_progress_bar(args, itr) as t:
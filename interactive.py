@@ -14,6 +14,7 @@ import torch
 
 from fairseq import checkpoint_utils, options, tasks, utils
 from fairseq.data import encoders
+from fairseq.forked_worker_pool import ForkedWorkerPool
 
 
 Batch = namedtuple('Batch', 'ids src_tokens src_lengths')
@@ -66,6 +67,9 @@ def main(args):
         '--sampling requires --nbest to be equal to --beam'
     assert not args.max_sentences or args.max_sentences <= args.buffer_size, \
         '--max-sentences/--batch-size cannot be larger than --buffer-size'
+    assert not args.quantize or (args.cpu and not args.fp16), \
+        '--quantize requires --cpu and is not compatible with --fp16'
+    assert args.serve_workers == 1 or args.cpu, '--serve-workers requires --cpu'
 
     print(args)
 
@@ -92,6 +96,8 @@ def main(args):
             beamable_mm_beam_size=None if args.no_beamable_mm else args.beam,
             need_attn=args.print_alignment,
         )
+        if args.quantize:
+            model.quantize_()
         if args.fp16:
             model.half()
         if use_cuda:
@@ -127,60 +133,79 @@ def main(args):
         *[model.max_positions() for model in models]
     )
 
+    def translate(batch):
+        src_tokens = batch.src_tokens
+        src_lengths = batch.src_lengths
+        if use_cuda:
+            src_tokens = src_tokens.cuda()
+            src_lengths = src_lengths.cuda()
+
+        sample = {
+            'net_input': {
+                'src_tokens': src_tokens,
+                'src_lengths': src_lengths,
+            },
+        }
+        translations = task.inference_step(generator, models, sample)
+        return [
+            (id, utils.strip_pad(src_tokens[i], tgt_dict.pad()), hypos[:args.nbest])
+            for i, (id, hypos) in enumerate(zip(batch.ids.tolist(), translations))
+        ]
+
+    pool = None
+    if args.serve_workers > 1:
+        # the workers share the weights in shared memory instead of loading
+        # their own copy of the models
+        for model in models:
+            model.share_memory()
+        pool = ForkedWorkerPool(translate, args.serve_workers, num_threads=args.serve_threads)
+        print('| Forked {} workers'.format(args.serve_workers))
+
     if args.buffer_size > 1:
         print('| Sentence buffer size:', args.buffer_size)
     print('| Type the input sentence and press return:')
     start_id = 0
-    for inputs in buffered_read(args.input, args.buffer_size):
-        results = []
-        for batch in make_batches(inputs, args, task, max_positions, encode_fn):
-            src_tokens = batch.src_tokens
-            src_lengths = batch.src_lengths
-            if use_cuda:
-                src_tokens = src_tokens.cuda()
-                src_lengths = src_lengths.cuda()
-
-            sample = {
-                'net_input': {
-                    'src_tokens': src_tokens,
-                    'src_lengths': src_lengths,
-                },
-            }
-            translations = task.inference_step(generator, models, sample)
-            for i, (id, hypos) in enumerate(zip(batch.ids.tolist(), translations)):
-                src_tokens_i = utils.strip_pad(src_tokens[i], tgt_dict.pad())
-                results.append((start_id + id, src_tokens_i, hypos))
-
-        # sort output to match input order
-        for id, src_tokens, hypos in sorted(results, key=lambda x: x[0]):
-            if src_dict is not None:
-                src_str = src_dict.string(src_tokens, args.remove_bpe)
-                print('S-{}\t{}'.format(id, src_str))
-
-            # Process top predictions
-            for hypo in hypos[:min(len(hypos), args.nbest)]:
-                hypo_tokens, hypo_str, alignment = utils.post_process_prediction(
-                    hypo_tokens=hypo['tokens'].int().cpu(),
-                    src_str=src_str,
-                    alignment=hypo['alignment'].int().cpu() if hypo['alignment'] is not None else None,
-                    align_dict=align_dict,
-                    tgt_dict=tgt_dict,
-                    remove_bpe=args.remove_bpe,
-                )
-                hypo_str = decode_fn(hypo_str)
-                print('H-{}\t{}\t{}'.format(id, hypo['score'], hypo_str))
-                print('P-{}\t{}'.format(
-                    id,
-                    ' '.join(map(lambda x: '{:.4f}'.format(x), hypo['positional_scores'].tolist()))
-                ))
-                if args.print_alignment:
-                    print('A-{}\t{}'.format(
+    try:
+        for inputs in buffered_read(args.input, args.buffer_size):
+            results = []
+            batches = make_batches(inputs, args, task, max_positions, encode_fn)
+            for batch_results in (pool.imap(batches) if pool is not None else map(translate, batches)):
+                for id, src_tokens, hypos in batch_results:
+                    results.append((start_id + id, src_tokens, hypos))
+
+            # sort output to match input order
+            for id, src_tokens, hypos in sorted(results, key=lambda x: x[0]):
+                if src_dict is not None:
+                    src_str = src_dict.string(src_tokens, args.remove_bpe)
+                    print('S-{}\t{}'.format(id, src_str))
+
+                # Process top predictions
+                for hypo in hypos[:min(len(hypos), args.nbest)]:
+                    hypo_tokens, hypo_str, alignment = utils.post_process_prediction(
+                        hypo_tokens=hypo['tokens'].int().cpu(),
+                        src_str=src_str,
+                        alignment=hypo['alignment'].int().cpu() if hypo['alignment'] is not None else None,
+                        align_dict=align_dict,
+                        tgt_dict=tgt_dict,
+                        remove_bpe=args.remove_bpe,
+                    )
+                    hypo_str = decode_fn(hypo_str)
+                    print('H-{}\t{}\t{}'.format(id, hypo['score'], hypo_str))
+                    print('P-{}\t{}'.format(
                         id,
-                        ' '.join(map(lambda x: str(utils.item(x)), alignment))
+                        ' '.join(map(lambda x: '{:.4f}'.format(x), hypo['positional_scores'].tolist()))
                     ))
-
-        # update running id counter
-        start_id += len(inputs)
+                    if args.print_alignment:
+                        print('A-{}\t{}'.format(
+                            id,
+                            ' '.join(map(lambda x: str(utils.item(x)), alignment))
+                        ))
+
+            # update running id counter
+            start_id += len(inputs)
+    finally:
+        if pool is not None:
+            pool.close()
 
 
 def cli_main():
@@ -11,14 +11,71 @@ from collections import Counter
 from itertools import zip_longest
 
 from fairseq import options, tasks, utils
-from fairseq.data import indexed_dataset
+from fairseq.data import encoders, indexed_dataset
 from fairseq.binarizer import Binarizer
+from fairseq.registry import REGISTRIES
+from fairseq.tokenizer import tokenize_line
 from multiprocessing import Pool
 
+import copy
 import os
 import shutil
+import time
 import pdb
 
+
+class LineEncoder(object):
+    """Applies --tokenizer and --bpe to raw lines on the fly, so that
+    binarization runs directly on untokenized text without writing the
+    intermediate BPE files. Keeps the time spent in each stage.
+
+    Instances pickle as their args and rebuild the encoders lazily, so they
+    can be handed to worker processes.
+    """
+
+    def __init__(self, args, lang=None):
+        self.args = args
+        self.lang = lang
+        self.times = Counter()
+        self._tokenizer = None
+        self._bpe = None
+        self._built = False
+
+    def __getstate__(self):
+        return {'args': self.args, 'lang': self.lang}
+
+    def __setstate__(self, state):
+        self.__init__(state['args'], state['lang'])
+
+    def _build(self):
+        args = copy.copy(self.args)
+        if self.lang is not None:
+            # language-aware tokenizers (e.g., moses) default to the source language
+            args.source_lang = self.lang
+        self._tokenizer = encoders.build_tokenizer(args)
+        self._bpe = encoders.build_bpe(args)
+        self._built = True
+
+    def __call__(self, line):
+        if not self._built:
+            self._build()
+        line = line.strip()
+        if self._tokenizer is not None:
+            start = time.time()
+            line = self._tokenizer.encode(line)
+            self.times['tokenize'] += time.time() - start
+        if self._bpe is not None:
+            start = time.time()
+            line = self._bpe.encode(line)
+            self.times['bpe'] += time.time() - start
+        return tokenize_line(line)
+
+
+def build_line_encoder(args, lang):
+    if getattr(args, 'tokenizer', None) is None and getattr(args, 'bpe', None) is None:
+        return None
+    return LineEncoder(args, lang)
+
 def main(args):
     utils.import_user_module(args)
 
@@ -31,6 +88,13 @@ def main(args):
 
     task = tasks.get_task(args.task)
 
+    pre_encoding = build_line_encoder(args, None) is not None
+    if pre_encoding:
+        assert args.dataset_impl != "raw", \
+            "--tokenizer/--bpe cannot be applied with --dataset-impl=raw"
+        assert not args.alignfile, \
+            "--alignfile refers to the original tokens and cannot be combined with --tokenizer/--bpe"
+
     def train_path(lang):
         return "{}{}".format(args.trainpref, ("." + lang) if lang else "")
 
@@ -46,15 +110,21 @@ def main(args):
     def dict_path(lang):
         return dest_path("dict", lang) + ".txt"
 
-    def build_dictionary(filenames, src=False, tgt=False, seg=False):
+    def build_dictionary(langs, src=False, tgt=False, seg=False):
         #assert src ^ tgt
         #assert src ^ seg
+        kwargs = {}
+        if pre_encoding:
+            # every file is tokenized with the rules of its own language, as
+            # when it is binarized
+            kwargs['tokenize'] = [build_line_encoder(args, lang) for lang in langs]
         return task.build_dictionary(
-            filenames,
+            [train_path(lang) for lang in langs],
             workers=args.workers,
             threshold=args.thresholdsrc if src else args.thresholdtgt,
             nwords=args.nwordssrc if src else args.nwordstgt,
             padding_factor=args.padding_factor,
+            **kwargs
         )
 
     if not args.srcdict and os.path.exists(dict_path(args.source_lang)):
@@ -78,23 +148,22 @@ def main(args):
             src_dict = task.load_dictionary(args.segdict) 
         else:
             assert args.trainpref, "--trainpref must be set if --srcdict is not specified"
-            src_dict = build_dictionary(
-                {train_path(lang) for lang in [args.source_lang, args.seg_lang, args.target_lang]}, src=True
-            )
+            langs = [args.source_lang] + ([args.seg_lang] if segmentation else []) + [args.target_lang]
+            src_dict = build_dictionary(sorted(set(langs), key=langs.index), src=True)
         tgt_dict = src_dict
     else:
         if args.srcdict:
             src_dict = task.load_dictionary(args.srcdict)
         else:
             assert args.trainpref, "--trainpref must be set if --srcdict is not specified"
-            src_dict = build_dictionary([train_path(args.source_lang)], src=True)
+            src_dict = build_dictionary([args.source_lang], src=True)
 
         if target:
             if args.tgtdict:
                 tgt_dict = task.load_dictionary(args.tgtdict)
             else:
                 assert args.trainpref, "--trainpref must be set if --tgtdict is not specified"
-                tgt_dict = build_dictionary([train_path(args.target_lang)], tgt=True)
+                tgt_dict = build_dictionary([args.target_lang], tgt=True)
         else:
             tgt_dict = None
 
@@ -103,7 +172,7 @@ def main(args):
                 seg_dict = task.load_dictionary(args.segdict)
             else:
                 assert args.trainpref, "--trainpref must be set if --segdict is not specified"
-                seg_dict = build_dictionary([train_path(args.seg_lang)], seg=True)
+                seg_dict = build_dictionary([args.seg_lang], seg=True)
         else:
             seg_dict = None
 
@@ -119,11 +188,13 @@ def main(args):
         print("| [{}] Dictionary: {} types".format(lang, len(vocab) - 1))
         n_seq_tok = [0, 0]
         replaced = Counter()
+        stage_times = Counter()
 
         def merge_result(worker_result):
             replaced.update(worker_result["replaced"])
             n_seq_tok[0] += worker_result["nseq"]
             n_seq_tok[1] += worker_result["ntok"]
+            stage_times.update(worker_result["times"])
 
         input_file = "{}{}".format(
             input_prefix, ("." + lang) if lang is not None else ""
@@ -152,8 +223,8 @@ def main(args):
         ds = indexed_dataset.make_builder(dataset_dest_file(args, output_prefix, lang, "bin"),
                                           impl=args.dataset_impl, vocab_size=len(vocab))
         merge_result(
-            Binarizer.binarize(
-                input_file, vocab, lambda t: ds.add_item(t),
+            binarize_to_consumer(
+                args, input_file, vocab, lambda t: ds.add_item(t), lang,
                 offset=0, end=offsets[1]
             )
         )
@@ -178,6 +249,19 @@ def main(args):
                 vocab.unk_word,
             )
         )
+        if pre_encoding and n_seq_tok[0] > 0:
+            # times are summed over workers, so these are per-worker rates
+            print(
+                "| [{}] {}: {} (lines/s per worker)".format(
+                    lang,
+                    input_file,
+                    ", ".join(
+                        "{} {:.0f}".format(stage, n_seq_tok[0] / stage_times[stage])
+                        for stage in ["tokenize", "bpe", "binarize"]
+                        if stage_times[stage] > 0
+                    ),
+                )
+            )
 
     def make_dataset(vocab, input_prefix, output_prefix, lang, num_workers=1):
         if args.dataset_impl == "raw":
@@ -268,12 +352,30 @@ def binarize(args, filename, vocab, output_prefix, lang, offset, end, append_eos
     def consumer(tensor):
         ds.add_item(tensor)
 
-    res = Binarizer.binarize(filename, vocab, consumer, append_eos=append_eos,
-                             offset=offset, end=end)
+    res = binarize_to_consumer(args, filename, vocab, consumer, lang, append_eos=append_eos,
+                               offset=offset, end=end)
     ds.finalize(dataset_dest_file(args, output_prefix, lang, "idx"))
     return res
 
 
+def binarize_to_consumer(args, filename, vocab, consumer, lang, append_eos=True, offset=0, end=-1):
+    """Binarize a chunk of *filename*, applying --tokenizer/--bpe on the fly
+    if they are set. The result includes the time spent in each stage."""
+    line_encoder = build_line_encoder(args, lang)
+    start = time.time()
+    if line_encoder is None:
+        res = Binarizer.binarize(filename, vocab, consumer, append_eos=append_eos,
+                                 offset=offset, end=end)
+        times = Counter()
+    else:
+        res = Binarizer.binarize(filename, vocab, consumer, tokenize=line_encoder,
+                                 append_eos=append_eos, offset=offset, end=end)
+        times = line_encoder.times
+    times["binarize"] += time.time() - start - sum(times.values())
+    res["times"] = times
+    return res
+
+
 #modified by Lihui Wang (2019-11-28)
 def dataset_dest_prefix(args, output_prefix, lang):
     base = "{}/{}".format(args.destdir, output_prefix)
@@ -294,6 +396,14 @@ def get_offsets(input_file, num_workers):
 
 def cli_main():
     parser = options.get_preprocessing_parser()
+    # options of the chosen --tokenizer/--bpe are only known after a first pass
+    known_args, _ = parser.parse_known_args()
+    for registry_name in ["tokenizer", "bpe"]:
+        choice = getattr(known_args, registry_name, None)
+        if choice is not None:
+            cls = REGISTRIES[registry_name]["registry"][choice]
+            if hasattr(cls, "add_args"):
+                cls.add_args(parser)
     args = parser.parse_args()
     main(args)
 
@@ -8,13 +8,21 @@ BLEU scoring of generated translations against reference translations.
 """
 
 import argparse
+import itertools
 import os
 import sys
+from multiprocessing import Pool
+
+import numpy as np
 
 from fairseq import bleu
 from fairseq.data import dictionary
 
 
+# number of sentence pairs sent to a worker at once
+CHUNK_SIZE = 10000
+
+
 def get_parser():
     parser = argparse.ArgumentParser(description='Command-line script for BLEU scoring.')
     # fmt: off
@@ -28,10 +36,32 @@ def get_parser():
                         help='score with sacrebleu')
     parser.add_argument('--sentence-bleu', action='store_true',
                         help='report sentence-level BLEUs (i.e., with +1 smoothing)')
+    parser.add_argument('--workers', default=1, metavar='N', type=int,
+                        help='number of processes extracting the sentence statistics')
+    parser.add_argument('--bootstrap', default=0, metavar='N', type=int,
+                        help='report a 95%% confidence interval from N bootstrap resamples')
     # fmt: on
     return parser
 
 
+def sentence_stats(pairs):
+    """BLEU statistics of a list of (sys, ref) lines."""
+    dict = dictionary.Dictionary()
+    return np.array([
+        bleu.sentence_stats(dict.encode_line(ref), dict.encode_line(sys), dict.pad(), dict.eos(), dict.unk())
+        for sys, ref in pairs
+    ], dtype=np.int64).reshape(-1, bleu.NUM_STATS)
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
 def main():
     parser = get_parser()
     args = parser.parse_args()
@@ -45,12 +75,22 @@ def main():
     dict = dictionary.Dictionary()
 
     def readlines(fd):
-        for line in fd.readlines():
+        for line in fd:
             if args.ignore_case:
                 yield line.lower()
             else:
                 yield line
 
+    def add_stats(scorer, fdsys, fdref):
+        pairs = chunks(zip(readlines(fdsys), readlines(fdref)), CHUNK_SIZE)
+        if args.workers > 1:
+            with Pool(args.workers) as pool:
+                for stats in pool.imap(sentence_stats, pairs):
+                    scorer.add_stats(stats)
+        else:
+            for chunk in pairs:
+                scorer.add_stats(sentence_stats(chunk))
+
     if args.sacrebleu:
         import sacrebleu
 
@@ -60,22 +100,21 @@ def main():
     elif args.sentence_bleu:
         def score(fdsys):
             with open(args.ref) as fdref:
-                scorer = bleu.Scorer(dict.pad(), dict.eos(), dict.unk())
-                for i, (sys_tok, ref_tok) in enumerate(zip(readlines(fdsys), readlines(fdref))):
-                    scorer.reset(one_init=True)
-                    sys_tok = dict.encode_line(sys_tok)
-                    ref_tok = dict.encode_line(ref_tok)
-                    scorer.add(ref_tok, sys_tok)
-                    print(i, scorer.result_string(args.order))
+                scorer = bleu.CachedScorer(dict.pad(), dict.eos(), dict.unk())
+                scorer.reset(one_init=True)
+                add_stats(scorer, fdsys, fdref)
+                for i in range(len(scorer)):
+                    print(i, scorer.result_string(args.order, indices=[i]))
     else:
         def score(fdsys):
             with open(args.ref) as fdref:
-                scorer = bleu.Scorer(dict.pad(), dict.eos(), dict.unk())
-                for sys_tok, ref_tok in zip(readlines(fdsys), readlines(fdref)):
-                    sys_tok = dict.encode_line(sys_tok)
-                    ref_tok = dict.encode_line(ref_tok)
-                    scorer.add(ref_tok, sys_tok)
+                scorer = bleu.CachedScorer(dict.pad(), dict.eos(), dict.unk())
+                add_stats(scorer, fdsys, fdref)
                 print(scorer.result_string(args.order))
+                if args.bootstrap > 0:
+                    scores = scorer.bootstrap(args.bootstrap, order=args.order)
+                    print('BLEU{} bootstrap ({} samples): mean = {:2.2f}, 95% CI = [{:2.2f}, {:2.2f}]'.format(
+                        args.order, args.bootstrap, scores.mean(), *np.percentile(scores, [2.5, 97.5])))
 
     if args.sys == '-':
         score(sys.stdin)
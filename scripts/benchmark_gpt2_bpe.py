@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Benchmark the GPT-2 BPE encoder against the classic pairwise-merge loop on a
+fixed corpus, and check that both produce identical segmentations.
+"""
+
+import argparse
+import time
+
+from fairseq.data.encoders.gpt2_bpe_utils import DEFAULT_CACHE_SIZE, get_encoder
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--encoder-json', required=True, help='path to encoder.json')
+    parser.add_argument('--vocab-bpe', required=True, help='path to vocab.bpe')
+    parser.add_argument('--input', required=True, help='fixed text corpus to encode')
+    parser.add_argument('--max-lines', type=int, default=100000,
+                        help='only use the first N lines of the corpus')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help='max number of words in the BPE word cache')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='number of lines per encode_many call')
+    args = parser.parse_args()
+
+    with open(args.input, 'r', encoding='utf-8') as h:
+        lines = [line.rstrip('\n') for _, line in zip(range(args.max_lines), h)]
+
+    encoder = get_encoder(args.encoder_json, args.vocab_bpe, cache_size=args.cache_size)
+    words = []
+    for line in lines:
+        for token in encoder.re.findall(encoder.pat, line):
+            words.append(''.join(encoder.byte_encoder[b] for b in token.encode('utf-8')))
+    unique_words = list(set(words))
+    print('| {} lines, {} words, {} unique words'.format(len(lines), len(words), len(unique_words)))
+
+    # merge engine only (no cache), on the unique words
+    start = time.time()
+    reference = [encoder.bpe_pairwise(w) for w in unique_words]
+    pairwise_time = time.time() - start
+
+    encoder.cache.clear()
+    start = time.time()
+    merged = [encoder.bpe(w) for w in unique_words]
+    heap_time = time.time() - start
+    assert merged == reference, 'BPE segmentations differ from the pairwise reference'
+    print('| merge engine: pairwise {:.2f}s, heap {:.2f}s ({:.2f}x speedup)'.format(
+        pairwise_time, heap_time, pairwise_time / heap_time))
+
+    # end-to-end encoding with the word cache
+    encoder = get_encoder(args.encoder_json, args.vocab_bpe, cache_size=args.cache_size)
+    start = time.time()
+    single = [encoder.encode(line) for line in lines]
+    encode_time = time.time() - start
+
+    encoder = get_encoder(args.encoder_json, args.vocab_bpe, cache_size=args.cache_size)
+    start = time.time()
+    batched = []
+    for i in range(0, len(lines), args.batch_size):
+        batched.extend(encoder.encode_many(lines[i:i + args.batch_size]))
+    encode_many_time = time.time() - start
+    assert batched == single, 'encode_many output differs from encode'
+    print('| encode: {:.2f}s ({:.0f} lines/s), encode_many: {:.2f}s ({:.0f} lines/s)'.format(
+        encode_time, len(lines) / encode_time, encode_many_time, len(lines) / encode_many_time))
+    print('| cache: {}'.format(encoder.cache.stats()))
+
+
+if __name__ == '__main__':
+    main()
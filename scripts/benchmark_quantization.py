@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Benchmark generation on CPU with the models in FP32 and with their linear and
+LSTM layers dynamically quantized to int8 (see generate.py --quantize), and
+report the speed and BLEU of both on a held-out set, e.g.::
+
+    python scripts/benchmark_quantization.py data-bin/wmt14.en-de \\
+        --path checkpoint_best.pt --gen-subset valid --beam 4 --remove-bpe
+"""
+
+from fairseq import bleu, checkpoint_utils, options, tasks, utils
+from fairseq.meters import StopwatchMeter
+
+
+def generate(args, task, quantize):
+    models, _model_args = checkpoint_utils.load_model_ensemble(
+        args.path.split(':'),
+        arg_overrides=eval(args.model_overrides),
+        task=task,
+    )
+    for model in models:
+        model.make_generation_fast_(beamable_mm_beam_size=None if args.no_beamable_mm else args.beam)
+        if quantize:
+            model.quantize_()
+
+    itr = task.get_batch_iterator(
+        dataset=task.dataset(args.gen_subset),
+        max_tokens=args.max_tokens,
+        max_sentences=args.max_sentences,
+        max_positions=utils.resolve_max_positions(
+            task.max_positions(),
+            *[model.max_positions() for model in models]
+        ),
+        ignore_invalid_inputs=args.skip_invalid_size_inputs_valid_test,
+        required_batch_size_multiple=args.required_batch_size_multiple,
+    ).next_epoch_itr(shuffle=False)
+
+    generator = task.build_generator(args)
+    tgt_dict = task.target_dictionary
+    scorer = bleu.Scorer(tgt_dict.pad(), tgt_dict.eos(), tgt_dict.unk())
+    gen_timer = StopwatchMeter()
+    num_sentences = 0
+    for sample in itr:
+        if 'net_input' not in sample:
+            continue
+        gen_timer.start()
+        hypos = task.inference_step(generator, models, sample)
+        gen_timer.stop(sum(len(h[0]['tokens']) for h in hypos))
+        num_sentences += sample['nsentences']
+
+        for i in range(len(hypos)):
+            target_tokens = utils.strip_pad(sample['target'][i, :], tgt_dict.pad()).int()
+            target_str = tgt_dict.string(target_tokens, args.remove_bpe, escape_unk=True)
+            hypo_tokens, _hypo_str, _alignment = utils.post_process_prediction(
+                hypo_tokens=hypos[i][0]['tokens'].int(),
+                src_str='',
+                alignment=None,
+                align_dict=None,
+                tgt_dict=tgt_dict,
+                remove_bpe=args.remove_bpe,
+            )
+            if args.remove_bpe is not None:
+                target_tokens = tgt_dict.encode_line(target_str, add_if_not_exist=True)
+            scorer.add(target_tokens, hypo_tokens)
+
+    print('| {}: {} sentences ({} tokens) in {:.1f}s ({:.2f} tokens/s), {}'.format(
+        'int8' if quantize else 'fp32', num_sentences, gen_timer.n, gen_timer.sum,
+        1. / gen_timer.avg, scorer.result_string(),
+    ))
+    return 1. / gen_timer.avg, scorer.score()
+
+
+def main(args):
+    assert args.path is not None, '--path required for generation!'
+    utils.import_user_module(args)
+    if args.max_tokens is None and args.max_sentences is None:
+        args.max_tokens = 12000
+    print(args)
+
+    task = tasks.setup_task(args)
+    task.load_dataset(args.gen_subset)
+
+    fp32_speed, fp32_bleu = generate(args, task, quantize=False)
+    int8_speed, int8_bleu = generate(args, task, quantize=True)
+    print('| int8 vs. fp32: {:.2f}x tokens/s, BLEU delta {:+.2f}'.format(
+        int8_speed / fp32_speed, int8_bleu - fp32_bleu,
+    ))
+
+
+def cli_main():
+    parser = options.get_generation_parser()
+    args = options.parse_args_and_arch(parser)
+    main(args)
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Build the lexical translation table used by generate.py --shortlist from a
+word-aligned parallel corpus, e.g., the aligned.sym_heuristic file written by
+build_sym_alignment.py (or any fast_align style output with one line of
+``i-j`` source-target index pairs per sentence pair).
+
+The source and target files must contain the same (e.g., BPE) tokens as the
+binarized data, so that the words match the entries of the dictionaries.
+The table lists the ``source_word target_word p(target|source)`` triples of
+the most likely translations of each source word.
+"""
+
+import argparse
+from collections import Counter, defaultdict
+from itertools import zip_longest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='lexical translation table builder')
+    # fmt: off
+    parser.add_argument('--source-file', required=True,
+                        help='path to a file with sentences in the source language')
+    parser.add_argument('--target-file', required=True,
+                        help='path to a file with sentences in the target language')
+    parser.add_argument('--alignment-file', required=True,
+                        help='path to the word alignments of the sentence pairs')
+    parser.add_argument('--output', required=True,
+                        help='path to the lexical translation table')
+    parser.add_argument('--max-translations', type=int, default=200, metavar='N',
+                        help='keep the N most likely translations of each source word')
+    # fmt: on
+    args = parser.parse_args()
+
+    pair_counts = defaultdict(Counter)
+    with open(args.source_file, 'r', encoding='utf-8') as src, \
+            open(args.target_file, 'r', encoding='utf-8') as tgt, \
+            open(args.alignment_file, 'r', encoding='utf-8') as align:
+        for s, t, a in zip_longest(src, tgt, align):
+            assert s is not None and t is not None and a is not None, \
+                'the source, target and alignment files must have the same number of lines'
+            s, t = s.split(), t.split()
+            for pair in a.split():
+                i, j = pair.split('-')
+                pair_counts[s[int(i)]][t[int(j)]] += 1
+
+    with open(args.output, 'w', encoding='utf-8') as out:
+        for src_word in sorted(pair_counts):
+            counts = pair_counts[src_word]
+            total = sum(counts.values())
+            for tgt_word, count in counts.most_common(args.max_translations):
+                print('{} {} {:.6g}'.format(src_word, tgt_word, count / total), file=out)
+
+
+if __name__ == '__main__':
+    main()
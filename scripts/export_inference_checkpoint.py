@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Strip a training checkpoint down to the model args and weights, in a format
+that is memory-mapped (instead of unpickled) when loaded for inference.
+
+With --quantize, the model is built (which requires the dictionaries of the
+task) and its linear and LSTM layers are quantized to int8 instead; such
+checkpoints are unpickled as usual and can only be used on CPU.
+"""
+
+import argparse
+import os
+
+import torch
+
+from fairseq import checkpoint_utils
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Exports a checkpoint for inference. The output can be passed '
+                    'to --path like any other checkpoint.',
+    )
+    # fmt: off
+    parser.add_argument('--input', required=True, metavar='FILE',
+                        help='training checkpoint')
+    parser.add_argument('--output', required=True, metavar='FILE',
+                        help='output inference checkpoint')
+    parser.add_argument('--fp16', action='store_true',
+                        help='store floating point weights in FP16 (requires --fp16 at inference)')
+    parser.add_argument('--quantize', action='store_true',
+                        help='store a model with dynamically quantized int8 linear and LSTM layers '
+                             '(requires --cpu at inference)')
+    # fmt: on
+    args = parser.parse_args()
+    assert not (args.fp16 and args.quantize), '--fp16 and --quantize are mutually exclusive'
+    print(args)
+
+    if args.quantize:
+        models, model_args = checkpoint_utils.load_model_ensemble([args.input])
+        model = models[0]
+        model.quantize_()
+        checkpoint_utils.save_quantized_checkpoint(args.output, model_args, model)
+    else:
+        state = checkpoint_utils.load_checkpoint_to_cpu(args.input)
+        checkpoint_utils.save_inference_checkpoint(
+            args.output, state['args'], state['model'],
+            dtype=torch.float16 if args.fp16 else None,
+        )
+    print('| exported {} ({:.1f} MB) to {} ({:.1f} MB)'.format(
+        args.input, os.path.getsize(args.input) / 2 ** 20,
+        args.output, os.path.getsize(args.output) / 2 ** 20,
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Compile the beam search with a transformer checkpoint to TorchScript (see
+fairseq/scripted_sequence_generator.py) and save it together with the
+dictionaries of the task, so that it can be run without fairseq::
+
+    model = torch.jit.load('model.pt', _extra_files=extra_files)
+    tokens, scores, positional_scores, lengths = model(src_tokens, beam_size)
+"""
+
+import argparse
+import io
+import os
+
+import torch
+
+from fairseq import checkpoint_utils, tasks
+from fairseq.scripted_sequence_generator import script_transformer
+
+
+def dictionary_string(dictionary):
+    f = io.StringIO()
+    dictionary.save(f)
+    return f.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Exports a transformer checkpoint with its beam search compiled to TorchScript.',
+    )
+    # fmt: off
+    parser.add_argument('--input', required=True, metavar='FILE',
+                        help='checkpoint of a transformer model')
+    parser.add_argument('--output', required=True, metavar='FILE',
+                        help='output TorchScript module')
+    parser.add_argument('--data', default=None, metavar='DIR',
+                        help='directory with the dictionaries (default: the data directory of the checkpoint)')
+    parser.add_argument('--quantize', action='store_true',
+                        help='quantize the linear layers to int8 (the output can only be run on CPU)')
+    # fmt: on
+    args = parser.parse_args()
+    print(args)
+
+    state = checkpoint_utils.load_checkpoint_to_cpu(args.input)
+    model_args = state['args']
+    if args.data is not None:
+        model_args.data = args.data
+    task = tasks.setup_task(model_args)
+    models, _model_args = checkpoint_utils.load_model_ensemble([args.input], task=task)
+    model = models[0]
+    if args.quantize:
+        model.quantize_()
+
+    scripted_model = script_transformer(model, task.target_dictionary)
+    extra_files = {'tgt_dict.txt': dictionary_string(task.target_dictionary)}
+    if task.source_dictionary is not None:
+        extra_files['src_dict.txt'] = dictionary_string(task.source_dictionary)
+    torch.jit.save(scripted_model, args.output, _extra_files=extra_files)
+    print('| exported {} to {} ({:.1f} MB)'.format(
+        args.input, args.output, os.path.getsize(args.output) / 2 ** 20,
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,11 +6,17 @@
 
 """
 Helper script to pre-compute embeddings for a wav2letter++ dataset
+
+Audio files are decoded in a pool of worker processes and grouped into
+batches of files of similar length, which are padded and featurized
+together.
 """
 
 import argparse
+import collections
 import glob
 import os
+from multiprocessing import Pool
 from shutil import copy
 
 import h5py
@@ -20,6 +26,7 @@ import torch
 from torch import nn
 import tqdm
 
+from fairseq.data import indexed_dataset
 from fairseq.models.wav2vec import Wav2VecModel
 
 
@@ -32,12 +39,35 @@ def read_audio(fname):
     return wav, 16e3
 
 
+def read_batch(fnames):
+    """ Load the audio files of a batch (in a worker process) """
+
+    return [read_audio(fname)[0].astype(np.float32) for fname in fnames]
+
+
+def make_batches(sizes, max_tokens, max_sentences):
+    """ Group files of similar length into batches of at most max_tokens padded samples """
+
+    batches, batch, batch_max = [], [], 0
+    for i in np.argsort(sizes, kind="mergesort"):
+        if len(batch) > 0 and (
+            len(batch) == max_sentences or (len(batch) + 1) * max(batch_max, sizes[i]) > max_tokens
+        ):
+            batches.append(batch)
+            batch, batch_max = [], 0
+        batch.append(i)
+        batch_max = max(batch_max, sizes[i])
+    if len(batch) > 0:
+        batches.append(batch)
+    return batches
+
+
 class PretrainedWav2VecModel(nn.Module):
 
     def __init__(self, fname):
         super().__init__()
 
-        checkpoint = torch.load(fname)
+        checkpoint = torch.load(fname, map_location="cpu")
         self.args = checkpoint["args"]
         model = Wav2VecModel.build_model(self.args, None)
         model.load_state_dict(checkpoint["model"])
@@ -78,22 +108,46 @@ class EmbeddingWriterConfig(argparse.ArgumentParser):
                           help="Use the feature vector ('z') instead of context vector ('c') for features")
         self.add_argument("--gpu",
                           help="GPU to use", default=0, type=int)
+        self.add_argument("--cpu", action="store_true",
+                          help="Featurize on the CPU")
+        self.add_argument("--output-format", default="h5", choices=["h5", "mmap"],
+                          help="Write one hdf5 file per audio file (h5) or all features of a split into one "
+                               "memory-mapped indexed dataset <output>/<split>/features.{bin,idx} (mmap)")
+        self.add_argument("--workers", default=os.cpu_count(), type=int,
+                          help="Number of processes decoding audio")
+        self.add_argument("--max-tokens", default=1600000, type=int,
+                          help="Maximum number of (padded) audio samples in a batch")
+        self.add_argument("--max-sentences", default=64, type=int,
+                          help="Maximum number of audio files in a batch")
 
 
 class Prediction():
     """ Lightweight wrapper around a fairspeech embedding model """
 
-    def __init__(self, fname, gpu=0):
-        self.gpu = gpu
-        self.model = PretrainedWav2VecModel(fname).cuda(gpu)
+    def __init__(self, fname, gpu=0, cpu=False):
+        self.device = torch.device("cpu") if cpu else torch.device("cuda", gpu)
+        self.model = PretrainedWav2VecModel(fname).to(self.device)
 
     def __call__(self, x):
-        x = torch.from_numpy(x).float().cuda(self.gpu)
+        x = torch.from_numpy(x).float().to(self.device)
         with torch.no_grad():
             z, c = self.model(x.unsqueeze(0))
 
         return z.squeeze(0).cpu().numpy(), c.squeeze(0).cpu().numpy()
 
+    def batch(self, wavs):
+        """ Featurize a list of waveforms as one padded batch """
+
+        lengths = torch.LongTensor([len(wav) for wav in wavs])
+        x = torch.zeros(len(wavs), lengths.max().item())
+        for i, wav in enumerate(wavs):
+            x[i, :len(wav)] = torch.from_numpy(wav)
+        with torch.no_grad():
+            z, c, lengths = self.model.model.extract_features(x.to(self.device), lengths.to(self.device))
+        z, c = z.cpu().numpy(), c.cpu().numpy()
+
+        return [(z[i, :, :length], c[i, :, :length]) for i, length in enumerate(lengths.tolist())]
+
 
 class H5Writer():
     """ Write features as hdf5 file in wav2letter++ compatible format """
@@ -111,6 +165,36 @@ class H5Writer():
             out_ds["info"] = np.array([16e3 // 160, T, channel])
 
 
+class IndexedWriter():
+    """ Write the features of all files of a split into one memory-mapped indexed dataset
+
+    Item i holds the T x C features of the i-th file listed in <prefix>.tsv,
+    whose first line is the feature dimension C.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        os.makedirs(os.path.dirname(self.prefix), exist_ok=True)
+        self.builder = indexed_dataset.MMapIndexedDatasetBuilder(
+            indexed_dataset.data_file_path(prefix), dtype=np.float32,
+        )
+        self.manifest = open(prefix + ".tsv", "w")
+        self.channel = None
+
+    def write(self, fname, data):
+        channel, T = data.shape
+        if self.channel is None:
+            self.channel = channel
+            print(channel, file=self.manifest)
+
+        self.builder.add_item(torch.from_numpy(np.ascontiguousarray(data.T)))
+        print("{}\t{}".format(fname, T), file=self.manifest)
+
+    def close(self):
+        self.builder.finalize(indexed_dataset.index_file_path(self.prefix))
+        self.manifest.close()
+
+
 class EmbeddingDatasetWriter(object):
     """ Given a model and a wav2letter++ dataset, pre-compute and store embeddings
 
@@ -129,12 +213,17 @@ class EmbeddingDatasetWriter(object):
                  gpu=0,
                  verbose=False,
                  use_feat=False,
+                 cpu=False,
+                 output_format="h5",
+                 workers=0,
+                 max_tokens=1600000,
+                 max_sentences=64,
                  ):
 
         assert os.path.exists(model_fname)
 
         self.model_fname = model_fname
-        self.model = Prediction(self.model_fname, gpu)
+        self.model = Prediction(self.model_fname, gpu, cpu)
 
         self.input_root = input_root
         self.output_root = output_root
@@ -142,6 +231,10 @@ class EmbeddingDatasetWriter(object):
         self.verbose = verbose
         self.extension = extension
         self.use_feat = use_feat
+        self.output_format = output_format
+        self.workers = workers
+        self.max_tokens = max_tokens
+        self.max_sentences = max_sentences
 
         assert os.path.exists(self.input_path), \
             "Input path '{}' does not exist".format(self.input_path)
@@ -187,19 +280,59 @@ class EmbeddingDatasetWriter(object):
     def __len__(self):
         return len(self.input_fnames)
 
+    def read_batches(self, paths, batches):
+        """ Decode the batches in order, keeping a few batches ahead in the worker pool """
+
+        if self.workers <= 0:
+            for batch in batches:
+                yield batch, read_batch([paths[i] for i in batch])
+            return
+
+        with Pool(self.workers) as pool:
+            pending = collections.deque()
+            batches = iter(batches)
+            while True:
+                while len(pending) < 2 * self.workers:
+                    batch = next(batches, None)
+                    if batch is None:
+                        break
+                    pending.append((batch, pool.apply_async(read_batch, ([paths[i] for i in batch], ))))
+                if len(pending) == 0:
+                    return
+                batch, wavs = pending.popleft()
+                yield batch, wavs.get()
+
     def write_features(self):
 
         paths = self.input_fnames
 
-        fnames_context = map(lambda x: os.path.join(self.output_path, x.replace("." + self.extension, ".h5context")), \
-                             map(os.path.basename, paths))
-
-        for name, target_fname in self._progress(zip(paths, fnames_context), total=len(self)):
-            wav, sr = read_audio(name)
-            z, c = self.model(wav)
-            feat = z if self.use_feat else c
-            writer = H5Writer(target_fname)
-            writer.write(feat)
+        # read the lengths from the file headers only
+        sizes = np.array([sf.info(path).frames for path in paths])
+        batches = make_batches(sizes, self.max_tokens, self.max_sentences)
+
+        if self.output_format == "mmap":
+            writer = IndexedWriter(self.get_output_path("features"))
+        else:
+            writer = None
+
+        progress = tqdm.tqdm(total=len(self)) if self.verbose else None
+        for batch, wavs in self.read_batches(paths, batches):
+            for i, (z, c) in zip(batch, self.model.batch(wavs)):
+                feat = z if self.use_feat else c
+                if writer is not None:
+                    writer.write(os.path.basename(paths[i]), feat)
+                else:
+                    target_fname = os.path.join(
+                        self.output_path, os.path.basename(paths[i]).replace("." + self.extension, ".h5context"),
+                    )
+                    H5Writer(target_fname).write(feat)
+            if progress is not None:
+                progress.update(len(batch))
+
+        if progress is not None:
+            progress.close()
+        if writer is not None:
+            writer.close()
 
     def __repr__(self):
 
@@ -221,6 +354,11 @@ if __name__ == "__main__":
             gpu=args.gpu,
             extension=args.ext,
             use_feat=args.use_feat,
+            cpu=args.cpu,
+            output_format=args.output_format,
+            workers=args.workers,
+            max_tokens=args.max_tokens,
+            max_sentences=args.max_sentences,
         )
 
         print(writer)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Decode (and resample) the audio files of a manifest written by
+wav2vec_manifest.py once, and pack the waveforms into a single memory-mapped
+file that the audio_pretraining task reads instead of the audio files.
+"""
+
+import argparse
+import os
+from multiprocessing import Pool
+
+from fairseq.data import FileAudioDataset, MMapAudioDatasetBuilder
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('manifest', metavar='TSV', help='manifest of the audio files (e.g., train.tsv)')
+    parser.add_argument('--dest', default=None, type=str, metavar='PREFIX',
+                        help='output prefix (default: manifest path without .tsv, which is where '
+                             'the audio_pretraining task looks for it)')
+    parser.add_argument('--sample-rate', default=16000, type=int, metavar='N',
+                        help='resample the audio to this rate')
+    parser.add_argument('--int16', action='store_true',
+                        help='store the waveforms as 16-bit integers instead of 32-bit floats')
+    parser.add_argument('--workers', default=os.cpu_count(), type=int, metavar='N',
+                        help='number of processes decoding audio')
+    return parser
+
+
+_dataset = None
+
+
+def _init_worker(dataset):
+    global _dataset
+    _dataset = dataset
+
+
+def _read(index):
+    return _dataset[index]['source'].numpy()
+
+
+def main(args):
+    dest = args.dest if args.dest is not None else os.path.splitext(args.manifest)[0]
+    dataset = FileAudioDataset(args.manifest, sample_rate=args.sample_rate)
+    builder = MMapAudioDatasetBuilder(dest, args.sample_rate, int16=args.int16)
+
+    with Pool(args.workers, initializer=_init_worker, initargs=(dataset, )) as pool:
+        for i, wav in enumerate(pool.imap(_read, range(len(dataset)), chunksize=64)):
+            builder.add_item(wav)
+            if (i + 1) % 10000 == 0:
+                print('| packed {} of {} files'.format(i + 1, len(dataset)))
+    builder.finalize()
+    print('| packed {} files into {}'.format(len(dataset), dest))
+
+
+if __name__ == '__main__':
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
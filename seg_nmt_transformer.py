@@ -121,6 +121,9 @@ class Seg_NMT_TransformerModel(FairseqEncoderDecoderDoubleModel):
                             help='LayerDrop probability for encoder')
         parser.add_argument('--decoder-layerdrop', type=float, metavar='D', default=0,
                             help='LayerDrop probability for decoder')
+        parser.add_argument('--checkpoint-activations', type=int, metavar='N', default=0,
+                            help='recompute the activations of every N-th encoder and decoder layer '
+                                 'during the backward pass instead of storing them (0 disables)')
         parser.add_argument('--encoder-layers-to-keep', default=None,
                             help='which layers to *keep* when pruning as a comma-separated list')
         parser.add_argument('--decoder-layers-to-keep', default=None,
@@ -276,6 +279,7 @@ class TransformerEncoder(FairseqEncoder):
 
         self.dropout = args.dropout
         self.encoder_layerdrop = args.encoder_layerdrop
+        self.checkpoint_activations = getattr(args, 'checkpoint_activations', 0)
 
         embed_dim = embed_tokens.embedding_dim
         self.padding_idx = embed_tokens.padding_idx
@@ -346,11 +350,16 @@ class TransformerEncoder(FairseqEncoder):
         encoder_states = [] if return_all_hiddens else None
 
         # encoder layers
-        for layer in self.layers:
+        for idx, layer in enumerate(self.layers):
             # add LayerDrop (see https://arxiv.org/abs/1909.11556 for description)
             dropout_probability = random.uniform(0, 1)
             if not self.training or (dropout_probability > self.encoder_layerdrop):
-                x = layer(x, encoder_padding_mask)
+                if utils.should_checkpoint(self, idx, self.checkpoint_activations):
+                    x = utils.checkpoint_activations(
+                        lambda x, layer=layer: layer(x, encoder_padding_mask), x,
+                    )
+                else:
+                    x = layer(x, encoder_padding_mask)
                 if return_all_hiddens:
                     encoder_states.append(x)
 
@@ -441,6 +450,7 @@ class TransformerDecoder(FairseqIncrementalDecoder):
 
         self.dropout = args.dropout
         self.decoder_layerdrop = args.decoder_layerdrop
+        self.checkpoint_activations = getattr(args, 'checkpoint_activations', 0)
         self.share_input_output_embed = args.share_decoder_input_output_embed
 
         input_embed_dim = embed_tokens.embedding_dim
@@ -470,6 +480,8 @@ class TransformerDecoder(FairseqIncrementalDecoder):
         ])
 
         self.adaptive_softmax = None
+        self.shortlist_weight = None
+        self.output_projection = None
 
         self.project_out_dim = Linear(embed_dim, self.output_embed_dim, bias=False) \
             if embed_dim != self.output_embed_dim and not args.tie_adaptive_weights else None
@@ -603,16 +615,23 @@ class TransformerDecoder(FairseqIncrementalDecoder):
             # add LayerDrop (see https://arxiv.org/abs/1909.11556 for description)
             dropout_probability = random.uniform(0, 1)
             if not self.training or (dropout_probability > self.decoder_layerdrop):
-                x, layer_attn = layer(
-                    x,
-                    encoder_state,
-                    encoder_out['encoder_padding_mask'] if encoder_out is not None else None,
-                    incremental_state,
-                    self_attn_mask=self_attn_mask,
-                    self_attn_padding_mask=self_attn_padding_mask,
-                    need_attn=(idx == alignment_layer),
-                    need_head_weights=(idx == alignment_layer),
-                )
+                def run_layer(x, *encoder_state, layer=layer, idx=idx, self_attn_mask=self_attn_mask):
+                    return layer(
+                        x,
+                        encoder_state[0] if encoder_state else None,
+                        encoder_out['encoder_padding_mask'] if encoder_out is not None else None,
+                        incremental_state,
+                        self_attn_mask=self_attn_mask,
+                        self_attn_padding_mask=self_attn_padding_mask,
+                        need_attn=(idx == alignment_layer),
+                        need_head_weights=(idx == alignment_layer),
+                    )
+
+                layer_inputs = [x] if encoder_state is None else [x, encoder_state]
+                if incremental_state is None and utils.should_checkpoint(self, idx, self.checkpoint_activations):
+                    x, layer_attn = utils.checkpoint_activations(run_layer, *layer_inputs)
+                else:
+                    x, layer_attn = run_layer(*layer_inputs)
                 inner_states.append(x)
                 if layer_attn is not None and idx == alignment_layer:
                     attn = layer_attn.float()
@@ -635,17 +654,48 @@ class TransformerDecoder(FairseqIncrementalDecoder):
 
         return x, {'attn': attn, 'inner_states': inner_states}
 
+    def set_output_shortlist(self, candidates):
+        """Project the features onto the vocabulary entries *candidates*
+        only (see :class:`~fairseq.lexical_shortlist.LexicalShortlist`), or
+        onto the whole vocabulary if None."""
+        if candidates is None:
+            self.shortlist_weight = None
+            return
+        assert self.adaptive_softmax is None, 'a shortlist is not supported with adaptive softmax'
+        self.shortlist_weight = self.output_weight().index_select(0, candidates)
+
+    def output_weight(self):
+        """The weight matrix of the output projection; once the model is
+        quantized (see :func:`~fairseq.models.BaseFairseqModel.quantize_`),
+        the dequantized weights of :attr:`output_projection`."""
+        if self.output_projection is not None:
+            weight = self.output_projection.weight
+            # dynamically quantized linear layers return their int8 weights
+            return weight().dequantize() if callable(weight) else weight
+        if self.share_input_output_embed:
+            return self.embed_tokens.weight
+        return self.embed_out
+
     def output_layer(self, features, **kwargs):
         """Project features to the vocabulary size."""
+        if self.shortlist_weight is not None:
+            return F.linear(features, self.shortlist_weight)
         if self.adaptive_softmax is None:
             # project back to size of vocabulary
-            if self.share_input_output_embed:
-                return F.linear(features, self.embed_tokens.weight)
-            else:
-                return F.linear(features, self.embed_out)
+            if self.output_projection is not None:
+                return self.output_projection(features)
+            return F.linear(features, self.output_weight())
         else:
             return features
 
+    def prepare_for_quantization_(self):
+        if self.adaptive_softmax is None:
+            # a linear layer that shares the output weights, so that it is
+            # quantized with the other linear layers
+            weight = self.output_weight()
+            self.output_projection = nn.Linear(weight.size(1), weight.size(0), bias=False)
+            self.output_projection.weight = weight
+
     def max_positions(self):
         """Maximum output length supported by the decoder."""
         if self.embed_positions is None:
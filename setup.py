@@ -97,6 +97,7 @@ setup(
     test_suite='tests',
     entry_points={
         'console_scripts': [
+            'fairseq-backtranslate = fairseq_cli.backtranslate:cli_main',
             'fairseq-eval-lm = fairseq_cli.eval_lm:cli_main',
             'fairseq-generate = fairseq_cli.generate:cli_main',
             'fairseq-interactive = fairseq_cli.interactive:cli_main',
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import json
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+from fairseq.data.indexed_dataset import (
+    MMapIndexedDatasetBuilder,
+    data_file_path,
+    index_file_path,
+)
+from examples.speech_recognition.data import MMapAsrDataset
+from examples.speech_recognition.data.asr_dataset import fbank_stats_file_path
+from examples.speech_recognition.tasks.speech_recognition import get_asr_dataset_from_json
+from tests.speech_recognition.asr_test_base import get_dummy_dictionary
+
+
+class TestMMapAsrDataset(unittest.TestCase):
+
+    def setUp(self):
+        self.tgt_dict = get_dummy_dictionary(vocab_size=20)
+        self.num_mel_bins = 4
+        # utterances with their durations (ms) and number of frames
+        self.utts = [("1-2-1", 120, 10), ("1-2-2", 240, 22), ("3-4-1", 60, 4)]
+        rng = np.random.RandomState(0)
+        self.features = {
+            utt_id: rng.randn(num_frames, self.num_mel_bins).astype(np.float16)
+            for utt_id, _, num_frames in self.utts
+        }
+
+    def _prepare(self, data_dir):
+        utts = {}
+        for utt_id, length_ms, _ in self.utts:
+            utts[utt_id] = {
+                "input": {"length_ms": length_ms, "path": "/nonexistent/{}.wav".format(utt_id)},
+                "output": {"text": "", "token": "", "tokenid": "5, 6, 7"},
+            }
+        json_path = os.path.join(data_dir, "train.json")
+        with open(json_path, "w") as f:
+            json.dump({"utts": utts}, f)
+
+        # the store follows the (length sorted) order of the manifest
+        ids = get_asr_dataset_from_json(json_path, self.tgt_dict).ids
+        prefix = os.path.join(data_dir, "train.fbank")
+        builder = MMapIndexedDatasetBuilder(data_file_path(prefix), dtype=np.float16)
+        for utt_id in ids:
+            builder.add_item(torch.from_numpy(self.features[utt_id]))
+        builder.finalize(index_file_path(prefix))
+        np.savez(
+            fbank_stats_file_path(prefix),
+            ids=np.array(ids),
+            mean=np.zeros((len(ids), self.num_mel_bins)),
+            invstddev=np.ones((len(ids), self.num_mel_bins)),
+            num_mel_bins=self.num_mel_bins,
+            frame_length=25.0,
+            frame_shift=10.0,
+        )
+        return json_path, prefix
+
+    def test_mmap_asr_dataset(self):
+        with tempfile.TemporaryDirectory("test_mmap_asr_dataset") as data_dir:
+            json_path, prefix = self._prepare(data_dir)
+            self.assertTrue(MMapAsrDataset.exists(prefix))
+            dataset = get_asr_dataset_from_json(json_path, self.tgt_dict, prefix)
+            self.assertIsInstance(dataset, MMapAsrDataset)
+            self.assertEqual(dataset.ids, ["1-2-2", "1-2-1", "3-4-1"])
+            self.assertEqual(list(dataset.frame_sizes), [22, 10, 4])
+            self.assertEqual(dataset.size(1), (10, 4))
+
+            for i, utt_id in enumerate(dataset.ids):
+                frames = dataset[i]["data"][0]
+                self.assertTrue(np.array_equal(frames.numpy(), self.features[utt_id]))
+
+            dataset = pickle.loads(pickle.dumps(dataset))
+            batch = dataset.collater([dataset[i] for i in [2, 0]])
+            src_tokens = batch["net_input"]["src_tokens"]
+            self.assertEqual(src_tokens.dtype, torch.float)
+            self.assertEqual(tuple(src_tokens.size()), (2, 22, self.num_mel_bins))
+            self.assertEqual(batch["id"].tolist(), [0, 2])
+            self.assertEqual(batch["net_input"]["src_lengths"].tolist(), [22, 4])
+            self.assertTrue(np.array_equal(
+                src_tokens[1, :4].numpy(), self.features["3-4-1"].astype(np.float32),
+            ))
+            self.assertEqual(src_tokens[1, 4:].abs().sum().item(), 0)
+            self.assertEqual(batch["target"][0].tolist(), [5, 6, 7, self.tgt_dict.eos()])
+
+
+if __name__ == "__main__":
+    unittest.main()
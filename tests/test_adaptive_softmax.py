@@ -0,0 +1,115 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import math
+import unittest
+
+import torch
+
+from fairseq import options
+from fairseq.modules import AdaptiveSoftmax
+from fairseq.sequence_generator import SequenceGenerator
+from fairseq.tasks.language_modeling import LanguageModelingTask
+
+import tests.utils as test_utils
+
+
+def sharpen_head(adaptive_softmax, scale=8.):
+    """Make the head words much more likely than the tail clusters, so that
+    most clusters can be left out."""
+    with torch.no_grad():
+        head = adaptive_softmax.head.weight
+        head[:adaptive_softmax.cutoff[0]].mul_(scale)
+        head[adaptive_softmax.cutoff[0]:].mul_(1. / scale)
+
+
+class TestAdaptiveSoftmax(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.adaptive_softmax = AdaptiveSoftmax(50, 16, [10, 25], dropout=0.)
+        self.adaptive_softmax.eval()
+        self.input = torch.randn(3, 4, 16)
+
+    def test_pruned_log_prob(self):
+        for sharpen in [False, True]:
+            if sharpen:
+                sharpen_head(self.adaptive_softmax)
+            full = self.adaptive_softmax.get_log_prob(self.input, target=None)
+            for k in [1, 5, 12, 50]:
+                pruned = self.adaptive_softmax.get_pruned_log_prob(self.input, k)
+                self.assertEqual(pruned.size(), full.size())
+                # the computed log probabilities are exact and include the head
+                computed = pruned.ne(-math.inf)
+                self.assertTrue(computed[:, :, :10].all())
+                self.assertTrue(torch.allclose(pruned[computed], full[computed], atol=1e-6))
+
+                values, indices = self.adaptive_softmax.get_topk_log_prob(self.input, k)
+                expected_values, expected_indices = full.topk(k, dim=-1)
+                self.assertTrue(torch.allclose(values, expected_values, atol=1e-6))
+                self.assertTrue(torch.equal(indices, expected_indices))
+            if sharpen:
+                # the tail clusters are only computed where they are needed
+                pruned = self.adaptive_softmax.get_pruned_log_prob(self.input, 2)
+                self.assertFalse(pruned[:, :, 10:].ne(-math.inf).all())
+
+
+class TestAdaptiveSoftmaxGeneration(unittest.TestCase):
+
+    def setUp(self):
+        self.d = test_utils.dummy_dictionary(vocab_size=60)
+        parser = options.get_training_parser()
+        args = options.parse_args_and_arch(parser, [
+            'dummy_data_dir',
+            '--task', 'language_modeling',
+            '--arch', 'transformer_lm',
+            '--criterion', 'adaptive_loss',
+            '--adaptive-softmax-cutoff', '20,40',
+            '--decoder-layers', '1',
+            '--decoder-embed-dim', '16',
+            '--decoder-ffn-embed-dim', '16',
+            '--decoder-attention-heads', '2',
+            '--tokens-per-sample', '32',
+        ])
+        self.task = LanguageModelingTask(args, self.d)
+        torch.manual_seed(0)
+        self.model = self.task.build_model(args)
+        self.model.eval()
+        sharpen_head(self.model.decoder.adaptive_softmax, scale=4.)
+        self.sample = {
+            'net_input': {
+                'src_tokens': torch.LongTensor([[4, 5, 6, 7, 8, 2], [9, 10, 11, 12, 13, 2]]),
+                'src_lengths': torch.LongTensor([6, 6]),
+            },
+        }
+
+    def generate(self, pruned, **kwargs):
+        generator = SequenceGenerator(self.d, max_len_b=8, **kwargs)
+        if not pruned:
+            generator._num_pruned_candidates = lambda model, candidates: None
+        torch.manual_seed(1)
+        return generator.generate([self.model], self.sample)
+
+    def assertHyposEqual(self, hypos, expected):
+        for sent_hypos, sent_expected in zip(hypos, expected):
+            self.assertEqual(len(sent_hypos), len(sent_expected))
+            for hypo, hypo_expected in zip(sent_hypos, sent_expected):
+                self.assertTrue(torch.equal(hypo['tokens'], hypo_expected['tokens']))
+                self.assertAlmostEqual(hypo['score'], hypo_expected['score'], places=5)
+
+    def test_beam_search(self):
+        for kwargs in [{}, {'no_repeat_ngram_size': 2}, {'min_len': 5, 'unk_penalty': 0.5}]:
+            self.assertHyposEqual(
+                self.generate(True, beam_size=3, **kwargs),
+                self.generate(False, beam_size=3, **kwargs),
+            )
+
+    def test_topk_sampling(self):
+        kwargs = {'beam_size': 2, 'sampling': True, 'sampling_topk': 5}
+        self.assertHyposEqual(self.generate(True, **kwargs), self.generate(False, **kwargs))
+
+
+if __name__ == '__main__':
+    unittest.main()
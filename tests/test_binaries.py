@@ -14,7 +14,9 @@ import unittest
 import torch
 
 from fairseq import options
+from fairseq.data import data_utils
 
+import backtranslate
 import preprocess
 import train
 import generate
@@ -65,6 +67,19 @@ class TestTranslation(unittest.TestCase):
                 train_translation_model(data_dir, 'fconv_iwslt_de_en', ['--update-freq', '3'])
                 generate_main(data_dir)
 
+    def test_backtranslation(self):
+        with contextlib.redirect_stdout(StringIO()):
+            with tempfile.TemporaryDirectory('test_backtranslation') as data_dir:
+                create_dummy_data(data_dir)
+                preprocess_translation_data(data_dir)
+                train_translation_model(data_dir, 'fconv_iwslt_de_en')
+                bt_dir = os.path.join(data_dir, 'bt')
+                backtranslate_main(data_dir, bt_dir)
+                hypos = data_utils.load_indexed_dataset(os.path.join(bt_dir, 'train.in-out.out'), None)
+                srcs = data_utils.load_indexed_dataset(os.path.join(bt_dir, 'train.in-out.in'), None)
+                self.assertEqual(len(hypos), len(srcs))
+                self.assertGreater(len(hypos), 0)
+
     def test_max_positions(self):
         with contextlib.redirect_stdout(StringIO()):
             with tempfile.TemporaryDirectory('test_max_positions') as data_dir:
@@ -154,6 +169,23 @@ class TestTranslation(unittest.TestCase):
                 ], run_validation=True)
                 generate_main(data_dir)
 
+    def test_transformer_eval_bleu(self):
+        with contextlib.redirect_stdout(StringIO()):
+            with tempfile.TemporaryDirectory('test_transformer_eval_bleu') as data_dir:
+                create_dummy_data(data_dir)
+                preprocess_translation_data(data_dir)
+                train_translation_model(data_dir, 'transformer_iwslt_de_en', [
+                    '--encoder-layers', '2',
+                    '--decoder-layers', '2',
+                    '--encoder-embed-dim', '8',
+                    '--decoder-embed-dim', '8',
+                    '--eval-bleu',
+                    '--eval-bleu-max-sentences', '20',
+                    '--eval-bleu-beam', '2',
+                    '--best-checkpoint-metric', 'bleu',
+                    '--maximize-best-checkpoint-metric',
+                ])
+
     def test_lightconv(self):
         with contextlib.redirect_stdout(StringIO()):
             with tempfile.TemporaryDirectory('test_lightconv') as data_dir:
@@ -261,6 +293,7 @@ class TestLanguageModeling(unittest.TestCase):
                     data_dir, 'transformer_lm', ['--add-bos-token'], run_validation=True,
                 )
                 eval_lm_main(data_dir)
+                eval_lm_main(data_dir, ['--context-window', '25', '--stateful-eval', '--max-sentences', '4'])
 
 
 class TestMaskedLanguageModel(unittest.TestCase):
@@ -525,6 +558,24 @@ def generate_main(data_dir, extra_flags=None):
     sys.stdin = orig_stdin
 
 
+def backtranslate_main(data_dir, dest_dir, extra_flags=None):
+    bt_parser = options.get_backtranslation_parser()
+    bt_args = options.parse_args_and_arch(
+        bt_parser,
+        [
+            data_dir,
+            '--path', os.path.join(data_dir, 'checkpoint_last.pt'),
+            '--bt-input', os.path.join(data_dir, 'valid.in-out.in'),
+            '--bt-destdir', dest_dir,
+            '--beam', '3',
+            '--batch-size', '64',
+            '--max-len-b', '5',
+            '--no-progress-bar',
+        ] + (extra_flags or []),
+    )
+    backtranslate.main(bt_args)
+
+
 def preprocess_lm_data(data_dir):
     preprocess_parser = options.get_preprocessing_parser()
     preprocess_args = preprocess_parser.parse_args([
@@ -577,7 +628,7 @@ def train_language_model(data_dir, arch, extra_flags=None, run_validation=False)
         validate.main(validate_args)
 
 
-def eval_lm_main(data_dir):
+def eval_lm_main(data_dir, extra_flags=None):
     eval_lm_parser = options.get_eval_lm_parser()
     eval_lm_args = options.parse_args_and_arch(
         eval_lm_parser,
@@ -585,7 +636,7 @@ def eval_lm_main(data_dir):
             data_dir,
             '--path', os.path.join(data_dir, 'checkpoint_last.pt'),
             '--no-progress-bar',
-        ],
+        ] + (extra_flags or []),
     )
     eval_lm.main(eval_lm_args)
 
@@ -0,0 +1,93 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+
+import numpy as np
+import torch
+
+from fairseq import bleu
+from fairseq.data import Dictionary
+
+
+class TestBleu(unittest.TestCase):
+
+    def setUp(self):
+        self.d = Dictionary()
+        rng = np.random.RandomState(0)
+        words = ['w{}'.format(i) for i in range(10)]
+        self.pairs = []
+        for _ in range(50):
+            ref = ' '.join(rng.choice(words, rng.randint(1, 15)))
+            hypo = ' '.join(rng.choice(words, rng.randint(1, 15)))
+            self.pairs.append((self.encode(ref), self.encode(hypo)))
+
+    def encode(self, line):
+        return self.d.encode_line(line, add_if_not_exist=True)
+
+    def scorer(self, pairs, cls=bleu.Scorer):
+        scorer = cls(self.d.pad(), self.d.eos(), self.d.unk())
+        for ref, hypo in pairs:
+            scorer.add(ref, hypo)
+        return scorer
+
+    def test_cached_scorer_matches_scorer(self):
+        expected = self.scorer(self.pairs)
+        cached = self.scorer(self.pairs, bleu.CachedScorer)
+        self.assertEqual(len(cached), len(self.pairs))
+        for order in range(1, 5):
+            self.assertAlmostEqual(cached.score(order), expected.score(order))
+            self.assertEqual(cached.result_string(order), expected.result_string(order))
+
+    def test_remove_and_subsets(self):
+        cached = self.scorer(self.pairs, bleu.CachedScorer)
+        for i in range(0, len(self.pairs), 2):
+            cached.remove(i)
+        expected = self.scorer(self.pairs[1::2])
+        self.assertEqual(len(cached), len(self.pairs) // 2)
+        self.assertAlmostEqual(cached.score(), expected.score())
+
+        expected = self.scorer(self.pairs[:10])
+        self.assertAlmostEqual(cached.score(indices=range(10)), expected.score())
+
+    def test_add_stats(self):
+        stats = np.stack([
+            bleu.sentence_stats(ref, hypo, self.d.pad(), self.d.eos(), self.d.unk())
+            for ref, hypo in self.pairs
+        ])
+        cached = bleu.CachedScorer(self.d.pad(), self.d.eos(), self.d.unk())
+        indices = cached.add_stats(stats)
+        self.assertEqual(indices.tolist(), list(range(len(self.pairs))))
+        self.assertAlmostEqual(cached.score(), self.scorer(self.pairs).score())
+        self.assertAlmostEqual(float(bleu.bleu_from_stats(stats.sum(axis=0))), cached.score())
+
+    def test_one_init(self):
+        cached = bleu.CachedScorer(self.d.pad(), self.d.eos(), self.d.unk())
+        cached.reset(one_init=True)
+        for ref, hypo in self.pairs:
+            cached.add(ref, hypo)
+        expected = bleu.Scorer(self.d.pad(), self.d.eos(), self.d.unk())
+        for i, (ref, hypo) in enumerate(self.pairs[:10]):
+            # sentence-level BLEU
+            expected.reset(one_init=True)
+            expected.add(ref, hypo)
+            self.assertAlmostEqual(cached.score(indices=[i]), expected.score())
+            self.assertEqual(cached.result_string(indices=[i]), expected.result_string())
+        expected.reset(one_init=True)
+        for ref, hypo in self.pairs:
+            expected.add(ref, hypo)
+        self.assertAlmostEqual(cached.score(), expected.score())
+
+    def test_bootstrap(self):
+        cached = self.scorer(self.pairs, bleu.CachedScorer)
+        scores = cached.bootstrap(num_samples=20, seed=1, max_elements=len(self.pairs) * 3)
+        self.assertEqual(scores.shape, (20, ))
+        np.testing.assert_allclose(scores, cached.bootstrap(num_samples=20, seed=1))
+        self.assertTrue(np.all(scores >= 0) and np.all(scores <= 100))
+        self.assertLess(abs(scores.mean() - cached.score()), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,8 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import os
+import tempfile
 import torch
 import unittest
 
@@ -37,6 +39,44 @@ class TestCharacterTokenEmbedder(unittest.TestCase):
         embs.sum().backward()
         assert embedder.char_embeddings.weight.grad is not None
 
+    def test_frozen_embeddings(self):
+        vocab = Dictionary()
+        for word in ['hello', 'there', 'general', 'kenobi']:
+            vocab.add_symbol(word)
+        embedder = CharacterTokenEmbedder(vocab, [(2, 16), (4, 32)], 8, 5, 1)
+        embedder.eval()
+
+        input = torch.LongTensor([[vocab.eos(), vocab.index('hello'), vocab.index('kenobi'), vocab.unk()],
+                                  [vocab.eos(), vocab.index('there'), vocab.eos(), vocab.pad()]])
+        expected = embedder(input)
+
+        embedder.freeze(batch_size=3)
+        self.assertEqual(embedder.frozen_embeddings.size(), (len(vocab), 5))
+        self.assertAlmostEqual(embedder(input), expected)
+
+        # the table is dropped when training resumes or the vocabulary changes
+        embedder.train()
+        self.assertIsNone(embedder.frozen_embeddings)
+        embedder.eval()
+        embedder.make_generation_fast_()
+        self.assertIsNotNone(embedder.frozen_embeddings)
+        embedder.set_vocab(vocab, embedder.max_char_len)
+        self.assertIsNone(embedder.frozen_embeddings)
+
+        with tempfile.TemporaryDirectory('test_character_token_embedder') as cache_dir:
+            cache_path = os.path.join(cache_dir, 'checkpoint.pt.char_embed')
+            embedder.freeze(cache_path)
+            self.assertTrue(os.path.exists(cache_path))
+            embedder.frozen_embeddings = None
+            embedder.freeze(cache_path)
+            self.assertAlmostEqual(embedder(input), expected)
+
+            # a cache computed for other parameters is not reused
+            with torch.no_grad():
+                embedder.projection.bias.add_(1.)
+            embedder.freeze(cache_path)
+            self.assertAlmostEqual(embedder(input)[0, 1], expected[0, 1] + 1.)
+
     def assertAlmostEqual(self, t1, t2):
         self.assertEqual(t1.size(), t2.size(), "size mismatch")
         self.assertLess((t1 - t2).abs().max(), 1e-6)
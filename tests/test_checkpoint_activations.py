@@ -0,0 +1,65 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import random
+import unittest
+
+import torch
+
+from fairseq import options
+from fairseq.tasks.translation import TranslationTask
+
+import tests.utils as test_utils
+
+
+class TestCheckpointActivations(unittest.TestCase):
+
+    def setUp(self):
+        self.d = test_utils.dummy_dictionary(vocab_size=40)
+        self.src_tokens = torch.randint(4, 40, (3, 7))
+        self.src_tokens[0, :2] = self.d.pad()
+        self.prev_output_tokens = torch.randint(4, 40, (3, 5))
+
+    def gradients(self, checkpoint_activations, extra_args):
+        args = options.parse_args_and_arch(options.get_training_parser(), [
+            'dummy_data_dir',
+            '--arch', 'transformer',
+            '--encoder-layers', '3',
+            '--decoder-layers', '3',
+            '--encoder-embed-dim', '8',
+            '--decoder-embed-dim', '8',
+            '--encoder-ffn-embed-dim', '16',
+            '--decoder-ffn-embed-dim', '16',
+            '--encoder-attention-heads', '2',
+            '--decoder-attention-heads', '2',
+            '--dropout', '0.3',
+            '--checkpoint-activations', str(checkpoint_activations),
+        ] + extra_args)
+        task = TranslationTask(args, self.d, self.d)
+        torch.manual_seed(0)
+        model = task.build_model(args)
+        model.train()
+
+        torch.manual_seed(1)
+        random.seed(1)
+        output, _ = model(self.src_tokens, torch.full((3,), 7), self.prev_output_tokens)
+        output.float().pow(2).sum().backward()
+        return [p.grad for p in model.parameters()]
+
+    def test_gradients(self):
+        # dropout masks and LayerDrop decisions are the same when recomputing
+        for extra_args in [[], ['--encoder-layerdrop', '0.5', '--decoder-layerdrop', '0.5']]:
+            expected = self.gradients(0, extra_args)
+            for checkpoint_activations in [1, 2]:
+                grads = self.gradients(checkpoint_activations, extra_args)
+                for grad, expected_grad in zip(grads, expected):
+                    if expected_grad is None:
+                        self.assertIsNone(grad)
+                    else:
+                        self.assertTrue(torch.allclose(grad, expected_grad, atol=1e-6))
+
+
+if __name__ == '__main__':
+    unittest.main()
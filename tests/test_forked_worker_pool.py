@@ -0,0 +1,114 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import unittest
+
+import torch
+import torch.nn as nn
+
+from fairseq.forked_worker_pool import ForkedWorkerPool
+
+
+class TestForkedWorkerPool(unittest.TestCase):
+
+    def test_imap(self):
+        torch.manual_seed(0)
+        model = nn.Linear(8, 4)
+        model.share_memory()
+        inputs = [torch.randn(i + 1, 8) for i in range(20)]
+
+        def fn(x):
+            with torch.no_grad():
+                return model(x), os.getpid(), torch.get_num_threads()
+
+        pool = ForkedWorkerPool(fn, num_workers=3, num_threads=1)
+        try:
+            results = list(pool.imap(inputs))
+            # the pool can be reused
+            self.assertEqual(len(list(pool.imap(inputs[:5]))), 5)
+        finally:
+            pool.close()
+
+        self.assertEqual(len(results), len(inputs))
+        pids = set()
+        for x, (output, pid, num_threads) in zip(inputs, results):
+            with torch.no_grad():
+                self.assertTrue(torch.equal(output, model(x)))
+            self.assertNotEqual(pid, os.getpid())
+            self.assertEqual(num_threads, 1)
+            pids.add(pid)
+        self.assertLessEqual(len(pids), 3)
+
+    def test_views_are_compact(self):
+        pool = ForkedWorkerPool(lambda i: torch.arange(10000)[i:i + 2], num_workers=2)
+        try:
+            results = list(pool.imap(range(4)))
+        finally:
+            pool.close()
+        for i, result in enumerate(results):
+            self.assertEqual(result.tolist(), [i, i + 1])
+            self.assertEqual(result.storage().size(), 2)
+
+    def test_error(self):
+        def fn(x):
+            if x == 3:
+                raise ValueError('bad item')
+            return x
+
+        pool = ForkedWorkerPool(fn, num_workers=2)
+        try:
+            with self.assertRaisesRegex(RuntimeError, 'bad item'):
+                list(pool.imap(range(6)))
+        finally:
+            pool.close()
+
+    def test_large_payloads(self):
+        # items and results larger than a pipe buffer (64 KB)
+        def fn(x):
+            return x[:100000] + bytes([len(x) % 256])
+
+        inputs = [bytes([i]) * (200000 + i) for i in range(10)]
+        for num_workers in [1, 2]:
+            pool = ForkedWorkerPool(fn, num_workers=num_workers)
+            try:
+                results = list(pool.imap(inputs))
+            finally:
+                pool.close()
+            self.assertEqual(results, [fn(x) for x in inputs])
+
+    def test_close_after_error(self):
+        def fn(x):
+            if x == 0:
+                raise ValueError('bad item')
+            return bytes(200000)
+
+        pool = ForkedWorkerPool(fn, num_workers=2, max_pending=6)
+        try:
+            with self.assertRaisesRegex(RuntimeError, 'bad item'):
+                list(pool.imap(range(6)))
+        finally:
+            # the large results that were not returned must not keep the
+            # workers from exiting
+            pool.close()
+        for worker in pool.workers:
+            self.assertFalse(worker.is_alive())
+
+    def test_dead_worker(self):
+        def fn(x):
+            if x == 3:
+                os._exit(1)
+            return x
+
+        pool = ForkedWorkerPool(fn, num_workers=2)
+        try:
+            with self.assertRaisesRegex(RuntimeError, 'exited with code 1'):
+                list(pool.imap(range(6)))
+        finally:
+            pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
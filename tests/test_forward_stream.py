@@ -0,0 +1,144 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import unittest
+
+import torch
+
+from fairseq import options
+from fairseq.data import LMContextWindowDataset, MonolingualDataset, TokenBlockDataset
+from fairseq.models.transformer_lm import TransformerLanguageModel
+from fairseq.sequence_scorer import SequenceScorer
+
+import tests.utils as test_utils
+
+
+class TestForwardStream(unittest.TestCase):
+
+    def setUp(self):
+        self.d = test_utils.dummy_dictionary(vocab_size=30)
+        torch.manual_seed(1)
+        # two streams of 24 tokens, decoded in blocks of 6
+        self.tokens = torch.randint(self.d.nspecial, len(self.d), (2, 24))
+        self.blocks = self.tokens.split(6, dim=1)
+
+    def build_model(self, extra_args=()):
+        args = options.parse_args_and_arch(options.get_training_parser('language_modeling'), [
+            'dummy_data_dir',
+            '--arch', 'transformer_lm',
+            '--decoder-layers', '2',
+            '--decoder-embed-dim', '16',
+            '--decoder-ffn-embed-dim', '32',
+            '--decoder-attention-heads', '2',
+            '--tokens-per-sample', '64',
+        ] + list(extra_args))
+        task = argparse.Namespace(source_dictionary=self.d, target_dictionary=self.d)
+        torch.manual_seed(0)
+        return TransformerLanguageModel.build_model(args, task).eval()
+
+    def test_matches_full_forward(self):
+        for extra_args in [[], ['--decoder-learned-pos', '--decoder-normalize-before']]:
+            model = self.build_model(extra_args)
+            with torch.no_grad():
+                expected, _ = model(self.tokens)
+                incremental_state = {}
+                outputs = [
+                    model.decoder.forward_stream(block, incremental_state, max_context=self.tokens.size(1))[0]
+                    for block in self.blocks
+                ]
+            self.assertTrue(torch.allclose(torch.cat(outputs, dim=1), expected, atol=1e-5))
+
+    def test_positions_continue_after_trimming(self):
+        # with a single layer the cached keys/values only depend on the
+        # embeddings, so every block can also be decoded from scratch together
+        # with its context, at the positions of these tokens in the stream
+        max_context = 10
+        for extra_args in [[], ['--decoder-learned-pos']]:
+            model = self.build_model(['--decoder-layers', '1'] + extra_args)
+            decoder = model.decoder
+            incremental_state = {}
+            start = 0
+            with torch.no_grad():
+                all_positions = decoder.embed_positions(self.tokens)
+                for block in self.blocks:
+                    out, _ = decoder.forward_stream(block, incremental_state, max_context)
+                    end = start + block.size(1)
+                    context_start = max(0, start - max_context)
+                    expected, _ = decoder._extract_features(
+                        self.tokens[:, context_start:end], all_positions[:, context_start:end], None, None, None,
+                    )
+                    expected = decoder.output_layer(expected[:, start - context_start:])
+                    self.assertTrue(torch.allclose(out, expected, atol=1e-5))
+                    start = end
+
+    def test_learned_positions_exceeded(self):
+        model = self.build_model(['--decoder-learned-pos', '--tokens-per-sample', '16'])
+        incremental_state = {}
+        with torch.no_grad():
+            model.decoder.forward_stream(self.blocks[0], incremental_state, max_context=10)
+            model.decoder.forward_stream(self.blocks[1], incremental_state, max_context=10)
+            with self.assertRaises(AssertionError):
+                model.decoder.forward_stream(self.blocks[2], incremental_state, max_context=10)
+
+    def score_stream(self, model, stream, context_window, stateful):
+        # score a single stream block by block, as eval_lm does
+        block_dataset = TokenBlockDataset(
+            [stream], [len(stream)], 6, pad=self.d.pad(), eos=self.d.eos(),
+            break_mode='none', include_targets=True,
+        )
+        dataset = MonolingualDataset(
+            block_dataset, block_dataset.sizes, self.d, self.d,
+            add_eos_for_other_targets=False, shuffle=False, targets=['future'],
+        )
+        if not stateful:
+            dataset = LMContextWindowDataset(dataset, 6, context_window, self.d.pad())
+        scorer = SequenceScorer(self.d)
+        incremental_states = {model: {}} if stateful else None
+        scores = []
+        for i in range(len(dataset)):
+            hypo = scorer.generate(
+                [model], dataset.collater([dataset[i]]),
+                incremental_states=incremental_states, max_context=context_window,
+            )[0][0]
+            scores.append(hypo['positional_scores'])
+        return torch.cat(scores)
+
+    def test_matches_context_window(self):
+        context_window = 10
+        stream = self.tokens[0]
+        for extra_args, num_exact in [
+            # without positional embeddings a single layer sees exactly the
+            # same context in both modes
+            (['--decoder-layers', '1', '--no-token-positional-embeddings'], stream.numel()),
+            # the context window restarts the positions of its context, so both
+            # modes only agree until the first context is trimmed
+            ([], 12),
+        ]:
+            model = self.build_model(extra_args)
+            stateful = self.score_stream(model, stream, context_window, stateful=True)
+            expected = self.score_stream(model, stream, context_window, stateful=False)
+            self.assertEqual(stateful.size(), expected.size())
+            self.assertTrue(torch.allclose(stateful[:num_exact], expected[:num_exact], atol=1e-5))
+
+    def test_cache_is_trimmed(self):
+        model = self.build_model()
+        max_context = 10
+        incremental_state = {}
+        num_tokens = 0
+        with torch.no_grad():
+            for block in self.blocks:
+                model.decoder.forward_stream(block, incremental_state, max_context)
+                num_tokens += block.size(1)
+                for layer in model.decoder.layers:
+                    saved_state = layer.self_attn._get_input_buffer(incremental_state)
+                    cache_len = min(num_tokens, max_context)
+                    self.assertEqual(saved_state['prev_key'].size(2), cache_len)
+                    self.assertEqual(saved_state['prev_value'].size(2), cache_len)
+                    self.assertEqual(saved_state['prev_key_padding_mask'].size(1), cache_len)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import random
+import unittest
+
+from fairseq.data.encoders.gpt2_bpe_utils import BPECache, Encoder
+
+
+def build_dummy_encoder(cache_size=None, num_merges=60, seed=0):
+    rng = random.Random(seed)
+    symbols = list('abcde')
+    merges = []
+    while len(merges) < num_merges:
+        merge = (rng.choice(symbols), rng.choice(symbols))
+        if merge not in merges:
+            merges.append(merge)
+            symbols.append(''.join(merge))
+    # '\u0120' is the byte-level encoding of a leading space
+    vocab = {s: i for i, s in enumerate(sorted(set(symbols + ['\u0120'])))}
+    return Encoder(vocab, merges, cache_size=cache_size)
+
+
+class TestGPT2BPE(unittest.TestCase):
+
+    def test_bpe_matches_pairwise_reference(self):
+        encoder = build_dummy_encoder()
+        rng = random.Random(1)
+        for _ in range(2000):
+            word = ''.join(rng.choice('abcde') for _ in range(rng.randint(1, 16)))
+            self.assertEqual(encoder.bpe(word), encoder.bpe_pairwise(word))
+
+    def test_encode_many(self):
+        encoder = build_dummy_encoder()
+        texts = ['abc dea', 'ddd', 'abc abc eeeea', '']
+        self.assertEqual(encoder.encode_many(texts), [encoder.encode(t) for t in texts])
+
+    def test_cache_is_bounded(self):
+        encoder = build_dummy_encoder(cache_size=3)
+        for word in ['ab', 'bc', 'cd', 'de', 'ea']:
+            encoder.bpe(word)
+        stats = encoder.cache.stats()
+        self.assertEqual(stats['size'], 3)
+        self.assertEqual(stats['evictions'], 2)
+
+    def test_lru_order(self):
+        cache = BPECache(max_size=2)
+        cache.put('a', 'a')
+        cache.put('b', 'b')
+        self.assertEqual(cache.get('a'), 'a')  # 'b' becomes least recently used
+        cache.put('c', 'c')
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.hits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
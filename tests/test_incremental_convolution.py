@@ -0,0 +1,75 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+
+import torch
+
+from fairseq.modules import DynamicConv1dTBC, LightweightConv1dTBC
+
+
+class TestIncrementalConvolution(unittest.TestCase):
+
+    def assertIncrementalMatches(self, conv, T=15, B=3):
+        conv.eval()
+        x = torch.randn(T, B, conv.input_size)
+        expected = conv(x, unfold=True)
+
+        incremental_state = {}
+        for t in range(T):
+            output = conv(x[t:t + 1], incremental_state=incremental_state)
+            self.assertLess((output[0] - expected[t]).abs().max(), 1e-5)
+
+    def assertReorderMatches(self, conv, T=13, B=3):
+        conv.eval()
+        x = torch.randn(T, B, conv.input_size)
+        new_order = torch.LongTensor([2, 2, 0])
+        # reordering after step 4 is the same as reordering the inputs
+        reordered = torch.cat([x[:4, new_order], x[4:]])
+        expected = conv(reordered, unfold=True)
+
+        incremental_state = {}
+        for t in range(T):
+            if t == 4:
+                conv.reorder_incremental_state(incremental_state, new_order)
+            output = conv(reordered[t:t + 1] if t >= 4 else x[t:t + 1], incremental_state=incremental_state)
+        self.assertLess((output[0] - expected[-1]).abs().max(), 1e-5)
+
+    def test_lightweight_convolution(self):
+        torch.manual_seed(0)
+        for kernel_size in [1, 3, 12]:
+            for weight_softmax in [True, False]:
+                conv = LightweightConv1dTBC(
+                    8, kernel_size, padding_l=kernel_size - 1, num_heads=2,
+                    weight_softmax=weight_softmax, bias=True,
+                )
+                self.assertIncrementalMatches(conv)
+                self.assertReorderMatches(conv)
+
+    def test_dynamic_convolution(self):
+        torch.manual_seed(0)
+        for kernel_size in [1, 3, 12]:
+            for weight_softmax, in_proj in [(True, False), (False, False), (True, True)]:
+                conv = DynamicConv1dTBC(
+                    8, kernel_size, padding_l=kernel_size - 1, num_heads=2,
+                    weight_softmax=weight_softmax, in_proj=in_proj, conv_bias=True,
+                )
+                self.assertIncrementalMatches(conv)
+                self.assertReorderMatches(conv)
+
+    def test_dynamic_convolution_renorm_padding(self):
+        torch.manual_seed(0)
+        conv = DynamicConv1dTBC(8, 5, padding_l=4, num_heads=2, weight_softmax=True, renorm_padding=True)
+        conv.eval()
+        x = torch.randn(6, 2, 8)
+        expected = conv(x, unfold=False)
+        incremental_state = {}
+        for t in range(6):
+            output = conv(x[t:t + 1], incremental_state=incremental_state)
+            self.assertLess((output[0] - expected[t]).abs().max(), 1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
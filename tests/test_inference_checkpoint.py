@@ -0,0 +1,191 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import copy
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import weakref
+
+import torch
+
+from fairseq import checkpoint_utils, options
+from fairseq.tasks.translation import TranslationTask
+
+import tests.utils as test_utils
+
+
+class TestInferenceCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.d = test_utils.dummy_dictionary(vocab_size=20)
+        parser = options.get_training_parser()
+        self.args = options.parse_args_and_arch(parser, [
+            'dummy_data_dir',
+            '--arch', 'transformer',
+            '--encoder-layers', '1',
+            '--decoder-layers', '1',
+            '--encoder-embed-dim', '8',
+            '--decoder-embed-dim', '8',
+            '--encoder-ffn-embed-dim', '16',
+            '--decoder-ffn-embed-dim', '16',
+            '--encoder-attention-heads', '2',
+            '--decoder-attention-heads', '2',
+            '--share-all-embeddings',
+        ])
+        self.task = TranslationTask(self.args, self.d, self.d)
+        self.model = self.task.build_model(self.args)
+        self.model.eval()
+
+    def forward(self, model):
+        src_tokens = torch.LongTensor([[4, 5, 6, 2], [7, 8, 9, 2]])
+        prev_output_tokens = torch.LongTensor([[2, 10, 11], [2, 12, 13]])
+        return model(src_tokens, torch.LongTensor([4, 4]), prev_output_tokens)[0]
+
+    def test_roundtrip(self):
+        with tempfile.TemporaryDirectory('test_inference_checkpoint') as save_dir:
+            filename = os.path.join(save_dir, 'model.pt')
+            checkpoint_utils.save_inference_checkpoint(filename, self.args, self.model.state_dict())
+            self.assertTrue(checkpoint_utils.is_inference_checkpoint(filename))
+
+            models, args, _task = checkpoint_utils.load_model_ensemble_and_task([filename], task=self.task)
+            model = models[0]
+            model.eval()
+            self.assertEqual(args.arch, 'transformer')
+            with torch.no_grad():
+                self.assertTrue(torch.equal(self.forward(self.model), self.forward(model)))
+
+            # the shared embedding matrix is stored once and stays shared
+            state_dict = model.state_dict()
+            self.assertEqual(
+                state_dict['encoder.embed_tokens.weight'].data_ptr(),
+                state_dict['decoder.embed_tokens.weight'].data_ptr(),
+            )
+            num_bytes = sum(p.numel() * p.element_size() for p in self.model.parameters())
+            self.assertLess(os.path.getsize(filename), num_bytes + 64 * 1024)
+
+            # the weights are copy-on-write: changing them leaves the file intact
+            with torch.no_grad():
+                for p in model.parameters():
+                    p.zero_()
+            reloaded = checkpoint_utils.load_model_ensemble([filename], task=self.task)[0][0]
+            reloaded.eval()
+            with torch.no_grad():
+                self.assertTrue(torch.equal(self.forward(self.model), self.forward(reloaded)))
+
+    def test_fp16(self):
+        with tempfile.TemporaryDirectory('test_inference_checkpoint') as save_dir:
+            filename = os.path.join(save_dir, 'model.pt')
+            checkpoint_utils.save_inference_checkpoint(
+                filename, self.args, self.model.state_dict(), dtype=torch.float16,
+            )
+            state = checkpoint_utils.load_inference_checkpoint(filename)
+            for key, tensor in self.model.state_dict().items():
+                self.assertEqual(state['model'][key].dtype, torch.float16)
+                self.assertTrue(torch.equal(state['model'][key], tensor.half()))
+
+    def test_fp16_weights_in_fp32_model(self):
+        with tempfile.TemporaryDirectory('test_inference_checkpoint') as save_dir:
+            filename = os.path.join(save_dir, 'model.pt')
+            checkpoint_utils.save_inference_checkpoint(
+                filename, self.args, self.model.state_dict(), dtype=torch.float16,
+            )
+            model = checkpoint_utils.load_model_ensemble([filename], task=self.task)[0][0]
+            expected = dict(self.model.named_parameters())
+            for name, param in model.named_parameters():
+                self.assertEqual(param.dtype, torch.float32)
+                self.assertTrue(torch.equal(param, expected[name].half().float()))
+
+    def test_arg_defaults(self):
+        # args of older checkpoints lack newer options
+        args = copy.deepcopy(self.args)
+        del args.task
+        del args.left_pad_source
+        with tempfile.TemporaryDirectory('test_inference_checkpoint') as save_dir:
+            filename = os.path.join(save_dir, 'model.pt')
+            checkpoint_utils.save_inference_checkpoint(filename, args, self.model.state_dict())
+            args = checkpoint_utils.load_inference_checkpoint(filename)['args']
+            self.assertEqual(args.task, 'translation')
+            self.assertEqual(args.left_pad_source, self.args.left_pad_source)
+
+    def save_training_checkpoint(self, filename, model):
+        torch.save({
+            'args': self.args,
+            'model': model.state_dict(),
+            'optimizer_history': [{
+                'criterion_name': 'CrossEntropyCriterion',
+                'optimizer_name': 'FairseqNAG',
+                'lr_scheduler_state': {},
+                'num_updates': 0,
+            }],
+            'extra_state': {'train_iterator': {'epoch': 1}},
+            'last_optimizer_state': {},
+        }, filename)
+
+    def test_ensemble(self):
+        with tempfile.TemporaryDirectory('test_inference_checkpoint') as save_dir:
+            expected = []
+            filenames = []
+            for i in range(3):
+                model = self.task.build_model(self.args)
+                model.eval()
+                with torch.no_grad():
+                    expected.append(self.forward(model))
+                filenames.append(os.path.join(save_dir, 'checkpoint{}.pt'.format(i)))
+                if i == 1:
+                    checkpoint_utils.save_inference_checkpoint(filenames[i], self.args, model.state_dict())
+                else:
+                    self.save_training_checkpoint(filenames[i], model)
+
+            for num_workers in [1, 3]:
+                models, _args = checkpoint_utils.load_model_ensemble(
+                    filenames, task=self.task, num_workers=num_workers,
+                )
+                self.assertEqual(len(models), 3)
+                for model, output in zip(models, expected):
+                    model.eval()
+                    with torch.no_grad():
+                        self.assertTrue(torch.equal(self.forward(model), output))
+
+    def test_ensemble_reads_ahead_and_releases_states(self):
+        with tempfile.TemporaryDirectory('test_inference_checkpoint') as save_dir:
+            filenames = [os.path.join(save_dir, 'checkpoint{}.pt'.format(i)) for i in range(4)]
+            for filename in filenames:
+                self.save_training_checkpoint(filename, self.task.build_model(self.args))
+
+            load_state = checkpoint_utils._load_state_for_inference
+            build_model = self.task.build_model
+            for num_workers in [1, 2]:
+                # weak references to a tensor of every checkpoint that was read
+                states = []
+                models = []
+
+                def load_state_for_inference(filename, arg_overrides):
+                    state, mmap = load_state(filename, arg_overrides)
+                    states.append(weakref.ref(next(iter(state['model'].values()))))
+                    return state, mmap
+
+                def build(args):
+                    # the checkpoint of this model and the ones read ahead
+                    self.assertLessEqual(len(states), len(models) + 1 + num_workers)
+                    self.assertLessEqual(sum(ref() is not None for ref in states), 1 + num_workers)
+                    models.append(build_model(args))
+                    return models[-1]
+
+                with patch.object(checkpoint_utils, '_load_state_for_inference', load_state_for_inference), \
+                        patch.object(self.task, 'build_model', build):
+                    checkpoint_utils.load_model_ensemble(filenames, task=self.task, num_workers=num_workers)
+                self.assertEqual(len(models), 4)
+
+    def test_training_checkpoint_is_not_inference_checkpoint(self):
+        with tempfile.TemporaryDirectory('test_inference_checkpoint') as save_dir:
+            filename = os.path.join(save_dir, 'checkpoint.pt')
+            torch.save({'args': self.args, 'model': self.model.state_dict()}, filename)
+            self.assertFalse(checkpoint_utils.is_inference_checkpoint(filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,9 +8,16 @@ import copy
 import unittest
 
 import torch
+import torch.nn.functional as F
 
+from fairseq import options
 from fairseq.criterions.cross_entropy import CrossEntropyCriterion
-from fairseq.criterions.label_smoothed_cross_entropy import LabelSmoothedCrossEntropyCriterion
+from fairseq.criterions.label_smoothed_cross_entropy import (
+    LabelSmoothedCrossEntropyCriterion,
+    label_smoothed_nll_loss,
+)
+from fairseq.modules import chunked_label_smoothed_nll_loss
+from fairseq.tasks.translation import TranslationTask
 
 import tests.utils as test_utils
 
@@ -90,6 +97,68 @@ class TestLabelSmoothing(unittest.TestCase):
         smooth_loss, smooth_sample_size, smooth_logging_output = smooth_crit(self.model, self.sample)
         self.assertAlmostEqual(nll_loss, smooth_loss)
 
+    def test_chunked_label_smoothed_nll_loss(self):
+        torch.manual_seed(0)
+        features = torch.randn(6, 5, requires_grad=True)
+        weight = torch.randn(11, 5, requires_grad=True)
+        target = torch.LongTensor([0, 3, 10, 7, 7, 4])
+
+        lprobs = F.log_softmax(F.linear(features, weight), dim=-1)
+        expected, expected_nll = label_smoothed_nll_loss(lprobs, target, 0.1)
+        expected_grads = torch.autograd.grad(expected, [features, weight])
+        for chunk_size in [1, 4, 11, 32]:
+            loss, nll_loss = chunked_label_smoothed_nll_loss(features, weight, target, 0.1, chunk_size)
+            self.assertLess((loss - expected).abs().item(), 1e-5)
+            self.assertLess((nll_loss - expected_nll).abs().item(), 1e-5)
+            for grad, expected_grad in zip(torch.autograd.grad(loss, [features, weight]), expected_grads):
+                self.assertLess((grad - expected_grad).abs().max().item(), 1e-5)
+
+    def test_chunked_criterion(self):
+        parser = options.get_training_parser()
+        args = options.parse_args_and_arch(parser, [
+            'dummy_data_dir',
+            '--arch', 'transformer',
+            '--criterion', 'label_smoothed_cross_entropy',
+            '--label-smoothing', '0.1',
+            '--encoder-layers', '1',
+            '--decoder-layers', '1',
+            '--encoder-embed-dim', '8',
+            '--decoder-embed-dim', '8',
+            '--encoder-ffn-embed-dim', '16',
+            '--decoder-ffn-embed-dim', '16',
+            '--encoder-attention-heads', '2',
+            '--decoder-attention-heads', '2',
+            '--share-decoder-input-output-embed',
+        ])
+        d = test_utils.dummy_dictionary(vocab_size=20)
+        task = TranslationTask(args, d, d)
+        model = task.build_model(args)
+        model.eval()
+        sample = {
+            'net_input': {
+                'src_tokens': torch.LongTensor([[4, 5, 6, 2], [7, 8, 9, 2]]),
+                'src_lengths': torch.LongTensor([4, 4]),
+                'prev_output_tokens': torch.LongTensor([[2, 10, 11, 12], [2, 13, 14, 1]]),
+            },
+            'target': torch.LongTensor([[10, 11, 12, 2], [13, 14, 2, 1]]),
+            'ntokens': 7,
+        }
+
+        def loss_and_grads(vocab_chunk):
+            args.loss_vocab_chunk = vocab_chunk
+            crit = LabelSmoothedCrossEntropyCriterion(args, task)
+            model.zero_grad()
+            loss, sample_size, logging_output = crit(model, sample)
+            loss.backward()
+            return loss, logging_output['nll_loss'], [p.grad.clone() for p in model.parameters()]
+
+        loss, nll_loss, grads = loss_and_grads(0)
+        chunked_loss, chunked_nll_loss, chunked_grads = loss_and_grads(7)
+        self.assertLess((loss - chunked_loss).abs().item(), 1e-5)
+        self.assertLess(abs(nll_loss - chunked_nll_loss), 1e-5)
+        for grad, chunked_grad in zip(grads, chunked_grads):
+            self.assertLess((grad - chunked_grad).abs().max().item(), 1e-5)
+
     def assertAlmostEqual(self, t1, t2):
         self.assertEqual(t1.size(), t2.size(), "size mismatch")
         self.assertLess((t1 - t2).abs().max(), 1e-6)
@@ -0,0 +1,106 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import os
+import tempfile
+import unittest
+
+import torch
+
+from fairseq import options
+from fairseq.lexical_shortlist import LexicalShortlist
+from fairseq.tasks.translation import TranslationTask
+
+import tests.utils as test_utils
+
+
+class TestLexicalShortlist(unittest.TestCase):
+
+    def setUp(self):
+        self.d = test_utils.dummy_dictionary(vocab_size=40)
+        parser = options.get_training_parser()
+        self.args = options.parse_args_and_arch(parser, [
+            'dummy_data_dir',
+            '--arch', 'transformer',
+            '--encoder-layers', '1',
+            '--decoder-layers', '1',
+            '--encoder-embed-dim', '8',
+            '--decoder-embed-dim', '8',
+            '--encoder-ffn-embed-dim', '16',
+            '--decoder-ffn-embed-dim', '16',
+            '--encoder-attention-heads', '2',
+            '--decoder-attention-heads', '2',
+        ])
+        self.task = TranslationTask(self.args, self.d, self.d)
+        torch.manual_seed(0)
+        self.model = self.task.build_model(self.args)
+        self.model.eval()
+        self.sample = {
+            'net_input': {
+                'src_tokens': torch.LongTensor([[4, 5, 6, 7, 2], [8, 9, 10, 11, 2]]),
+                'src_lengths': torch.LongTensor([5, 5]),
+            },
+        }
+
+    def token_index(self, i):
+        return self.d.index('token_{}'.format(i))
+
+    def write_table(self, table_dir, entries):
+        path = os.path.join(table_dir, 'lex.s2t')
+        with open(path, 'w', encoding='utf-8') as f:
+            for src, tgt, prob in entries:
+                print('token_{} token_{} {}'.format(src, tgt, prob), file=f)
+        return path
+
+    def generate(self, shortlist, **kwargs):
+        generator = self.task.build_generator(argparse.Namespace(beam=3, max_len_b=10, **kwargs))
+        generator.shortlist = shortlist
+        return generator.generate([self.model], self.sample)
+
+    def test_candidates(self):
+        with tempfile.TemporaryDirectory('test_lexical_shortlist') as table_dir:
+            path = self.write_table(table_dir, [
+                (0, 20, 0.5), (0, 30, 0.3), (0, 25, 0.2), (1, 33, 1.0), ('unknown', 21, 1.0),
+            ])
+            shortlist = LexicalShortlist.load(path, self.d, self.d, topk=2, num_frequent=3)
+        tok = self.token_index
+        candidates = shortlist.candidates(torch.LongTensor([[tok(0), 2], [tok(1), 1]]))
+        self.assertEqual(candidates.tolist(), sorted(list(range(7)) + [tok(20), tok(30), tok(33)]))
+        candidates = shortlist.candidates(torch.LongTensor([[tok(1), 2]]), prefix_tokens=torch.LongTensor([[12]]))
+        self.assertEqual(candidates.tolist(), sorted(list(range(7)) + [12, tok(33)]))
+
+    def test_generate_full_shortlist(self):
+        # a shortlist of the whole vocabulary gives the same translations
+        with tempfile.TemporaryDirectory('test_lexical_shortlist') as table_dir:
+            path = self.write_table(table_dir, [])
+            shortlist = LexicalShortlist.load(path, self.d, self.d, num_frequent=len(self.d))
+        for kwargs in [{}, {'no_repeat_ngram_size': 2}]:
+            expected = self.generate(None, **kwargs)
+            hypos = self.generate(shortlist, **kwargs)
+            for sent_hypos, sent_expected in zip(hypos, expected):
+                for hypo, hypo_expected in zip(sent_hypos, sent_expected):
+                    self.assertTrue(torch.equal(hypo['tokens'], hypo_expected['tokens']))
+                    self.assertAlmostEqual(hypo['score'], hypo_expected['score'], places=5)
+
+    def test_generate_shortlist(self):
+        with tempfile.TemporaryDirectory('test_lexical_shortlist') as table_dir:
+            path = self.write_table(table_dir, [(i, i + 10, 1.0) for i in range(8)])
+            shortlist = LexicalShortlist.load(path, self.d, self.d, num_frequent=2)
+        allowed = set(shortlist.candidates(self.sample['net_input']['src_tokens']).tolist())
+        src_words = set(self.sample['net_input']['src_tokens'].view(-1).tolist())
+        self.assertEqual(allowed, set(range(6)) | {
+            self.token_index(i + 10) for i in range(8) if self.token_index(i) in src_words
+        })
+        for sent_hypos in self.generate(shortlist):
+            for hypo in sent_hypos:
+                self.assertTrue(set(hypo['tokens'].tolist()) <= allowed)
+                self.assertFalse(hypo['tokens'][:-1].eq(self.d.eos()).any())
+        # the decoder projects onto the whole vocabulary again afterwards
+        self.assertIsNone(self.model.decoder.shortlist_weight)
+
+
+if __name__ == '__main__':
+    unittest.main()
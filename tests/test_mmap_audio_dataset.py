@@ -0,0 +1,73 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+
+from fairseq.data import MMapAudioDataset, MMapAudioDatasetBuilder
+
+
+class TestMMapAudioDataset(unittest.TestCase):
+
+    def _pack(self, data_dir, wavs, int16=False):
+        prefix = os.path.join(data_dir, 'train')
+        builder = MMapAudioDatasetBuilder(prefix, 16000, int16=int16)
+        for wav in wavs:
+            builder.add_item(wav)
+        builder.finalize()
+        return prefix
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.wavs = [rng.uniform(-1, 1, size=n).astype(np.float32) for n in [50, 20, 35, 20]]
+
+    def test_items(self):
+        with tempfile.TemporaryDirectory('test_mmap_audio_dataset') as data_dir:
+            prefix = self._pack(data_dir, self.wavs)
+            self.assertTrue(MMapAudioDataset.exists(prefix))
+            dataset = MMapAudioDataset(prefix, sample_rate=16000, shuffle=False)
+            self.assertEqual(len(dataset), 4)
+            self.assertEqual(dataset.sizes.tolist(), [50, 20, 35, 20])
+            for i, wav in enumerate(self.wavs):
+                self.assertTrue(np.array_equal(dataset[i]['source'].numpy(), wav))
+
+            # the memory map is not pickled, but reopened
+            dataset = pickle.loads(pickle.dumps(dataset))
+            self.assertTrue(np.array_equal(dataset[2]['source'].numpy(), self.wavs[2]))
+
+    def test_collater_crops(self):
+        with tempfile.TemporaryDirectory('test_mmap_audio_dataset') as data_dir:
+            prefix = self._pack(data_dir, self.wavs)
+            dataset = MMapAudioDataset(prefix, sample_rate=16000, max_sample_size=30, shuffle=False)
+            batch = dataset.collater([dataset[i] for i in [0, 1, 2]])
+            source = batch['net_input']['source']
+            self.assertEqual(tuple(source.size()), (3, 20))
+            self.assertTrue(np.array_equal(source[1].numpy(), self.wavs[1]))
+            # crops are contiguous windows of the original waveforms
+            for i, j in [(0, 0), (2, 2)]:
+                wav = self.wavs[j]
+                windows = [wav[k:k + 20] for k in range(len(wav) - 19)]
+                self.assertTrue(any(np.array_equal(source[i].numpy(), w) for w in windows))
+
+    def test_int16(self):
+        with tempfile.TemporaryDirectory('test_mmap_audio_dataset') as data_dir:
+            prefix = self._pack(data_dir, self.wavs, int16=True)
+            self.assertEqual(
+                os.path.getsize(prefix + '.audio.bin'), 2 * sum(len(wav) for wav in self.wavs),
+            )
+            dataset = MMapAudioDataset(prefix, sample_rate=16000, shuffle=False)
+            batch = dataset.collater([dataset[1], dataset[3]])
+            source = batch['net_input']['source']
+            self.assertEqual(source.dtype.is_floating_point, True)
+            self.assertLess(np.abs(source[0].numpy() - self.wavs[1]).max(), 1. / 32768)
+            self.assertLess(np.abs(source[1].numpy() - self.wavs[3]).max(), 1. / 32768)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import contextlib
+from io import StringIO
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from fairseq import options
+
+import preprocess
+from tests.test_binaries import create_dummy_data, train_translation_model
+
+# the reranking scripts import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'examples', 'noisychannel'))
+import rerank_utils  # noqa: E402
+from rerank_in_memory import NbestList, generate_nbest, rerank, score_bitext  # noqa: E402
+from rerank_tune import NbestFeatures  # noqa: E402
+from examples.noisychannel import rerank_options  # noqa: E402
+
+
+def dummy_nbest_list():
+    rng = np.random.RandomState(0)
+    ids = list(range(4))
+    sources = ['a b c', 'd e', 'f g h i', 'j']
+    targets = ['a b', 'c d e', 'f', 'g h']
+    hypos = [
+        ['a b', 'a c d', 'b'],
+        ['c d@@ e', 'c'],
+        ['f', 'f g', 'g h i'],
+        ['g h'],
+    ]
+    num_hypos = sum(len(hypos_i) for hypos_i in hypos)
+    nbest = NbestList(ids, sources, targets, hypos, list(rng.randn(num_hypos)), nbest=3)
+    nbest.bitext1 = nbest.to_array(list(rng.randn(num_hypos)))
+    nbest.bitext2 = nbest.to_array(list(rng.randn(num_hypos)))
+    nbest.lm = nbest.to_array(list(rng.randn(num_hypos)))
+    return nbest
+
+
+class TestNbestList(unittest.TestCase):
+
+    def test_to_array(self):
+        nbest = dummy_nbest_list()
+        flat = list(range(9))
+        res = nbest.to_array(flat, fill=-1)
+        self.assertEqual(res.shape, (4, 3))
+        self.assertEqual(res[nbest.mask].tolist(), flat)
+        self.assertTrue((res[~nbest.mask] == -1).all())
+        self.assertEqual([hypo for _source, hypo in nbest.pairs()], [h for hypos_i in nbest.hypos for h in hypos_i])
+
+    def test_combined_scores(self):
+        nbest = dummy_nbest_list()
+        no_bpe_hypos = nbest.no_bpe_hypos('@@ ')
+        target_len = nbest.to_array([len(h.split()) for hypos_i in no_bpe_hypos for h in hypos_i], fill=1)
+        for normalize in [False, True]:
+            for backwards1, backwards2 in [(False, False), (True, False), (False, True)]:
+                scores = nbest.combined_scores(
+                    0.5, 0.3, 0.2, 1.2, target_len, normalize=normalize,
+                    bitext1_backwards=backwards1, bitext2_backwards=backwards2,
+                )
+                for i, hypos_i in enumerate(nbest.hypos):
+                    for j in range(nbest.nbest):
+                        if j >= len(hypos_i):
+                            self.assertEqual(scores[i, j], -np.inf)
+                            continue
+                        expected = rerank_utils.get_score(
+                            0.5, 0.3, 0.2, target_len[i, j], nbest.bitext1[i, j], nbest.bitext2[i, j],
+                            nbest.lm[i, j], lenpen=1.2, src_len=nbest.src_len[i, 0], tgt_len=nbest.tgt_len[i, j],
+                            bitext1_backwards=backwards1, bitext2_backwards=backwards2, normalize=normalize,
+                        )
+                        self.assertAlmostEqual(scores[i, j], expected)
+
+    def test_features_pick_best_combined_scores(self):
+        nbest = dummy_nbest_list()
+        no_bpe_hypos = nbest.no_bpe_hypos('@@ ')
+        features = NbestFeatures.from_nbest_list(nbest, no_bpe_hypos, normalize=True)
+        params = np.array([[1.2, 0.5, 0.3, 0.2], [0., 1., 0., 0.], [0.5, 0., 0., 1.]])
+        best = features.best(params)
+        for k, (lenpen, a, b, c) in enumerate(params):
+            expected = nbest.combined_scores(a, b, c, lenpen, features.target_len, normalize=True).argmax(axis=1)
+            self.assertEqual(best[k].tolist(), expected.tolist())
+        self.assertEqual(features.corpus_stats(params).shape[0], len(params))
+
+
+class TestInMemoryScoring(unittest.TestCase):
+
+    def test_generate_and_score(self):
+        with contextlib.redirect_stdout(StringIO()):
+            with tempfile.TemporaryDirectory('test_noisychannel') as data_dir:
+                random.seed(0)
+                create_dummy_data(data_dir, num_examples=100, maxlen=8)
+                # both sides share the dictionary, so that the model can also score backwards
+                dict_path = os.path.join(data_dir, 'letters.txt')
+                with open(dict_path, 'w') as f:
+                    for c in range(97, 97 + 26):
+                        print('{} 1'.format(chr(c)), file=f)
+                preprocess.main(options.get_preprocessing_parser().parse_args([
+                    '--source-lang', 'in',
+                    '--target-lang', 'out',
+                    '--have-ctc',
+                    '--srcdict', dict_path,
+                    '--tgtdict', dict_path,
+                    '--trainpref', os.path.join(data_dir, 'train'),
+                    '--validpref', os.path.join(data_dir, 'valid'),
+                    '--testpref', os.path.join(data_dir, 'test'),
+                    '--thresholdtgt', '0',
+                    '--thresholdsrc', '0',
+                    '--destdir', data_dir,
+                ]))
+                # without a segmentation language the files are named {split}.in-None-out.{lang},
+                # while the translation task loads {split}.in-out.{lang}
+                for name in os.listdir(data_dir):
+                    if '.in-None-out.' in name:
+                        os.rename(
+                            os.path.join(data_dir, name),
+                            os.path.join(data_dir, name.replace('.in-None-out.', '.in-out.')),
+                        )
+                train_translation_model(data_dir, 'transformer_iwslt_de_en', [
+                    '--encoder-layers', '2',
+                    '--decoder-layers', '2',
+                    '--encoder-embed-dim', '8',
+                    '--decoder-embed-dim', '8',
+                ])
+                path = os.path.join(data_dir, 'checkpoint_last.pt')
+                args = options.parse_args_and_arch(rerank_options.get_reranking_parser(), [
+                    data_dir,
+                    '--gen-model', path,
+                    '--score-model1', path,
+                    '--num-rescore', '3',
+                    '--batch-size', '16',
+                    '--gen-subset', 'valid',
+                    '--source-lang', 'in',
+                    '--target-lang', 'out',
+                    '--cpu',
+                ])
+                args.score_dict_dir = data_dir
+
+                nbest = generate_nbest(args, use_cuda=False)
+                self.assertEqual(len(nbest), 100)
+                self.assertTrue((nbest.mask.sum(axis=1) >= 1).all())
+
+                # rescoring with the model that generated the hypotheses gives their generation scores
+                scores = score_bitext(args, nbest, path, False, False, None, use_cuda=False)
+                self.assertTrue(np.allclose(scores[nbest.mask], nbest.gen_scores[nbest.mask], atol=1e-4))
+                self.assertTrue((scores[~nbest.mask] == 0).all())
+
+                scores = score_bitext(args, nbest, path, True, False, None, use_cuda=False)
+                self.assertTrue(np.isfinite(scores).all())
+                self.assertTrue((scores[nbest.mask] < 0).all())
+
+                args.lenpen, args.weight1, args.weight2, args.weight3 = [0.5, 2.], [1., 1.], [0., 0.], [0., 0.]
+                best_lenpen, best_weight1, _, _, best_score = rerank(args)
+                self.assertIn(best_lenpen, [0.5, 2.])
+                self.assertEqual(best_weight1, 1.)
+                self.assertTrue(0. <= best_score <= 100.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import contextlib
+from io import StringIO
+import os
+import tempfile
+import unittest
+
+from fairseq import options
+from fairseq.data import encoders
+from fairseq.registry import REGISTRIES
+
+import preprocess
+
+try:
+    import sacremoses  # noqa
+    from subword_nmt import learn_bpe
+    has_moses_and_bpe = True
+except ImportError:
+    has_moses_and_bpe = False
+
+
+RAW_LINES = [
+    "Hello, world! It's a \"small\" test-corpus.",
+    'The quick brown fox jumps over the lazy dog (again).',
+    "Don't split these words: co-operation & state-of-the-art.",
+    'Numbers like 3.14 and 1,000 stay together; see e.g. Fig. 2.',
+    'Lower-case, UPPER-CASE and Mixed-Case tokens.',
+]
+
+
+@unittest.skipIf(not has_moses_and_bpe, 'requires sacremoses and subword_nmt')
+class TestPreprocessEncoding(unittest.TestCase):
+
+    def write_corpus(self, data_dir):
+        for split, num_lines in [('train', 40), ('valid', 7)]:
+            for lang in ['en', 'de']:
+                with open(os.path.join(data_dir, 'raw', '{}.{}'.format(split, lang)), 'w', encoding='utf-8') as f:
+                    for i in range(num_lines):
+                        line = RAW_LINES[(i + len(lang)) % len(RAW_LINES)]
+                        print('{} {}'.format(line, i) if i % 3 else line, file=f)
+
+        # learn BPE codes on the tokenized training data
+        tokenizer = encoders.build_tokenizer(argparse.Namespace(tokenizer='moses', source_lang='en'))
+        with open(os.path.join(data_dir, 'raw', 'train.en'), encoding='utf-8') as f:
+            tokenized = StringIO(''.join(tokenizer.encode(line.strip()) + '\n' for line in f))
+        with open(os.path.join(data_dir, 'codes'), 'w', encoding='utf-8') as f:
+            learn_bpe.learn_bpe(tokenized, f, 20)
+
+    def pre_encode(self, data_dir):
+        for split in ['train', 'valid']:
+            for lang in ['en', 'de']:
+                args = argparse.Namespace(
+                    tokenizer='moses', source_lang=lang, bpe='subword_nmt',
+                    bpe_codes=os.path.join(data_dir, 'codes'), bpe_separator='@@',
+                )
+                tokenizer = encoders.build_tokenizer(args)
+                bpe = encoders.build_bpe(args)
+                src = os.path.join(data_dir, 'raw', '{}.{}'.format(split, lang))
+                dest = os.path.join(data_dir, 'encoded', '{}.{}'.format(split, lang))
+                with open(src, encoding='utf-8') as f_in, open(dest, 'w', encoding='utf-8') as f_out:
+                    for line in f_in:
+                        print(bpe.encode(tokenizer.encode(line.strip())), file=f_out)
+
+    def preprocess(self, data_dir, text_dir, dest_dir, extra_flags):
+        parser = options.get_preprocessing_parser()
+        for registry_name, choice in [('tokenizer', 'moses'), ('bpe', 'subword_nmt')]:
+            REGISTRIES[registry_name]['registry'][choice].add_args(parser)
+        args = parser.parse_args([
+            '--source-lang', 'en',
+            '--target-lang', 'de',
+            '--have-ctc',
+            '--trainpref', os.path.join(data_dir, text_dir, 'train'),
+            '--validpref', os.path.join(data_dir, text_dir, 'valid'),
+            '--thresholdtgt', '0',
+            '--thresholdsrc', '0',
+            '--destdir', os.path.join(data_dir, dest_dir),
+        ] + extra_flags)
+        with contextlib.redirect_stdout(StringIO()):
+            preprocess.main(args)
+
+    def assertSameFiles(self, dir1, dir2):
+        self.assertEqual(sorted(os.listdir(dir1)), sorted(os.listdir(dir2)))
+        for name in os.listdir(dir1):
+            with open(os.path.join(dir1, name), 'rb') as f1, open(os.path.join(dir2, name), 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read(), name)
+
+    def check_tokenize_and_bpe_on_the_fly(self, extra_flags):
+        with tempfile.TemporaryDirectory('test_preprocess') as data_dir:
+            for subdir in ['raw', 'encoded']:
+                os.makedirs(os.path.join(data_dir, subdir))
+            self.write_corpus(data_dir)
+            self.pre_encode(data_dir)
+            self.preprocess(data_dir, 'encoded', 'expected', ['--workers', '1'] + extra_flags)
+
+            for workers in ['1', '2']:
+                dest_dir = 'workers{}'.format(workers)
+                self.preprocess(data_dir, 'raw', dest_dir, [
+                    '--workers', workers,
+                    '--tokenizer', 'moses',
+                    '--bpe', 'subword_nmt',
+                    '--bpe-codes', os.path.join(data_dir, 'codes'),
+                ] + extra_flags)
+                self.assertSameFiles(os.path.join(data_dir, 'expected'), os.path.join(data_dir, dest_dir))
+
+    def test_tokenize_and_bpe_on_the_fly(self):
+        self.check_tokenize_and_bpe_on_the_fly([])
+
+    def test_tokenize_and_bpe_on_the_fly_joined_dictionary(self):
+        # moses splits apostrophes differently for English and German, so
+        # each side must be counted with the rules of its own language
+        self.check_tokenize_and_bpe_on_the_fly(['--joined-dictionary'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import os
+import tempfile
+import unittest
+
+import torch
+import torch.nn as nn
+
+from fairseq import checkpoint_utils, options, utils
+from fairseq.tasks.translation import TranslationTask
+
+import tests.utils as test_utils
+
+
+class TestQuantization(unittest.TestCase):
+
+    def setUp(self):
+        self.d = test_utils.dummy_dictionary(vocab_size=40)
+        self.src_tokens = torch.LongTensor([[4, 5, 6, 7, 8, 2], [9, 10, 11, 12, 13, 2]])
+        self.src_lengths = torch.LongTensor([6, 6])
+        self.prev_output_tokens = torch.LongTensor([[2, 14, 15, 16], [2, 17, 18, 19]])
+
+    def build_model(self, arch, extra_args):
+        args = options.parse_args_and_arch(options.get_training_parser(), [
+            'dummy_data_dir', '--arch', arch,
+        ] + extra_args)
+        task = TranslationTask(args, self.d, self.d)
+        torch.manual_seed(0)
+        model = task.build_model(args)
+        model.eval()
+        return model, args, task
+
+    def forward(self, model):
+        with torch.no_grad():
+            return model(self.src_tokens, self.src_lengths, self.prev_output_tokens)[0]
+
+    def test_quantize(self):
+        for arch, extra_args in [
+            ('transformer', ['--encoder-layers', '2', '--decoder-layers', '2']),
+            ('transformer', ['--share-decoder-input-output-embed']),
+            ('lightconv', ['--encoder-layers', '2', '--decoder-layers', '2',
+                           '--encoder-kernel-size-list', '[3, 7]', '--decoder-kernel-size-list', '[3, 7]']),
+            ('lstm', ['--encoder-bidirectional']),
+            ('lstm', ['--share-decoder-input-output-embed']),
+        ]:
+            model, _, task = self.build_model(arch, extra_args)
+            expected = self.forward(model)
+            model.quantize_()
+            for module in model.modules():
+                self.assertNotIn(type(module), [nn.Linear, nn.LSTM, nn.LSTMCell])
+            output = self.forward(model)
+            self.assertLess((output - expected).abs().max(), 0.1 * expected.abs().max())
+
+            generator = task.build_generator(argparse.Namespace(beam=2, max_len_b=5))
+            sample = {'net_input': {'src_tokens': self.src_tokens, 'src_lengths': self.src_lengths}}
+            hypos = generator.generate([model], sample)
+            self.assertEqual(len(hypos), 2)
+
+    def test_output_weight(self):
+        for extra_args in [[], ['--share-decoder-input-output-embed']]:
+            model, _, _ = self.build_model('transformer', extra_args)
+            decoder = model.decoder
+            model.quantize_()
+            weight = decoder.output_weight()
+            self.assertTrue(torch.equal(weight, decoder.output_projection.weight().dequantize()))
+            with torch.no_grad():
+                features, _ = model.extract_features(self.src_tokens, self.src_lengths, self.prev_output_tokens)
+                target = self.prev_output_tokens[:, 1:]
+                features = features[:, :-1]
+                # scoring the targets uses the int8 weights of the output layer
+                expected = utils.log_softmax(features.matmul(weight.t()), dim=-1).gather(-1, target.unsqueeze(-1))
+                self.assertTrue(torch.allclose(
+                    decoder.get_target_log_probs(features, target), expected.squeeze(-1), atol=1e-5,
+                ))
+                decoder.set_output_shortlist(torch.LongTensor([4, 7, 9]))
+                self.assertTrue(torch.equal(decoder.shortlist_weight, weight[[4, 7, 9]]))
+
+    def test_save_load(self):
+        model, args, task = self.build_model('transformer', ['--encoder-layers', '2', '--decoder-layers', '2'])
+        model.quantize_()
+        expected = self.forward(model)
+        with tempfile.TemporaryDirectory('test_quantization') as data_dir:
+            path = os.path.join(data_dir, 'quantized.pt')
+            checkpoint_utils.save_quantized_checkpoint(path, args, model)
+            models, _ = checkpoint_utils.load_model_ensemble([path], task=task)
+        self.assertTrue(models[0]._is_quantized)
+        self.assertTrue(torch.equal(self.forward(models[0].eval()), expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
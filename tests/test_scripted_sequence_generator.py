@@ -0,0 +1,127 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import io
+import unittest
+
+import torch
+import torch.nn as nn
+
+from fairseq import options
+from fairseq.scripted_sequence_generator import ScriptedSequenceGenerator, script_transformer
+from fairseq.tasks.translation import TranslationTask
+
+import tests.utils as test_utils
+
+
+class PaddedBeams(nn.Module):
+    """Returns the outputs of a beam search in which the second sentence
+    has a single finalized hypothesis."""
+
+    def forward(self, src_tokens, beam_size: int, max_len_a: float, max_len_b: int, min_len: int,
+                normalize_scores: bool, len_penalty: float, unk_penalty: float):
+        tokens = torch.full((2, beam_size, 4), 1, dtype=torch.long)
+        tokens[:, :, :2] = torch.tensor([5, 2])
+        scores = torch.full((2, beam_size), -1.)
+        scores[1, 1:] = float('-inf')
+        pos_scores = torch.zeros(2, beam_size, 4)
+        lengths = torch.full((2, beam_size), 2, dtype=torch.long)
+        lengths[1, 1:] = 0
+        return tokens, scores, pos_scores, lengths
+
+
+class TestScriptedSequenceGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.d = test_utils.dummy_dictionary(vocab_size=40)
+        torch.manual_seed(1)
+        self.src_tokens = torch.randint(4, 40, (5, 7))
+        self.src_tokens[1, :3] = self.d.pad()
+        self.src_tokens[:, -1] = self.d.eos()
+        self.sample = {'net_input': {
+            'src_tokens': self.src_tokens,
+            'src_lengths': self.src_tokens.ne(self.d.pad()).sum(dim=1),
+        }}
+
+    def build_model(self, arch, extra_args=()):
+        args = options.parse_args_and_arch(options.get_training_parser(), [
+            'dummy_data_dir',
+            '--arch', arch,
+            '--encoder-layers', '2',
+            '--decoder-layers', '2',
+            '--encoder-embed-dim', '16',
+            '--decoder-embed-dim', '16',
+            '--encoder-ffn-embed-dim', '32',
+            '--decoder-ffn-embed-dim', '32',
+            '--encoder-attention-heads', '2',
+            '--decoder-attention-heads', '2',
+        ] + list(extra_args))
+        task = TranslationTask(args, self.d, self.d)
+        torch.manual_seed(0)
+        return task.build_model(args).eval(), task
+
+    def assertHyposEqual(self, hypos, expected):
+        self.assertEqual(len(hypos), len(expected))
+        for sent_hypos, sent_expected in zip(hypos, expected):
+            self.assertEqual(len(sent_hypos), len(sent_expected))
+            for hypo, expected_hypo in zip(sent_hypos, sent_expected):
+                self.assertTrue(torch.equal(hypo['tokens'], expected_hypo['tokens']))
+                self.assertAlmostEqual(hypo['score'], expected_hypo['score'], places=4)
+                self.assertTrue(torch.allclose(
+                    hypo['positional_scores'], expected_hypo['positional_scores'], atol=1e-4,
+                ))
+
+    def test_generate(self):
+        for extra_args in [
+            [],
+            ['--encoder-normalize-before', '--decoder-normalize-before', '--share-all-embeddings',
+             '--encoder-learned-pos', '--decoder-learned-pos', '--activation-fn', 'gelu'],
+        ]:
+            model, task = self.build_model('transformer', extra_args)
+            for gen_args in [
+                {'beam': 1, 'max_len_b': 12},
+                {'beam': 3, 'max_len_b': 12, 'min_len': 4, 'lenpen': 0.5, 'unkpen': 1.},
+                {'beam': 3, 'max_len_a': 1.5, 'max_len_b': 2, 'unnormalized': True},
+            ]:
+                gen_args = argparse.Namespace(**gen_args)
+                expected = task.build_generator(gen_args).generate([model], self.sample)
+                gen_args.torchscript = True
+                generator = task.build_generator(gen_args)
+                self.assertIsInstance(generator, ScriptedSequenceGenerator)
+                self.assertHyposEqual(generator.generate([model], self.sample), expected)
+
+    def test_padded_hypotheses_are_dropped(self):
+        generator = ScriptedSequenceGenerator(self.d, beam_size=3)
+        hypos = generator.generate([torch.jit.script(PaddedBeams())], self.sample)
+        self.assertEqual([len(sent_hypos) for sent_hypos in hypos], [3, 1])
+        for sent_hypos in hypos:
+            for hypo in sent_hypos:
+                self.assertEqual(hypo['tokens'].tolist(), [5, 2])
+                self.assertEqual(hypo['score'], -1.)
+
+    def test_tracing_transformer(self):
+        tracing_model, task = self.build_model('tracing_transformer')
+        model, _ = self.build_model('transformer')
+        model.load_state_dict(tracing_model.state_dict())
+        # SequenceGenerator does not support the tuple encoder outputs of
+        # TracingTransformerModel, so compare with the same TransformerModel
+        expected = task.build_generator(argparse.Namespace(beam=3, max_len_b=12)).generate([model], self.sample)
+        generator = ScriptedSequenceGenerator(self.d, beam_size=3, max_len_b=12)
+        self.assertHyposEqual(generator.generate([tracing_model], self.sample), expected)
+
+    def test_save_load(self):
+        model, task = self.build_model('transformer')
+        generator = ScriptedSequenceGenerator(self.d, beam_size=3, max_len_b=12)
+        expected = generator.generate([model], self.sample)
+        f = io.BytesIO()
+        torch.jit.save(script_transformer(model, self.d), f)
+        f.seek(0)
+        scripted_model = torch.jit.load(f)
+        self.assertHyposEqual(generator.generate([scripted_model], self.sample), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,10 @@ import argparse
 import unittest
 
 import torch
+import torch.nn.functional as F
 
+from fairseq import utils
+from fairseq.modules import AdaptiveSoftmax
 from fairseq.sequence_scorer import SequenceScorer
 
 import tests.utils as test_utils
@@ -90,6 +93,23 @@ class TestSequenceScorer(unittest.TestCase):
                 self.assertHypoTokens(hypos_id[0], data[id]['target'])
                 self.assertHypoScore(hypos_id[0], expected_scores[id])
 
+    def test_chunked_target_log_probs(self):
+        features = torch.randn(2, 5, 8)
+        weight = torch.randn(30, 8)
+        target = torch.randint(0, 30, (2, 5))
+        expected = F.log_softmax(F.linear(features, weight), dim=-1).gather(2, target.unsqueeze(-1)).squeeze(-1)
+        for chunk_size in [1, 7, 30, 64]:
+            self.assertAlmostEqual(utils.chunked_target_log_probs(features, weight, target, chunk_size), expected)
+
+    def test_adaptive_softmax_target_log_prob(self):
+        adaptive_softmax = AdaptiveSoftmax(30, 8, [5, 10], dropout=0.)
+        adaptive_softmax.eval()
+        features = torch.randn(2, 5, 8)
+        target = torch.LongTensor([[0, 4, 5, 9, 10], [29, 3, 12, 6, 1]])
+        with torch.no_grad():
+            expected = adaptive_softmax.get_log_prob(features, None).gather(2, target.unsqueeze(-1)).squeeze(-1)
+            self.assertAlmostEqual(adaptive_softmax.get_target_log_prob(features, target), expected)
+
     def assertHypoTokens(self, hypo, tokens):
         self.assertTensorEqual(hypo['tokens'], torch.LongTensor(tokens))
 
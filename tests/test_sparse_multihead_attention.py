@@ -43,6 +43,47 @@ class TestSparseMultiheadAttention(unittest.TestCase):
 
         torch.all(torch.eq(attention_sparse_mask, sparse_mask))
 
+    def _reference_sparse_mask(self, attention, tgt_len):
+        # the mask built from the sets of attended words of each word
+        sparse_mask = torch.full((tgt_len, tgt_len), float('-inf'))
+        summaries = set()
+        if attention.is_bidirectional:
+            summaries = attention.compute_subset_summaries(tgt_len)
+        for i in range(tgt_len):
+            subset = attention.compute_fixed_attention_subset(i, tgt_len) | summaries
+            sparse_mask[i].index_fill_(0, torch.LongTensor(list(subset)), 0)
+        return sparse_mask
+
+    def test_buffered_sparse_mask(self):
+        for stride, expressivity in [(1, 0), (4, 1), (5, 2), (8, 3)]:
+            for is_bidirectional in [True, False]:
+                attention = SparseMultiheadAttention(
+                    16, 1, stride=stride, expressivity=expressivity, is_bidirectional=is_bidirectional,
+                )
+                for tgt_len in [3, 8, 21]:
+                    self.assertTrue(torch.equal(
+                        attention.buffered_sparse_mask(torch.zeros(1), tgt_len, tgt_len),
+                        self._reference_sparse_mask(attention, tgt_len),
+                    ))
+
+    def test_block_sparse_attention(self):
+        torch.manual_seed(0)
+        for is_bidirectional in [True, False]:
+            attention = SparseMultiheadAttention(
+                16, 2, stride=4, expressivity=1, is_bidirectional=is_bidirectional, self_attention=True,
+            )
+            attention.eval()
+            x = torch.randn(19, 3, 16)
+            key_padding_mask = torch.zeros(3, 19, dtype=torch.bool)
+            key_padding_mask[1, 15:] = True
+            for mask in [None, key_padding_mask]:
+                # the dense path is used when the attention weights are needed
+                expected, _ = attention(x, x, x, key_padding_mask=mask, need_weights=True)
+                attn, attn_weights = attention(x, x, x, key_padding_mask=mask, need_weights=False)
+                self.assertIsNone(attn_weights)
+                self.assertLess((attn - expected).abs().max(), 1e-5)
+
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -3,6 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import argparse
 import contextlib
 from io import StringIO
 import unittest
@@ -12,6 +13,9 @@ import torch
 
 from fairseq import data, checkpoint_utils
 
+import tests.utils as test_utils
+import train
+
 
 def mock_trainer(epoch, num_updates, iterations_in_epoch):
     trainer = MagicMock()
@@ -125,5 +129,40 @@ class TestLoadCheckpoint(unittest.TestCase):
         patch.stopall()
 
 
+class TestBleuBatchIterator(unittest.TestCase):
+
+    def setUp(self):
+        d = test_utils.dummy_dictionary(vocab_size=10)
+        # sentence i has i + 1 tokens
+        src = [torch.LongTensor([d.nspecial] * i + [d.eos()]) for i in range(100)]
+        self.dataset = data.LanguagePairDataset(src, [len(s) for s in src], d, src, [len(s) for s in src], d)
+        self.task = MagicMock()
+        self.task.dataset.return_value = self.dataset
+        self.task.max_positions.return_value = (1024, 1024)
+        self.trainer = MagicMock()
+        self.trainer.get_model.return_value.max_positions.return_value = (1024, 1024)
+        self.args = argparse.Namespace(
+            seed=1, skip_invalid_size_inputs_valid_test=False, eval_bleu_max_sentences=20,
+            max_tokens_valid=None, max_sentences_valid=4, required_batch_size_multiple=1,
+            distributed_world_size=1, distributed_rank=0, num_workers=0,
+        )
+
+    def get_batches(self, epoch_itr):
+        return [sample['id'].tolist() for sample in epoch_itr.next_epoch_itr(shuffle=False)]
+
+    def test_fixed_random_sample(self):
+        epoch_itr = train.get_bleu_batch_iterator(self.args, self.trainer, self.task, 'valid')
+        batches = self.get_batches(epoch_itr)
+        ids = [i for batch in batches for i in batch]
+        self.assertEqual(len(set(ids)), 20)
+        # the sample is not limited to the shortest sentences
+        self.assertGreater(max(ids), 50)
+        # nor are the shortest sentences decoded first
+        self.assertNotEqual([min(batch) for batch in batches], sorted(min(batch) for batch in batches))
+        # every validation decodes the same batches in the same order
+        self.assertEqual(self.get_batches(epoch_itr), batches)
+        self.assertEqual(self.get_batches(train.get_bleu_batch_iterator(self.args, self.trainer, self.task, 'valid')), batches)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -74,6 +74,16 @@ class TestUtils(unittest.TestCase):
             utils.make_positions(right_pad_input, pad),
         )
 
+    def test_no_param_init(self):
+        normal_ = torch.nn.init.normal_
+        weight = torch.zeros(3, 4)
+        with utils.no_param_init():
+            self.assertIs(torch.nn.init.normal_(weight), weight)
+            torch.nn.init.xavier_uniform_(weight)
+            torch.nn.init.constant_(weight, 1.)
+        self.assertEqual(weight.abs().sum().item(), 0)
+        self.assertIs(torch.nn.init.normal_, normal_)
+
     def assertAlmostEqual(self, t1, t2):
         self.assertEqual(t1.size(), t2.size(), "size mismatch")
         self.assertLess(utils.item((t1 - t2).abs().max()), 1e-4)
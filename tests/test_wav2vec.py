@@ -0,0 +1,96 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import contextlib
+from io import StringIO
+import unittest
+
+import torch
+
+from fairseq import options
+from fairseq.models.wav2vec import Wav2VecModel, Wav2VecPredictionsModel
+
+
+def build_model(extra_args=None):
+    parser = options.get_training_parser('audio_pretraining')
+    args = options.parse_args_and_arch(parser, [
+        'dummy_data_dir',
+        '--arch', 'wav2vec',
+        '--conv-feature-layers', '[(16, 10, 5), (16, 8, 4), (16, 4, 2), (16, 1, 1)]',
+        '--conv-aggregator-layers', '[(16, 2, 1), (32, 3, 1)]',
+    ] + (extra_args or []))
+    with contextlib.redirect_stdout(StringIO()):
+        model = Wav2VecModel.build_model(args, None)
+    model.eval()
+    return model
+
+
+class TestWav2Vec(unittest.TestCase):
+
+    def assertPaddedBatchMatches(self, model):
+        lengths = [1600, 1000, 333, 250]
+        wavs = [torch.randn(length) for length in lengths]
+        source = torch.zeros(len(wavs), max(lengths))
+        for i, wav in enumerate(wavs):
+            source[i, :len(wav)] = wav
+
+        with torch.no_grad():
+            z, c, out_lengths = model.extract_features(source, torch.LongTensor(lengths))
+            for i, wav in enumerate(wavs):
+                z_i = model.feature_extractor(wav.unsqueeze(0))[0]
+                c_i = model.feature_aggregator(z_i.unsqueeze(0))[0]
+                length = out_lengths[i].item()
+                self.assertEqual(z_i.size(1), length)
+                self.assertLess((z[i, :, :length] - z_i).abs().max().item(), 1e-4)
+                self.assertLess((c[i, :, :length] - c_i).abs().max().item(), 1e-4)
+
+    def test_extract_features_padded(self):
+        self.assertPaddedBatchMatches(build_model())
+
+    def test_extract_features_padded_skip_connections(self):
+        self.assertPaddedBatchMatches(build_model([
+            '--skip-connections-feat',
+            '--skip-connections-agg',
+            '--log-compression',
+            '--agg-zero-pad',
+        ]))
+
+    def test_extract_features_padded_gru(self):
+        self.assertPaddedBatchMatches(build_model(['--aggregator', 'gru', '--gru-dim', '8']))
+
+    def test_predictions(self):
+        for cross_sample_negatives, balanced_classes in [(False, False), (True, True)]:
+            model = Wav2VecPredictionsModel(
+                in_dim=8, out_dim=6, prediction_steps=4, n_negatives=3,
+                cross_sample_negatives=cross_sample_negatives, sample_distance=None,
+                dropout=0., offset=1, balanced_classes=balanced_classes,
+            )
+            x, y = torch.randn(2, 8, 10), torch.randn(2, 6, 10)
+            torch.manual_seed(1)
+            neg_idxs = model.sample_negatives(y)
+            torch.manual_seed(1)
+            predictions, labels = model(x, y)
+            if balanced_classes:
+                labels, weights = labels
+                expected_weights = torch.full_like(labels, 1 / 3).masked_fill_(labels == 1, 1.)
+                self.assertTrue(torch.equal(weights, expected_weights))
+
+            # reference: step by step dot products with explicitly gathered targets
+            y_flat = y.transpose(1, 2).reshape(-1, 6)
+            negatives = y_flat[neg_idxs.view(-1)].view(2, 3, 10, 6).permute(1, 0, 3, 2)
+            targets = torch.cat([y.unsqueeze(0), negatives])  # (1 + N) x B x C x T
+            steps = model.project_to_steps(x.unsqueeze(-1))
+            expected, expected_labels = [], []
+            for i in range(4):
+                offset = i + 1
+                logits = (steps[..., :-offset, i] * targets[..., offset:]).sum(dim=2)
+                expected.append(logits.flatten())
+                expected_labels.append(torch.cat([torch.ones(logits[0].numel()), torch.zeros(logits[1:].numel())]))
+            self.assertLess((predictions - torch.cat(expected)).abs().max().item(), 1e-5)
+            self.assertTrue(torch.equal(labels, torch.cat(expected_labels)))
+
+
+if __name__ == '__main__':
+    unittest.main()
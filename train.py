@@ -7,6 +7,7 @@
 Train a new model on one or across multiple GPUs.
 """
 
+import argparse
 import collections
 import math
 import random
@@ -14,8 +15,8 @@ import random
 import numpy as np
 import torch
 
-from fairseq import checkpoint_utils, distributed_utils, options, progress_bar, tasks, utils
-from fairseq.data import iterators
+from fairseq import bleu, checkpoint_utils, distributed_utils, options, progress_bar, tasks, utils
+from fairseq.data import data_utils, dictionary, iterators
 from fairseq.trainer import Trainer
 from fairseq.meters import AverageMeter, StopwatchMeter
 import pdb
@@ -233,6 +234,11 @@ def validate(args, trainer, task, epoch_itr, subsets):
                     continue
                 extra_meters[k].update(v)
 
+        if args.eval_bleu:
+            score, wps = validate_bleu(args, trainer, task, subset)
+            extra_meters['bleu'].update(score)
+            extra_meters['bleu_wps'].update(wps)
+
         # log validation stats
         stats = get_valid_stats(trainer, args, extra_meters)
         for k, meter in extra_meters.items():
@@ -247,6 +253,127 @@ def validate(args, trainer, task, epoch_itr, subsets):
     return valid_losses
 
 
+# EpochBatchIterators over the BLEU samples of the validation subsets
+_bleu_batch_iterators = {}
+
+
+def get_bleu_batch_iterator(args, trainer, task, subset):
+    """Return an iterator over a random sample of at most
+    ``--eval-bleu-max-sentences`` sentences of a validation subset.
+
+    The sample and the order of its batches only depend on ``--seed``, so
+    that every epoch of the iterator decodes the same sentences, and
+    stopping at the time budget does not favour the shortest sentences.
+    """
+    dataset = task.dataset(subset)
+    with data_utils.numpy_seed(args.seed):
+        indices = np.random.permutation(len(dataset))
+    indices = data_utils.filter_by_size(
+        indices, dataset,
+        utils.resolve_max_positions(task.max_positions(), trainer.get_model().max_positions()),
+        raise_exception=(not args.skip_invalid_size_inputs_valid_test),
+    )[:args.eval_bleu_max_sentences]
+
+    # batch sentences of similar lengths together
+    indices = indices[np.argsort([dataset.num_tokens(i) for i in indices], kind='mergesort')]
+    batch_sampler = data_utils.batch_by_size(
+        indices, dataset.num_tokens,
+        max_tokens=args.max_tokens_valid,
+        max_sentences=args.max_sentences_valid,
+        required_batch_size_multiple=args.required_batch_size_multiple,
+    )
+    with data_utils.numpy_seed(args.seed):
+        np.random.shuffle(batch_sampler)
+    return iterators.EpochBatchIterator(
+        dataset=dataset,
+        collate_fn=dataset.collater,
+        batch_sampler=batch_sampler,
+        seed=args.seed,
+        num_shards=args.distributed_world_size,
+        shard_id=args.distributed_rank,
+        num_workers=args.num_workers,
+    )
+
+
+def validate_bleu(args, trainer, task, subset):
+    """Decode a fixed random sample of the sentences of a validation subset
+    (see :func:`get_bleu_batch_iterator`) with the model being trained and
+    return its BLEU and the decoding speed in tokens/s.
+
+    Decoding stops once the total decoding time, which is kept in the
+    ``bleu_wall`` meter of the trainer (and thereby in the checkpoints),
+    exceeds ``--eval-bleu-time-share`` of the training time. Distributed
+    workers decode their shards of the sample until one of them is out of
+    time, and their BLEU statistics are summed.
+    """
+    use_cuda = torch.cuda.is_available() and not args.cpu
+    model = trainer.get_model()
+    model.eval()
+    tgt_dict = task.target_dictionary
+    generator = task.build_generator(argparse.Namespace(
+        beam=args.eval_bleu_beam,
+        max_len_a=args.eval_bleu_max_len_a,
+        max_len_b=args.eval_bleu_max_len_b,
+    ))
+    # with --eval-bleu-remove-bpe, words are scored in a separate dictionary so
+    # that the dictionary of the task is left untouched
+    bleu_dict = dictionary.Dictionary() if args.eval_bleu_remove_bpe is not None else tgt_dict
+    scorer = bleu.Scorer(bleu_dict.pad(), bleu_dict.eos(), bleu_dict.unk())
+
+    bleu_wall = trainer.get_meter('bleu_wall')
+    budget = args.eval_bleu_time_share * trainer.get_meter('train_wall').sum - bleu_wall.sum
+    gen_timer = StopwatchMeter()
+    num_sentences = 0
+    if subset not in _bleu_batch_iterators:
+        _bleu_batch_iterators[subset] = get_bleu_batch_iterator(args, trainer, task, subset)
+    itr = _bleu_batch_iterators[subset].next_epoch_itr(shuffle=False)
+    for i, sample in enumerate(itr):
+        # every worker has the same number of batches (some may be empty),
+        # so that they can agree on stopping after the same one
+        out_of_time = gen_timer.sum >= budget
+        if args.distributed_world_size > 1:
+            out_of_time = any(distributed_utils.all_gather_list(out_of_time))
+        if i > 0 and out_of_time:
+            break
+        sample = utils.move_to_cuda(sample) if use_cuda else sample
+        if 'net_input' not in sample or sample['target'] is None:
+            continue
+
+        gen_timer.start()
+        bleu_wall.start()
+        hypos = task.inference_step(generator, [model], sample)
+        ntokens = sum(len(h[0]['tokens']) for h in hypos)
+        gen_timer.stop(ntokens)
+        bleu_wall.stop(ntokens)
+
+        for i in range(len(hypos)):
+            target_tokens = utils.strip_pad(sample['target'][i], tgt_dict.pad()).int().cpu()
+            hypo_tokens = hypos[i][0]['tokens'].int().cpu()
+            if args.eval_bleu_remove_bpe is not None:
+                target_str = tgt_dict.string(target_tokens, args.eval_bleu_remove_bpe, escape_unk=True)
+                hypo_str = tgt_dict.string(hypo_tokens, args.eval_bleu_remove_bpe)
+                target_tokens = bleu_dict.encode_line(target_str, add_if_not_exist=True)
+                hypo_tokens = bleu_dict.encode_line(hypo_str, add_if_not_exist=True)
+            scorer.add(target_tokens, hypo_tokens)
+        num_sentences += len(hypos)
+
+    # sum the statistics of all workers
+    stat = [getattr(scorer.stat, name) for name, _ in bleu.BleuStat._fields_]
+    num_tokens, decode_time = gen_timer.n, gen_timer.sum
+    if args.distributed_world_size > 1:
+        stats, num_sentences, num_tokens, decode_time = zip(*distributed_utils.all_gather_list(
+            [stat, num_sentences, num_tokens, decode_time],
+        ))
+        stat = [sum(s) for s in zip(*stats)]
+        num_sentences, num_tokens, decode_time = sum(num_sentences), sum(num_tokens), max(decode_time)
+    for (name, _), value in zip(bleu.BleuStat._fields_, stat):
+        setattr(scorer.stat, name, value)
+
+    print('| decoded {} tokens of {} sentences in {:.1f}s'.format(
+        num_tokens, num_sentences, decode_time))
+    return scorer.score(), num_tokens / decode_time if decode_time > 0 else 0.
+
+
 def get_valid_stats(trainer, args, extra_meters=None):
     stats = collections.OrderedDict()
     stats['loss'] = trainer.get_meter('valid_loss')